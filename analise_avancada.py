@@ -6,42 +6,103 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import warnings
+from tabela_fatores import TabelaFatores
 warnings.filterwarnings('ignore')
 
 class AnaliseAvancada:
     """Classe para análise avançada de estoque com previsão de demanda"""
     
-    def __init__(self):
+    # Configuração do modelo de previsão (faz parte da impressão digital do cache)
+    CONFIG_MODELO = {'modelo': 'random_forest', 'n_estimators': 100, 'random_state': 42}
+    # Árvores adicionadas no refit incremental e limite antes de um refit completo
+    ARVORES_INCREMENTO = 20
+    MAX_ARVORES = 200
+    
+    # Fatores de correlação por tipo de produto (padrão quando a tabela de fatores não define)
+    FATORES_CORRECAO = {
+        'medicamentos': {
+            'fator_paciente': 0.8,  # 80% dos pacientes usam medicamentos
+            'fator_sazonal': 1.2,   # 20% de variação sazonal
+            'estoque_minimo': 0.3,  # 30% do estoque como mínimo
+            'prazo_seguranca': 15   # 15 dias de segurança
+        },
+        'insumos': {
+            'fator_paciente': 0.6,
+            'fator_sazonal': 1.1,
+            'estoque_minimo': 0.2,
+            'prazo_seguranca': 10
+        },
+        'equipamentos': {
+            'fator_paciente': 0.4,
+            'fator_sazonal': 1.0,
+            'estoque_minimo': 0.5,
+            'prazo_seguranca': 30
+        }
+    }
+    
+    def __init__(self, cache_modelos=None):
         self.modelo_demanda = None
+        self.cache_modelos = cache_modelos
         self.scaler = StandardScaler()
         self.tipo_produto = None
         self.media_pacientes = None
+        self.fatores_correcao = self.FATORES_CORRECAO
+        self.tabela_fatores = None
         
-    def configurar_tipo_produto(self, tipo_produto, media_pacientes=None):
-        """Configura o tipo de produto e média de pacientes"""
+    def configurar_tipo_produto(self, tipo_produto, media_pacientes=None, tabela_fatores=None):
+        """Configura o tipo de produto, a média de pacientes e a tabela de fatores opcional"""
         self.tipo_produto = tipo_produto
         self.media_pacientes = media_pacientes
+        self.tabela_fatores = tabela_fatores
+    
+    def resolver_fatores(self, codigos, tipo_produto=None):
+        """Fatores de correção de cada SKU, aplicando a tabela de fatores configurada"""
+        tabela = self.tabela_fatores if self.tabela_fatores is not None else TabelaFatores()
+        return tabela.resolver(codigos, tipo_produto or self.tipo_produto or 'medicamentos', self.fatores_correcao)
+    
+    def calcular_metricas(self, media_saida_mensal, estoque_atual, fatores, media_pacientes=None, periodo_previsao=90, prazo_desejado=90):
+        """Versão vetorizada de demanda, prazo, compra e estoque ideal, com fatores por SKU
+        
+        fatores: DataFrame alinhado aos SKUs com as colunas de TabelaFatores.COLUNAS_FATORES
+        (ou dicionário com essas chaves e arrays). Usa as mesmas fórmulas de
+        calcular_demanda_esperada, calcular_prazo_estoque, sugerir_quantidade_compra e
+        calcular_estoque_ideal_futuro, inclusive para NaN. Entradas em formato de matriz
+        são combinadas por broadcast (ver simular_cenarios); NaN em media_pacientes é o
+        cenário sem média de pacientes.
+        """
+        if media_pacientes is None:
+            media_pacientes = self.media_pacientes
         
-        # Fatores de correlação por tipo de produto
-        self.fatores_correcao = {
-            'medicamentos': {
-                'fator_paciente': 0.8,  # 80% dos pacientes usam medicamentos
-                'fator_sazonal': 1.2,   # 20% de variação sazonal
-                'estoque_minimo': 0.3,  # 30% do estoque como mínimo
-                'prazo_seguranca': 15   # 15 dias de segurança
-            },
-            'insumos': {
-                'fator_paciente': 0.6,
-                'fator_sazonal': 1.1,
-                'estoque_minimo': 0.2,
-                'prazo_seguranca': 10
-            },
-            'equipamentos': {
-                'fator_paciente': 0.4,
-                'fator_sazonal': 1.0,
-                'estoque_minimo': 0.5,
-                'prazo_seguranca': 30
-            }
+        media = np.asarray(media_saida_mensal, dtype=float)
+        estoque = np.asarray(estoque_atual, dtype=float)
+        fator_paciente = np.asarray(fatores['fator_paciente'], dtype=float)
+        fator_sazonal = np.asarray(fatores['fator_sazonal'], dtype=float)
+        
+        if media_pacientes is None:
+            demanda = media
+        else:
+            pacientes = np.asarray(media_pacientes, dtype=float)
+            demanda_ajustada = media * (pacientes / 1000) * fator_paciente * fator_sazonal
+            # Mínimo 50% da média histórica
+            demanda = np.where(np.isnan(pacientes), media, np.maximum(demanda_ajustada, media * 0.5))
+        
+        # Mesma semântica das versões escalares para NaN: prazo NaN quando a demanda é NaN
+        # (só demanda <= 0 dá prazo infinito) e compra 0 quando o necessário é NaN (max(0, NaN))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            prazo = np.where(demanda <= 0, np.inf, estoque / (demanda / 30))
+        
+        necessario = estoque * np.asarray(fatores['estoque_minimo'], dtype=float) + demanda * (prazo_desejado / 30)
+        compra = np.round(np.fmax(0, necessario - estoque) * 1.1, 2)
+        
+        seguranca = demanda * (np.asarray(fatores['prazo_seguranca'], dtype=float) / 30)
+        ideal = np.round((demanda * (np.asarray(periodo_previsao, dtype=float) / 30) + seguranca) * fator_sazonal, 2)
+        
+        return {
+            'Demanda Esperada': demanda,
+            'Estoque Restante Estimado': estoque - demanda,
+            'Prazo Estoque (dias)': prazo,
+            'Quantidade Sugerida Compra': compra,
+            'Estoque Ideal Futuro': ideal
         }
     
     def calcular_demanda_esperada(self, media_saida_mensal, media_pacientes=None):
@@ -62,18 +123,65 @@ class AnaliseAvancada:
         
         return max(demanda_ajustada, media_saida_mensal * 0.5)  # Mínimo 50% da média histórica
     
+    def treinar_modelo_demanda(self, dados_historicos):
+        """Treina (ou recupera do cache) o modelo de previsão para uma série histórica
+        
+        Com cache_modelos configurado, uma série já vista é carregada do disco e uma
+        série que só ganhou um mês novo parte do modelo anterior, acrescentando
+        ARVORES_INCREMENTO árvores treinadas no histórico completo.
+        """
+        y = np.asarray(dados_historicos, dtype=float)
+        X = np.arange(len(y)).reshape(-1, 1)
+        
+        if self.cache_modelos is None:
+            modelo = RandomForestRegressor(
+                n_estimators=self.CONFIG_MODELO['n_estimators'],
+                random_state=self.CONFIG_MODELO['random_state']
+            )
+            return modelo.fit(X, y)
+        
+        impressao = self.cache_modelos.gerar_impressao(y, self.CONFIG_MODELO)
+        entrada = self.cache_modelos.obter(impressao)
+        if entrada is not None:
+            return entrada['modelo']
+        
+        # Refit incremental a partir do modelo do histórico sem o último mês
+        anterior = None
+        if len(y) > 3:
+            anterior = self.cache_modelos.obter(
+                self.cache_modelos.gerar_impressao(y[:-1], self.CONFIG_MODELO), contabilizar=False
+            )
+        
+        if anterior is not None and anterior['modelo'].n_estimators + self.ARVORES_INCREMENTO <= self.MAX_ARVORES:
+            modelo = anterior['modelo']
+            modelo.set_params(warm_start=True, n_estimators=modelo.n_estimators + self.ARVORES_INCREMENTO)
+            refit = 'incremental'
+        else:
+            modelo = RandomForestRegressor(
+                n_estimators=self.CONFIG_MODELO['n_estimators'],
+                random_state=self.CONFIG_MODELO['random_state'],
+                warm_start=True
+            )
+            refit = 'completo'
+        
+        modelo.fit(X, y)
+        self.cache_modelos.armazenar(impressao, {
+            'modelo': modelo,
+            'configuracao': self.CONFIG_MODELO,
+            'meses': len(y),
+            'arvores': modelo.n_estimators,
+            'refit': refit
+        })
+        return modelo
+    
     def prever_demanda_futura(self, dados_historicos, meses_futuros=3):
         """Prevê demanda futura usando machine learning"""
         if len(dados_historicos) < 3:
             return None
-            
-        # Preparar dados para ML
-        X = np.arange(len(dados_historicos)).reshape(-1, 1)
-        y = dados_historicos.values
         
-        # Treinar modelo
-        modelo = RandomForestRegressor(n_estimators=100, random_state=42)
-        modelo.fit(X, y)
+        # Treinar modelo (ou reaproveitar do cache)
+        modelo = self.treinar_modelo_demanda(dados_historicos)
+        self.modelo_demanda = modelo
         
         # Prever próximos meses
         X_futuro = np.arange(len(dados_historicos), len(dados_historicos) + meses_futuros).reshape(-1, 1)
@@ -81,6 +189,43 @@ class AnaliseAvancada:
         
         return previsoes
     
+    def prever_demanda_lote(self, historicos, meses_futuros=3):
+        """Prevê a demanda futura de vários produtos ({codigo: série histórica})
+        
+        Séries idênticas compartilham a mesma impressão digital e são treinadas uma única vez.
+        """
+        previsoes = {}
+        por_serie = {}
+        
+        for codigo, dados_historicos in historicos.items():
+            chave = np.asarray(dados_historicos, dtype=float).tobytes()
+            if chave not in por_serie:
+                por_serie[chave] = self.prever_demanda_futura(dados_historicos, meses_futuros)
+            previsoes[codigo] = por_serie[chave]
+        
+        return previsoes
+    
+    def avaliar_previsoes(self, reais, previstos):
+        """Métricas de erro de um conjunto de previsões (MAE, RMSE, MAPE e viés)
+        
+        O MAPE considera só os meses com saída; o viés é a média de previsto - real
+        (positivo quando o método superestima a demanda).
+        """
+        reais = np.asarray(reais, dtype=float)
+        previstos = np.asarray(previstos, dtype=float)
+        if len(reais) == 0:
+            return {'MAE': np.nan, 'RMSE': np.nan, 'MAPE (%)': np.nan, 'Viés': np.nan}
+        
+        com_saida = reais > 0
+        mape = np.mean(np.abs(previstos[com_saida] - reais[com_saida]) / reais[com_saida]) * 100 if com_saida.any() else np.nan
+        
+        return {
+            'MAE': round(mean_absolute_error(reais, previstos), 2),
+            'RMSE': round(float(np.sqrt(mean_squared_error(reais, previstos))), 2),
+            'MAPE (%)': round(float(mape), 2),
+            'Viés': round(float(np.mean(previstos - reais)), 2)
+        }
+    
     def calcular_prazo_estoque(self, estoque_atual, demanda_esperada):
         """Calcula quantos dias o estoque atual durará"""
         if demanda_esperada <= 0:
@@ -138,6 +283,58 @@ class AnaliseAvancada:
         
         return round(estoque_ideal, 2)
     
+    def simular_cenarios(self, media_saida_mensal, estoque_atual, lista_pacientes, lista_periodos, lista_tipos=None, prazo_desejado=90, dtype=np.float64, codigos=None, classificacao=None, classes=None):
+        """Avalia as métricas de calcular_metricas para uma grade de cenários
+        
+        Os cálculos são feitos em matrizes SKU × cenário, uma chamada de
+        calcular_metricas por tipo de produto. Com codigos, os fatores de cada SKU
+        vêm da tabela de fatores configurada (o tipo do cenário substitui o tipo
+        padrão da análise); com classificacao e classes (colunas de classe do
+        resultado), a política de cada classe também é aplicada. Assim, o cenário
+        com os parâmetros da análise reproduz o resultado dela.
+        Use None em lista_pacientes para o cenário sem média de pacientes.
+        Retorna um dicionário com a grade de cenários e as métricas calculadas.
+        """
+        if lista_tipos is None:
+            lista_tipos = [self.tipo_produto or 'medicamentos']
+        
+        # Grade de cenários (produto cartesiano dos parâmetros)
+        cenarios = pd.MultiIndex.from_product(
+            [list(lista_pacientes), list(lista_periodos), list(lista_tipos)],
+            names=['media_pacientes', 'periodo_previsao', 'tipo_produto']
+        ).to_frame(index=False)
+        
+        # Vetores por cenário (1 × C) e por SKU (N × 1)
+        pacientes = pd.to_numeric(cenarios['media_pacientes'], errors='coerce').to_numpy(dtype=float)[None, :]
+        periodo = cenarios['periodo_previsao'].to_numpy(dtype=float)[None, :]
+        media = np.asarray(media_saida_mensal, dtype=float)[:, None]
+        estoque = np.asarray(estoque_atual, dtype=float)[:, None]
+        
+        metricas = {}
+        for tipo in pd.unique(cenarios['tipo_produto']):
+            colunas = np.flatnonzero((cenarios['tipo_produto'] == tipo).to_numpy())
+            if codigos is None:
+                fatores = TabelaFatores().resolver(pd.RangeIndex(len(media)), tipo, self.fatores_correcao)
+            else:
+                fatores = self.resolver_fatores(codigos, tipo)
+            if classificacao is not None and classes is not None:
+                fatores, _ = classificacao.aplicar_politicas(fatores, classes)
+            
+            parciais = self.calcular_metricas(
+                media,
+                estoque,
+                {coluna: fatores[coluna].to_numpy(dtype=float)[:, None] for coluna in TabelaFatores.COLUNAS_FATORES},
+                pacientes[:, colunas],
+                periodo[:, colunas],
+                prazo_desejado
+            )
+            for nome, matriz in parciais.items():
+                if nome not in metricas:
+                    metricas[nome] = np.empty((len(media), len(cenarios)), dtype=dtype)
+                metricas[nome][:, colunas] = matriz
+        
+        return {'cenarios': cenarios, 'metricas': metricas}
+    
     def analisar_sazonalidade(self, dados_mensais):
         """Analisa padrões sazonais nos dados"""
         if len(dados_mensais) < 12:
@@ -210,6 +407,12 @@ class AnaliseAvancada:
             resultado_analise['Estoque Restante Estimado'] > 90
         ])
         
+        # Distribuição das classes ABC/XYZ (quando a classificação foi solicitada)
+        classes = {}
+        for coluna in ('Classe ABC', 'Classe XYZ'):
+            if coluna in resultado_analise:
+                classes[coluna] = resultado_analise[coluna].value_counts().sort_index().to_dict()
+        
         return {
             'total_produtos': total_produtos,
             'produtos_criticos': produtos_criticos,
@@ -225,7 +428,8 @@ class AnaliseAvancada:
                 'excessivo': excessivo
             },
             'percentual_critico': (produtos_criticos / total_produtos * 100) if total_produtos > 0 else 0,
-            'percentual_ok': (produtos_ok / total_produtos * 100) if total_produtos > 0 else 0
+            'percentual_ok': (produtos_ok / total_produtos * 100) if total_produtos > 0 else 0,
+            'classes': classes
         }
     
     def gerar_recomendacoes(self, resultado_analise):
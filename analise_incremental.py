@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+import logging
+from estoque_analyzer import EstoqueAnalyzer
+from tabela_fatores import TabelaFatores
+
+logger = logging.getLogger(__name__)
+
+class AnaliseIncremental:
+    """Reanálise incremental entre snapshots consecutivos de estoque"""
+
+    # Colunas de conteúdo usadas no hash de cada planilha
+    COLUNAS_HASH_ESTOQUE = ['descricao', 'unidade', 'quantidade']
+    COLUNAS_HASH_SAIDAS = ['descricao', 'unidade', 'saida']
+
+    def __init__(self, analyzer=None):
+        self.analyzer = analyzer if analyzer is not None else EstoqueAnalyzer()
+        self.resultado = None
+        self.hashes_estoque = None
+        self.hashes_saidas = None
+        self.parametros = None
+
+    def calcular_hashes(self, df, colunas, primeira_ocorrencia=False):
+        """Calcula um hash de conteúdo por código"""
+        colunas = [c for c in colunas if c in df.columns]
+
+        if primeira_ocorrencia:
+            # O analisador usa apenas a primeira linha de cada código
+            df = df.drop_duplicates(subset='codigo', keep='first')
+            hashes = pd.util.hash_pandas_object(df[colunas], index=False)
+            return pd.Series(hashes.values, index=df['codigo'].values)
+
+        # Várias linhas por código: inclui a posição da linha e combina por XOR
+        dados = df[colunas].copy()
+        dados['_posicao'] = df.groupby('codigo').cumcount()
+        hashes = pd.util.hash_pandas_object(dados, index=False).values
+
+        codigos = df['codigo'].values
+        ordem = np.argsort(codigos, kind='stable')
+        codigos_ordenados = codigos[ordem]
+        inicios = np.flatnonzero(np.r_[True, codigos_ordenados[1:] != codigos_ordenados[:-1]])
+        combinados = np.bitwise_xor.reduceat(hashes[ordem], inicios)
+
+        return pd.Series(combinados, index=codigos_ordenados[inicios])
+
+    @staticmethod
+    def _hash_alterado(anteriores, atuais, codigos):
+        """Máscara dos códigos sem hash anterior ou com hash diferente
+
+        Compara os arrays uint64 pelas posições (get_indexer): um reindex com códigos
+        ausentes converteria os hashes em float64 e confundiria hashes próximos.
+        """
+        posicao_anterior = anteriores.index.get_indexer(codigos)
+        posicao_atual = atuais.index.get_indexer(codigos)
+        alterado = (posicao_anterior < 0) | (posicao_atual < 0)
+        comuns = ~alterado
+        alterado[comuns] = (
+            anteriores.to_numpy()[posicao_anterior[comuns]] != atuais.to_numpy()[posicao_atual[comuns]]
+        )
+        return alterado
+
+    def detectar_alterados(self, hashes_estoque, hashes_saidas, codigos):
+        """Retorna os códigos cujo conteúdo mudou em relação ao snapshot anterior"""
+        codigos = pd.Index(sorted(codigos, key=str))
+
+        alterado = (
+            self._hash_alterado(self.hashes_estoque, hashes_estoque, codigos) |
+            self._hash_alterado(self.hashes_saidas, hashes_saidas, codigos)
+        )
+
+        return list(codigos[alterado])
+
+    def comparar_situacao(self, anterior, atual):
+        """Lista os itens que mudaram de situação entre OK e Comprar"""
+        colunas = ['Código', 'Descrição', 'Situação']
+        comparacao = anterior[colunas].merge(
+            atual[['Código', 'Situação']],
+            on='Código',
+            suffixes=(' Anterior', ' Atual')
+        )
+        mudancas = comparacao[comparacao['Situação Anterior'] != comparacao['Situação Atual']]
+        return mudancas.reset_index(drop=True)
+
+    def atualizar(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90, tabela_fatores=None):
+        """Analisa um novo snapshot recalculando apenas os itens alterados"""
+        try:
+            # Tabela de fatores como planilha (caminho ou upload) ou TabelaFatores
+            if tabela_fatores is not None and not isinstance(tabela_fatores, TabelaFatores):
+                arquivo_fatores, tabela_fatores = tabela_fatores, TabelaFatores()
+                if tabela_fatores.carregar(arquivo_fatores) is None:
+                    return None, None
+            self.analyzer.analise_avancada.configurar_tipo_produto(tipo_produto, media_pacientes, tabela_fatores)
+
+            df_estoque, df_saidas = self.analyzer.preparar_planilhas(estoque_file, saidas_file, config_manual)
+
+            if df_estoque is None or df_saidas is None:
+                return None, None
+
+            produtos_comuns = set(df_estoque['codigo']) & set(df_saidas['codigo'])
+            if len(produtos_comuns) == 0:
+                return None, None
+
+            hashes_estoque = self.calcular_hashes(df_estoque, self.COLUNAS_HASH_ESTOQUE, primeira_ocorrencia=True)
+            hashes_saidas = self.calcular_hashes(df_saidas, self.COLUNAS_HASH_SAIDAS)
+            # Tabelas de fatores com as mesmas regras não forçam o recálculo completo
+            impressao_fatores = tabela_fatores.impressao() if tabela_fatores is not None else None
+            parametros = (tipo_produto, media_pacientes, periodo_previsao, impressao_fatores)
+
+            if self.resultado is None or parametros != self.parametros:
+                # Primeira análise ou parâmetros diferentes: recalcular tudo
+                # Códigos em ordem: o resultado não depende da ordem do conjunto
+                resultado = self.analyzer.ordenar_por_urgencia(self.analyzer.calcular_resultados(
+                    df_estoque, df_saidas, sorted(produtos_comuns, key=str), tipo_produto, media_pacientes, periodo_previsao
+                ))
+                relatorio = {
+                    'completa': True,
+                    'alterados': sorted(produtos_comuns, key=str),
+                    'removidos': [],
+                    'mudancas_situacao': self.comparar_situacao(resultado.iloc[0:0], resultado)
+                }
+            else:
+                alterados = self.detectar_alterados(hashes_estoque, hashes_saidas, produtos_comuns)
+                removidos = sorted(set(self.resultado['Código']) - produtos_comuns)
+                logger.info(f"Snapshot incremental: {len(alterados)} alterados, {len(removidos)} removidos")
+
+                # Manter as linhas inalteradas e substituir as recalculadas
+                descartar = self.resultado['Código'].isin(set(alterados) | set(removidos))
+                partes = [self.resultado[~descartar]]
+                if alterados:
+                    partes.append(self.analyzer.calcular_resultados(
+                        df_estoque, df_saidas, alterados, tipo_produto, media_pacientes, periodo_previsao
+                    ))
+                # Mesma ordem de analisar_estoque: as linhas recalculadas voltam à sua posição
+                resultado = self.analyzer.ordenar_por_urgencia(pd.concat(partes, ignore_index=True))
+
+                relatorio = {
+                    'completa': False,
+                    'alterados': alterados,
+                    'removidos': removidos,
+                    'mudancas_situacao': self.comparar_situacao(self.resultado, resultado)
+                }
+
+            self.resultado = resultado
+            self.hashes_estoque = hashes_estoque
+            self.hashes_saidas = hashes_saidas
+            self.parametros = parametros
+
+            return resultado, relatorio
+
+        except Exception as e:
+            logger.error(f"Erro na análise incremental: {str(e)}")
+            return None, None
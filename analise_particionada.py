@@ -0,0 +1,339 @@
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from estoque_analyzer import EstoqueAnalyzer, AnaliseCancelada
+from lotes_validade import ConsumoFEFO
+from razao_saidas import AgregadorRazao
+from risco_ruptura import SimuladorRuptura
+
+logger = logging.getLogger(__name__)
+
+class AnaliseParticionada:
+    """Análise fora da memória (out-of-core) para históricos maiores que a RAM
+
+    As planilhas são lidas em blocos e cada linha vai para um de n_baldes arquivos
+    Parquet pelo hash do código, de modo que todas as linhas de um SKU ficam no mesmo
+    balde. Baldes consecutivos são agrupados em partições que cabem em memoria_mb e
+    cada partição é analisada pelo motor vetorizado de sempre (calcular_resultados);
+    os resultados, uma linha por SKU, são unidos à medida que as partições terminam.
+    """
+
+    # Memória do processamento de uma partição em relação aos dados lidos (cópias
+    # intermediárias do pandas durante a análise)
+    FATOR_PROCESSAMENTO = 6
+    # Bytes por linha assumidos antes de medir o primeiro bloco
+    BYTES_POR_LINHA = 300
+    # Colunas gravadas como texto nos baldes; 'mes' é inteiro e as demais, float64
+    COLUNAS_TEXTO = ('codigo', 'descricao', 'unidade')
+
+    def __init__(self, analyzer=None, memoria_mb=1024, n_baldes=64, diretorio=None):
+        self.analyzer = analyzer if analyzer is not None else EstoqueAnalyzer()
+        self.memoria_mb = memoria_mb
+        self.n_baldes = n_baldes
+        # Diretório dos baldes; sem ele, usa um temporário removido ao final da análise
+        self.diretorio = diretorio
+        self._limpar_estado()
+
+    def _limpar_estado(self):
+        self.linhas = {}
+        self.bytes_por_linha = {}
+        self.skus_razao = [set() for _ in range(self.n_baldes)]
+        self.intervalo_meses = None
+        self._escritores = {}
+        self._esquemas = {}
+
+    @property
+    def memoria_bytes(self):
+        return int(self.memoria_mb * 1024 ** 2)
+
+    @property
+    def tamanho_bloco(self):
+        """Linhas lidas por vez, para que um bloco em processamento caiba no limite"""
+        return max(1000, self.memoria_bytes // (self.BYTES_POR_LINHA * self.FATOR_PROCESSAMENTO))
+
+    @staticmethod
+    def _eh_csv(arquivo):
+        nome = getattr(arquivo, 'name', str(arquivo)).lower()
+        return nome.endswith('.csv') or nome.endswith('.txt')
+
+    @staticmethod
+    def _rebobinar(arquivo):
+        if hasattr(arquivo, 'seek'):
+            arquivo.seek(0)
+
+    def detectar_estrutura(self, arquivo, linhas_amostra=200):
+        """Linha de início e mapeamento de colunas detectados nas primeiras linhas
+
+        Aplica à amostra as mesmas heurísticas da leitura completa da planilha.
+        """
+        if self._eh_csv(arquivo):
+            amostra = pd.read_csv(
+                arquivo, sep=AgregadorRazao._detectar_separador(arquivo), header=None, nrows=linhas_amostra
+            )
+        else:
+            amostra = pd.read_excel(arquivo, header=None, nrows=linhas_amostra)
+        self._rebobinar(arquivo)
+
+        linha_inicio = self.analyzer.detectar_linha_inicio(amostra)
+        mapeamento = self.analyzer.mapear_colunas_automaticamente(amostra.iloc[linha_inicio:].reset_index(drop=True))
+        return linha_inicio, mapeamento
+
+    def ler_blocos(self, arquivo, linha_inicio=0):
+        """Gera DataFrames com as linhas da planilha a partir de linha_inicio, um bloco por vez"""
+        if self._eh_csv(arquivo):
+            leitor = pd.read_csv(
+                arquivo, sep=AgregadorRazao._detectar_separador(arquivo), header=None,
+                skiprows=linha_inicio, dtype=object, chunksize=self.tamanho_bloco
+            )
+            for bloco in leitor:
+                yield bloco.reset_index(drop=True)
+            return
+
+        from openpyxl import load_workbook
+
+        livro = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            bloco = []
+            for linha in livro.active.iter_rows(min_row=linha_inicio + 1, values_only=True):
+                bloco.append(linha)
+                if len(bloco) >= self.tamanho_bloco:
+                    yield self._bloco_excel(bloco)
+                    bloco = []
+            if bloco:
+                yield self._bloco_excel(bloco)
+        finally:
+            livro.close()
+
+    @staticmethod
+    def _bloco_excel(linhas):
+        # Células vazias como NaN, como na leitura com pd.read_excel
+        bloco = pd.DataFrame(linhas)
+        return bloco.where(bloco.notna(), np.nan)
+
+    @classmethod
+    def _esquema(cls, df):
+        """Esquema Arrow das colunas do bloco, independente dos valores do bloco
+
+        Derivado dos nomes das colunas e não dos dados, para que um bloco só com
+        inteiros (ou com uma coluna toda vazia) não fixe um tipo incompatível com os
+        blocos seguintes.
+        """
+        campos = []
+        for coluna in df.columns:
+            if coluna in cls.COLUNAS_TEXTO:
+                tipo = pa.string()
+            elif coluna == 'mes':
+                tipo = pa.int64()
+            else:
+                tipo = pa.float64()
+            campos.append(pa.field(coluna, tipo))
+        return pa.schema(campos)
+
+    def _gravar(self, tipo, df):
+        """Distribui as linhas de um bloco pelos baldes do tipo ('estoque', 'saidas' ou 'razao')"""
+        if len(df) == 0:
+            return
+        df = df.reset_index(drop=True)
+        balde = pd.util.hash_array(df['codigo'].to_numpy(dtype=object)) % np.uint64(self.n_baldes)
+        balde = balde.astype(np.int64)
+
+        # Maior tamanho por linha observado no tipo (dimensiona as partições)
+        tamanho = df.memory_usage(deep=True).sum() / len(df)
+        self.bytes_por_linha[tipo] = max(self.bytes_por_linha.get(tipo, 0.0), tamanho)
+        linhas = self.linhas.setdefault(tipo, np.zeros(self.n_baldes, dtype=np.int64))
+
+        # Um único Table por bloco, sempre com o mesmo esquema explícito do tipo
+        esquema = self._esquemas.setdefault(tipo, self._esquema(df))
+        tabela = pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+        codigos = df['codigo'].to_numpy(dtype=object)
+
+        ordem = np.argsort(balde, kind='stable')
+        baldes, inicios = np.unique(balde[ordem], return_index=True)
+        for b, posicoes in zip(baldes, np.split(ordem, inicios[1:])):
+            escritor = self._escritores.get((tipo, b))
+            if escritor is None:
+                escritor = self._escritores[(tipo, b)] = pq.ParquetWriter(self._caminho(tipo, b), esquema)
+            escritor.write_table(tabela.take(posicoes))
+            linhas[b] += len(posicoes)
+            if tipo == 'razao':
+                self.skus_razao[b].update(codigos[posicoes])
+
+    def _caminho(self, tipo, balde):
+        return os.path.join(self.diretorio_baldes, f"{tipo}_{balde:04d}.parquet")
+
+    def _fechar_escritores(self):
+        for escritor in self._escritores.values():
+            escritor.close()
+        self._escritores = {}
+
+    def particionar(self, estoque_file, saidas_file, config_manual=None, progresso=None, cancelamento=None):
+        """Lê as planilhas em blocos e grava as linhas de cada SKU no seu balde em disco"""
+        config_manual = config_manual or {}
+        reportar = self.analyzer._reportar_etapa
+        try:
+            linha_inicio = config_manual.get('linha_inicio_estoque')
+            mapeamento = config_manual.get('mapeamento_estoque')
+            if linha_inicio is None or mapeamento is None:
+                detectada, detectado = self.detectar_estrutura(estoque_file)
+                linha_inicio = detectada if linha_inicio is None else linha_inicio
+                mapeamento = detectado if mapeamento is None else mapeamento
+
+            for bloco in self.ler_blocos(estoque_file, linha_inicio):
+                reportar(progresso, cancelamento, 'carregar', 0.0)
+                df = self.analyzer.separar_codigo_descricao(self.analyzer.extrair_colunas(bloco, mapeamento))
+                self._gravar('estoque', df.drop(columns='codigo_descricao'))
+
+            if config_manual.get('razao_saidas'):
+                mapeamento = config_manual.get('mapeamento_saidas')
+                if mapeamento:
+                    mapeamento = {('quantidade' if papel == 'saida' else papel): i for papel, i in mapeamento.items()}
+                agregador = AgregadorRazao(tamanho_bloco=self.tamanho_bloco)
+                for bloco in agregador.ler_blocos(saidas_file, mapeamento):
+                    reportar(progresso, cancelamento, 'carregar', 0.5)
+                    linhas = agregador.normalizar(bloco)
+                    if len(linhas):
+                        primeiro, ultimo = int(linhas['mes'].min()), int(linhas['mes'].max())
+                        if self.intervalo_meses is not None:
+                            primeiro = min(primeiro, self.intervalo_meses[0])
+                            ultimo = max(ultimo, self.intervalo_meses[1])
+                        self.intervalo_meses = (primeiro, ultimo)
+                    self._gravar('razao', linhas)
+            else:
+                linha_inicio = config_manual.get('linha_inicio_saidas')
+                mapeamento = config_manual.get('mapeamento_saidas')
+                if linha_inicio is None or mapeamento is None:
+                    detectada, detectado = self.detectar_estrutura(saidas_file)
+                    linha_inicio = detectada if linha_inicio is None else linha_inicio
+                    mapeamento = detectado if mapeamento is None else mapeamento
+
+                for bloco in self.ler_blocos(saidas_file, linha_inicio):
+                    reportar(progresso, cancelamento, 'carregar', 0.5)
+                    df = self.analyzer.separar_codigo_descricao(self.analyzer.extrair_colunas(bloco, mapeamento))
+                    self._gravar('saidas', df.drop(columns='codigo_descricao'))
+        finally:
+            self._fechar_escritores()
+
+        logger.info(
+            f"Planilhas particionadas em {self.n_baldes} baldes: "
+            + ", ".join(f"{tipo} {int(linhas.sum())} linhas" for tipo, linhas in self.linhas.items())
+        )
+
+    def planejar_particoes(self):
+        """Agrupa baldes consecutivos em partições que caibam no limite de memória"""
+        estimativa = np.zeros(self.n_baldes)
+        for tipo, linhas in self.linhas.items():
+            estimativa += linhas * self.bytes_por_linha[tipo] * self.FATOR_PROCESSAMENTO
+        if 'razao' in self.linhas and self.intervalo_meses is not None:
+            # Saídas mensais agregadas: uma linha por SKU e mês do razão
+            meses = self.intervalo_meses[1] - self.intervalo_meses[0] + 1
+            skus = np.array([len(s) for s in self.skus_razao])
+            estimativa += skus * meses * self.bytes_por_linha['razao'] * self.FATOR_PROCESSAMENTO
+
+        particoes, atual, total = [], [], 0.0
+        for balde in range(self.n_baldes):
+            if atual and total + estimativa[balde] > self.memoria_bytes:
+                particoes.append(atual)
+                atual, total = [], 0.0
+            if estimativa[balde] > self.memoria_bytes:
+                logger.warning(
+                    f"O balde {balde} precisa de cerca de {estimativa[balde] / 1024 ** 2:.0f} MB, "
+                    f"acima do limite de {self.memoria_mb} MB; aumente n_baldes"
+                )
+            atual.append(balde)
+            total += estimativa[balde]
+        if atual:
+            particoes.append(atual)
+        return particoes
+
+    def ler_particao(self, tipo, baldes):
+        """Linhas de um tipo nos baldes informados (None se não houver nenhuma)"""
+        caminhos = [self._caminho(tipo, b) for b in baldes if os.path.exists(self._caminho(tipo, b))]
+        if not caminhos:
+            return None
+        return pa.concat_tables([pq.read_table(c) for c in caminhos]).to_pandas()
+
+    def _saidas_particao(self, baldes):
+        if 'razao' not in self.linhas:
+            return self.ler_particao('saidas', baldes)
+
+        linhas = self.ler_particao('razao', baldes)
+        if linhas is None:
+            return None
+        agregador = AgregadorRazao()
+        agregador.acumular(linhas)
+        saidas = self.analyzer.formatar_saidas_razao(agregador.finalizar(self.intervalo_meses))
+        return self.analyzer.separar_codigo_descricao(saidas)
+
+    def analisar_particoes(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90, progresso=None, cancelamento=None, simular_risco=False, lotes_file=None, tabela_fatores=None):
+        """Gera o resultado de cada partição assim que ela é analisada
+
+        Os parâmetros são os de EstoqueAnalyzer.analisar_estoque; tabela_fatores deve
+        ser uma TabelaFatores já carregada.
+        """
+        self._limpar_estado()
+        temporario = self.diretorio is None
+        self.diretorio_baldes = tempfile.mkdtemp(prefix='particoes_') if temporario else self.diretorio
+        os.makedirs(self.diretorio_baldes, exist_ok=True)
+
+        simulador = None
+        try:
+            self.analyzer.analise_avancada.configurar_tipo_produto(tipo_produto, media_pacientes, tabela_fatores)
+            lotes = ConsumoFEFO().carregar_lotes(lotes_file) if lotes_file is not None else None
+            if lotes_file is not None and lotes is None:
+                logger.error("Planilha de lotes não pôde ser lida; análise interrompida")
+                return
+            self.particionar(estoque_file, saidas_file, config_manual, progresso, cancelamento)
+
+            if simular_risco:
+                simulador = simular_risco if isinstance(simular_risco, SimuladorRuptura) else SimuladorRuptura()
+
+            particoes = self.planejar_particoes()
+            logger.info(f"Análise fora da memória em {len(particoes)} partições (limite de {self.memoria_mb} MB)")
+            for i, baldes in enumerate(particoes):
+                self.analyzer._reportar_etapa(progresso, cancelamento, 'calcular', i / len(particoes))
+                df_estoque = self.ler_particao('estoque', baldes)
+                df_saidas = self._saidas_particao(baldes)
+                if df_estoque is None or df_saidas is None:
+                    continue
+
+                produtos_comuns = set(df_estoque['codigo']) & set(df_saidas['codigo'])
+                if not produtos_comuns:
+                    continue
+
+                resultado = self.analyzer.calcular_resultados(
+                    df_estoque, df_saidas, sorted(produtos_comuns, key=str), tipo_produto, media_pacientes, periodo_previsao,
+                    cancelamento=cancelamento
+                )
+                if lotes is not None:
+                    resultado = self.analyzer.aplicar_lotes(resultado, lotes)
+                if simular_risco:
+                    resultado = self.analyzer.avaliar_risco_ruptura(resultado, df_saidas, simulador)
+                yield resultado
+        finally:
+            if simulador is not None and simulador is not simular_risco:
+                simulador.fechar()
+            self._fechar_escritores()
+            if temporario:
+                shutil.rmtree(self.diretorio_baldes, ignore_errors=True)
+
+    def analisar(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90, progresso=None, cancelamento=None, simular_risco=False, lotes_file=None, tabela_fatores=None):
+        """Analisa o estoque partição a partição e une os resultados"""
+        try:
+            partes = list(self.analisar_particoes(
+                estoque_file, saidas_file, config_manual, tipo_produto, media_pacientes, periodo_previsao,
+                progresso, cancelamento, simular_risco, lotes_file, tabela_fatores
+            ))
+            return self.analyzer.juntar_partes(partes) if partes else None
+
+        except AnaliseCancelada:
+            raise
+        except Exception as e:
+            logger.error(f"Erro na análise fora da memória: {str(e)}")
+            return None
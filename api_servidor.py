@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+API HTTP local para o motor de análise de estoque.
+
+Endpoints:
+    POST /analisar  - JSON com caminhos das planilhas ou multipart/form-data com os arquivos
+    GET  /historico - linhas de produtos nas análises anteriores (com --historico)
+    GET  /metricas  - contadores de latência, vazão e uso do cache
+    GET  /saude     - verificação simples de disponibilidade
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import default as politica_email
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from arquivo_resultados import ArquivoResultados
+from estoque_analyzer import EstoqueAnalyzer
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_PARTE = 64 * 1024
+LINHAS_POR_PARTE = 1000
+
+class ErroRequisicao(ValueError):
+    """Requisição recusada, com o status HTTP da resposta"""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+# Analisador de cada processo trabalhador (mantém o cache de planilhas entre requisições)
+_analyzer = None
+
+def _inicializar_trabalhador(max_planilhas_cache, pasta_cache_modelos):
+    """Cria o analisador do processo trabalhador"""
+    global _analyzer
+    _analyzer = EstoqueAnalyzer(max_planilhas_cache=max_planilhas_cache, pasta_cache_modelos=pasta_cache_modelos)
+
+def _executar_analise(estoque, saidas, parametros):
+    """Executa uma análise no processo trabalhador"""
+    if isinstance(estoque, bytes):
+        estoque = io.BytesIO(estoque)
+    if isinstance(saidas, bytes):
+        saidas = io.BytesIO(saidas)
+
+    acertos, falhas = _analyzer.cache_acertos, _analyzer.cache_falhas
+    resultado = _analyzer.analisar_estoque(
+        estoque,
+        saidas,
+        parametros.get('config_manual'),
+        parametros.get('tipo_produto', 'medicamentos'),
+        parametros.get('media_pacientes'),
+        parametros.get('periodo_previsao', 90),
+        conciliar=parametros.get('conciliar', False),
+        simular_risco=parametros.get('simular_risco', False),
+        validar_previsao=parametros.get('validar_previsao', False),
+        classificar_abc=parametros.get('classificar_abc', False),
+        memoria_maxima_mb=parametros.get('memoria_maxima_mb')
+    )
+
+    return resultado, _analyzer.cache_acertos - acertos, _analyzer.cache_falhas - falhas
+
+class MetricasServidor:
+    """Contadores de latência, vazão e cache do servidor"""
+
+    def __init__(self, janela=1000):
+        self.trava = threading.Lock()
+        self.inicio = time.time()
+        self.requisicoes = 0
+        self.concluidas = 0
+        self.rejeitadas = 0
+        self.erros = 0
+        self.em_andamento = 0
+        self.cache_acertos = 0
+        self.cache_falhas = 0
+        self.latencias = deque(maxlen=janela)
+        self.instantes_conclusao = deque(maxlen=janela)
+
+    def registrar(self, campo, quantidade=1):
+        with self.trava:
+            setattr(self, campo, getattr(self, campo) + quantidade)
+
+    def registrar_conclusao(self, latencia, acertos, falhas):
+        with self.trava:
+            self.concluidas += 1
+            self.cache_acertos += acertos
+            self.cache_falhas += falhas
+            self.latencias.append(latencia)
+            self.instantes_conclusao.append(time.time())
+
+    def resumo(self):
+        """Retorna os contadores em formato serializável"""
+        with self.trava:
+            agora = time.time()
+            latencias = np.array(self.latencias) if self.latencias else np.zeros(1)
+            ultimo_minuto = sum(1 for t in self.instantes_conclusao if agora - t <= 60)
+            consultas_cache = self.cache_acertos + self.cache_falhas
+
+            return {
+                'tempo_ativo_s': round(agora - self.inicio, 1),
+                'requisicoes': self.requisicoes,
+                'concluidas': self.concluidas,
+                'rejeitadas': self.rejeitadas,
+                'erros': self.erros,
+                'em_andamento': self.em_andamento,
+                'latencia_media_s': round(float(latencias.mean()), 4),
+                'latencia_p50_s': round(float(np.percentile(latencias, 50)), 4),
+                'latencia_p95_s': round(float(np.percentile(latencias, 95)), 4),
+                'vazao_por_minuto': ultimo_minuto,
+                'cache_acertos': self.cache_acertos,
+                'cache_falhas': self.cache_falhas,
+                'cache_taxa_acerto': round(self.cache_acertos / consultas_cache, 4) if consultas_cache else 0.0
+            }
+
+class ServidorAnalise(ThreadingHTTPServer):
+    """Servidor HTTP com pool de processos limitado e fila com contrapressão"""
+
+    daemon_threads = True
+
+    def __init__(self, endereco, max_trabalhadores=2, max_fila=8, max_planilhas_cache=16, pasta_permitida=None,
+                 pasta_historico=None, pasta_cache_modelos='.cache_modelos', max_corpo_mb=100):
+        super().__init__(endereco, ManipuladorAnalise)
+        self._argumentos_pool = (max_trabalhadores, max_planilhas_cache, pasta_cache_modelos)
+        self.trava_pool = threading.Lock()
+        self.pool = self._criar_pool()
+        # Vagas = análises em execução + análises aguardando na fila
+        self.vagas = threading.BoundedSemaphore(max_trabalhadores + max_fila)
+        # Sem pasta permitida, a leitura por caminho fica desativada (só upload)
+        self.pasta_permitida = os.path.realpath(pasta_permitida) if pasta_permitida else None
+        if self.pasta_permitida is None:
+            logger.warning("Sem --pasta-permitida: leitura por caminho desativada, envie os arquivos por upload")
+        self.max_corpo = int(max_corpo_mb * 1024 * 1024)
+        self.metricas = MetricasServidor()
+        # Histórico das análises concluídas (desativado sem pasta)
+        self.arquivo = ArquivoResultados(pasta_historico) if pasta_historico else None
+
+    def _criar_pool(self):
+        max_trabalhadores, max_planilhas_cache, pasta_cache_modelos = self._argumentos_pool
+        return ProcessPoolExecutor(
+            max_workers=max_trabalhadores,
+            initializer=_inicializar_trabalhador,
+            initargs=(max_planilhas_cache, pasta_cache_modelos)
+        )
+
+    def reconstruir_pool(self, quebrado):
+        """Substitui o pool quebrado (um trabalhador morreu) por um novo
+
+        Só o primeiro pedido que encontra o pool quebrado o substitui.
+        """
+        with self.trava_pool:
+            if self.pool is quebrado:
+                logger.warning("Pool de trabalhadores quebrado; criando um novo")
+                quebrado.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._criar_pool()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+class ManipuladorAnalise(BaseHTTPRequestHandler):
+    """Trata as requisições da API de análise"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *args):
+        logger.info("%s - %s", self.address_string(), formato % args)
+
+    def _responder_json(self, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _escrever_parte(self, dados):
+        """Escreve uma parte no formato Transfer-Encoding: chunked"""
+        if dados:
+            self.wfile.write(f"{len(dados):X}\r\n".encode('ascii') + dados + b"\r\n")
+
+    def _iniciar_envio(self, tipo_conteudo):
+        self.send_response(200)
+        self.send_header('Content-Type', tipo_conteudo)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _finalizar_envio(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        caminho = url.path
+        if caminho == '/saude':
+            self._responder_json(200, {'status': 'ok'})
+        elif caminho == '/historico':
+            self._responder_historico(url)
+        elif caminho == '/metricas':
+            self._responder_json(200, self.server.metricas.resumo())
+        else:
+            self._responder_json(404, {'erro': 'Endpoint não encontrado'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/analisar':
+            self._responder_json(404, {'erro': 'Endpoint não encontrado'})
+            return
+
+        metricas = self.server.metricas
+        metricas.registrar('requisicoes')
+
+        try:
+            estoque, saidas, parametros = self._ler_requisicao(url)
+        except ValueError as e:
+            metricas.registrar('erros')
+            # Corpo não lido (tamanho inválido ou grande demais): a conexão não é reaproveitada
+            cabecalhos = {'Connection': 'close'} if self.close_connection else None
+            self._responder_json(getattr(e, 'status', 400), {'erro': str(e)}, cabecalhos)
+            return
+
+        formato = parametros.get('formato', 'json')
+        if formato not in ('json', 'parquet'):
+            metricas.registrar('erros')
+            self._responder_json(400, {'erro': f"Formato '{formato}' não suportado"})
+            return
+
+        # Contrapressão: recusar imediatamente quando a fila está cheia
+        if not self.server.vagas.acquire(blocking=False):
+            metricas.registrar('rejeitadas')
+            self._responder_json(503, {'erro': 'Servidor ocupado, tente novamente'}, {'Retry-After': '5'})
+            return
+
+        inicio = time.time()
+        metricas.registrar('em_andamento')
+        pool = self.server.pool
+        try:
+            futuro = pool.submit(_executar_analise, estoque, saidas, parametros)
+            resultado, acertos, falhas = futuro.result()
+        except BrokenProcessPool:
+            # Trabalhador encerrado (ex.: falta de memória): as próximas requisições usam um pool novo
+            metricas.registrar('erros')
+            self.server.reconstruir_pool(pool)
+            self._responder_json(503, {'erro': 'Processo de análise interrompido, tente novamente'}, {'Retry-After': '5'})
+            return
+        except Exception as e:
+            metricas.registrar('erros')
+            self._responder_json(500, {'erro': f"Erro durante a análise: {str(e)}"})
+            return
+        finally:
+            metricas.registrar('em_andamento', -1)
+            self.server.vagas.release()
+
+        if resultado is None:
+            metricas.registrar('erros')
+            self._responder_json(422, {'erro': 'Erro ao processar os arquivos. Verifique as colunas ou a configuração manual.'})
+            return
+
+        metricas.registrar_conclusao(time.time() - inicio, acertos, falhas)
+
+        if self.server.arquivo is not None:
+            try:
+                self.server.arquivo.gravar(resultado, parametros.get('estabelecimento', ''))
+            except Exception as e:
+                logger.warning(f"Não foi possível arquivar o resultado: {str(e)}")
+
+        if formato == 'parquet':
+            self._enviar_parquet(resultado)
+        else:
+            self._enviar_json(resultado, time.time() - inicio)
+
+    def _responder_historico(self, url):
+        """Linhas de um ou mais produtos nas análises anteriores
+
+        Parâmetros: codigo (um ou mais, separados por vírgula), colunas (separadas por
+        vírgula; padrão: todas), estabelecimento e ultimas (análises por estabelecimento).
+        """
+        if self.server.arquivo is None:
+            self._responder_json(404, {'erro': 'Histórico desativado (inicie a API com --historico)'})
+            return
+
+        consulta = {chave: valores[0] for chave, valores in parse_qs(url.query).items()}
+        if not consulta.get('codigo'):
+            self._responder_json(400, {'erro': "Informe o parâmetro 'codigo'"})
+            return
+        try:
+            ultimas = int(consulta['ultimas']) if consulta.get('ultimas') else None
+        except ValueError:
+            self._responder_json(400, {'erro': "Parâmetro 'ultimas' deve ser numérico"})
+            return
+
+        colunas = [c.strip() for c in consulta['colunas'].split(',')] if consulta.get('colunas') else None
+        linhas = self.server.arquivo.consultar(
+            colunas,
+            codigos=[c.strip() for c in consulta['codigo'].split(',')],
+            estabelecimento=consulta.get('estabelecimento'),
+            ultimas=ultimas
+        )
+        self._responder_json(200, {
+            'linhas': len(linhas),
+            'colunas': list(linhas.columns),
+            'historico': json.loads(linhas.to_json(orient='records', date_format='iso', force_ascii=False))
+        })
+
+    def _validar_caminho(self, caminho):
+        """Garante que o caminho existe e está dentro da pasta permitida"""
+        caminho_real = os.path.realpath(caminho)
+        pasta = self.server.pasta_permitida
+        if os.path.commonpath([pasta, caminho_real]) != pasta:
+            raise ValueError(f"Caminho fora da pasta permitida: {caminho}")
+        if not os.path.isfile(caminho_real):
+            raise ValueError(f"Arquivo não encontrado: {caminho}")
+        return caminho_real
+
+    def _ler_requisicao(self, url):
+        """Extrai planilhas e parâmetros de uma requisição JSON ou multipart"""
+        tamanho = self.headers.get('Content-Length', '0').strip()
+        if not tamanho.isdigit():
+            self.close_connection = True
+            raise ErroRequisicao(f"Content-Length inválido: {tamanho!r}")
+        tamanho = int(tamanho)
+        if tamanho > self.server.max_corpo:
+            self.close_connection = True
+            raise ErroRequisicao(
+                f"Corpo da requisição maior que o limite de {self.server.max_corpo / (1024 * 1024):g} MB", status=413
+            )
+        corpo = self.rfile.read(tamanho) if tamanho else b''
+        tipo = self.headers.get('Content-Type', '')
+
+        parametros = {chave: valores[0] for chave, valores in parse_qs(url.query).items()}
+
+        if tipo.startswith('multipart/form-data'):
+            mensagem = BytesParser(policy=politica_email).parsebytes(
+                f"Content-Type: {tipo}\r\n\r\n".encode('latin-1') + corpo
+            )
+            arquivos = {}
+            for parte in mensagem.iter_parts():
+                nome = parte.get_param('name', header='content-disposition')
+                if parte.get_filename():
+                    arquivos[nome] = parte.get_payload(decode=True)
+                elif nome:
+                    parametros[nome] = parte.get_content().strip()
+            if 'estoque' not in arquivos or 'saidas' not in arquivos:
+                raise ValueError("Envie os arquivos 'estoque' e 'saidas'")
+            estoque, saidas = arquivos['estoque'], arquivos['saidas']
+        else:
+            try:
+                dados = json.loads(corpo or b'{}')
+            except json.JSONDecodeError:
+                raise ValueError("Corpo da requisição não é um JSON válido")
+            if 'estoque' not in dados or 'saidas' not in dados:
+                raise ValueError("Informe os caminhos 'estoque' e 'saidas'")
+            if self.server.pasta_permitida is None:
+                raise ErroRequisicao(
+                    "Leitura por caminho desativada (inicie o servidor com --pasta-permitida); envie os arquivos por upload",
+                    status=403
+                )
+            estoque = self._validar_caminho(dados.pop('estoque'))
+            saidas = self._validar_caminho(dados.pop('saidas'))
+            parametros.update(dados)
+
+        return estoque, saidas, self._normalizar_parametros(parametros)
+
+    def _normalizar_parametros(self, parametros):
+        """Converte os parâmetros recebidos como texto para os tipos esperados"""
+        try:
+            if parametros.get('media_pacientes') not in (None, ''):
+                parametros['media_pacientes'] = float(parametros['media_pacientes'])
+            else:
+                parametros['media_pacientes'] = None
+            parametros['periodo_previsao'] = int(parametros.get('periodo_previsao', 90))
+            if parametros.get('memoria_maxima_mb') not in (None, ''):
+                parametros['memoria_maxima_mb'] = float(parametros['memoria_maxima_mb'])
+            else:
+                parametros['memoria_maxima_mb'] = None
+        except (TypeError, ValueError):
+            raise ValueError("Parâmetros 'media_pacientes', 'periodo_previsao' e 'memoria_maxima_mb' devem ser numéricos")
+
+        for opcao in ('conciliar', 'simular_risco', 'validar_previsao', 'classificar_abc'):
+            valor = parametros.get(opcao, False)
+            if isinstance(valor, str):
+                valor = valor.strip().lower() in ('1', 'true', 'sim')
+            parametros[opcao] = bool(valor)
+
+        config = parametros.get('config_manual')
+        if isinstance(config, str):
+            try:
+                parametros['config_manual'] = json.loads(config) if config else None
+            except json.JSONDecodeError:
+                raise ValueError("'config_manual' deve ser um JSON válido")
+
+        return parametros
+
+    def _enviar_json(self, resultado, tempo):
+        """Envia o resultado em JSON, em partes de algumas centenas de linhas"""
+        self._iniciar_envio('application/json; charset=utf-8')
+        cabecalho = {'linhas': len(resultado), 'tempo_s': round(tempo, 4), 'colunas': list(resultado.columns)}
+        self._escrever_parte((json.dumps(cabecalho, ensure_ascii=False)[:-1] + ', "resultado": [').encode('utf-8'))
+
+        for inicio in range(0, len(resultado), LINHAS_POR_PARTE):
+            parte = resultado.iloc[inicio:inicio + LINHAS_POR_PARTE].to_json(orient='records', force_ascii=False)
+            separador = ',' if inicio else ''
+            self._escrever_parte((separador + parte[1:-1]).encode('utf-8'))
+
+        self._escrever_parte(b']}')
+        self._finalizar_envio()
+
+    def _enviar_parquet(self, resultado):
+        """Envia o resultado em Parquet"""
+        buffer = io.BytesIO()
+        resultado.to_parquet(buffer, index=False)
+        dados = buffer.getbuffer()
+
+        self._iniciar_envio('application/vnd.apache.parquet')
+        for inicio in range(0, len(dados), TAMANHO_PARTE):
+            self._escrever_parte(bytes(dados[inicio:inicio + TAMANHO_PARTE]))
+        self._finalizar_envio()
+
+def main():
+    """Função principal."""
+    parser = argparse.ArgumentParser(description="API HTTP local para análise de estoque")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8502)
+    parser.add_argument('--trabalhadores', type=int, default=2, help="Processos de análise simultâneos")
+    parser.add_argument('--fila', type=int, default=8, help="Análises aguardando antes de recusar novas requisições")
+    parser.add_argument('--cache', type=int, default=16, help="Planilhas processadas mantidas em cache por processo")
+    parser.add_argument('--pasta-permitida', help="Ativa a leitura por caminho, restrita a esta pasta")
+    parser.add_argument('--max-corpo-mb', type=float, default=100, help="Tamanho máximo do corpo das requisições (MB)")
+    parser.add_argument('--cache-modelos', default='.cache_modelos', help="Pasta do cache de modelos de previsão")
+    parser.add_argument('--historico', help="Pasta do histórico de análises (cada resultado é acrescentado)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    servidor = ServidorAnalise(
+        (args.host, args.porta),
+        max_trabalhadores=args.trabalhadores,
+        max_fila=args.fila,
+        max_planilhas_cache=args.cache,
+        pasta_permitida=args.pasta_permitida,
+        pasta_historico=args.historico,
+        pasta_cache_modelos=args.cache_modelos,
+        max_corpo_mb=args.max_corpo_mb
+    )
+
+    print(f"🚀 API de análise em http://{args.host}:{args.porta}")
+    print("⏹️  Pressione Ctrl+C para parar")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 API encerrada pelo usuário.")
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
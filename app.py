@@ -1,9 +1,20 @@
+import hmac
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from estoque_analyzer import EstoqueAnalyzer
 from analise_avancada import AnaliseAvancada
+from cache_resultados import CacheResultados
+from cenarios import CuboCenarios
+from planejamento_compras import PlanejadorCompras
+from estoque_analyzer import EstoqueAnalyzer, calcular_hash_arquivo
+from tarefa_analise import TarefaAnalise
+from classificacao_abc import ClassificacaoABCXYZ, POLITICAS_SUGERIDAS
+from consolidacao_rede import ConsolidacaoRede
+from arquivo_resultados import ArquivoResultados
+from tabela_fatores import TabelaFatores
+from graficos import grafico_prazo, grafico_estoque_demanda, grafico_tendencia
 
 # Configuração da página
 st.set_page_config(
@@ -13,6 +24,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def obter_cache_resultados():
+    """Cache de resultados compartilhado por todas as sessões do servidor"""
+    return CacheResultados()
+
+@st.cache_resource
+def obter_arquivo_resultados():
+    """Histórico dos resultados calculados, compartilhado por todas as sessões"""
+    return ArquivoResultados()
+
+@st.cache_resource
+def obter_analise_avancada():
+    """Instância de análise avançada compartilhada entre as sessões"""
+    return AnaliseAvancada()
+
 # Título e descrição
 st.title("📊 Análise de Estoque Avançada")
 st.markdown("""
@@ -47,6 +73,48 @@ with st.sidebar:
         help="Período para calcular o estoque ideal futuro"
     )
     
+    # Simulação do risco de ruptura
+    simular_risco = st.checkbox(
+        "Simular risco de ruptura",
+        value=False,
+        help="Simula milhares de cenários de demanda com a variação histórica de cada produto para estimar a probabilidade de faltar estoque no período e o ponto de pedido"
+    )
+    
+    # Classificação ABC/XYZ
+    classificar_abc = st.selectbox(
+        "Classificação ABC/XYZ",
+        ["Não classificar", "Classificar", "Classificar e aplicar política por classe"],
+        help="ABC pelo volume de saídas (A = até 80% do total, B = até 95%) e XYZ pela variação mensal da demanda (X = estável, Z = errática). A política por classe ajusta o prazo de segurança e usa o random forest como base da demanda dos produtos Y"
+    )
+    
+    # Backtest dos métodos de previsão
+    validar_previsao = st.checkbox(
+        "Validar métodos de previsão (backtest)",
+        value=False,
+        help="Refaz as previsões dos últimos meses usando só o histórico anterior a cada mês e compara com as saídas reais. O modelo random forest é treinado a cada mês avaliado, o que torna a análise mais lenta"
+    )
+    
+    # Análise fora da memória
+    fora_da_memoria = st.checkbox(
+        "Análise fora da memória",
+        value=False,
+        help="Para históricos maiores que a memória disponível: as planilhas são lidas em blocos, divididas por produto em arquivos temporários e analisadas por partes. Conciliação, backtest e classificação ABC/XYZ não são feitos nesse modo"
+    )
+    memoria_maxima_mb = st.number_input(
+        "Limite de memória (MB)",
+        min_value=64,
+        value=1024,
+        step=64,
+        help="Memória aproximada usada por cada parte da análise"
+    ) if fora_da_memoria else None
+    
+    # Unidade registrada no histórico de análises
+    estabelecimento = st.text_input(
+        "Unidade",
+        value="",
+        help="Nome da unidade de saúde com que o resultado é guardado no histórico de análises"
+    )
+    
     st.divider()
     
     st.header("📋 Instruções")
@@ -76,6 +144,28 @@ with st.sidebar:
     - 🟢 OK: Estoque suficiente
     - 🔴 Comprar: Necessita reposição
     """)
+    
+    # Administração do cache compartilhado: afeta todas as sessões, então só aparece
+    # com ESTOQUE_SENHA_ADMIN definida e é liberada com essa senha
+    senha_admin = os.environ.get('ESTOQUE_SENHA_ADMIN')
+    if senha_admin:
+        with st.expander("🛠️ Administração do Cache"):
+            senha = st.text_input("Senha de administrador", type="password", key="senha_admin")
+            if senha and hmac.compare_digest(senha.encode('utf-8'), senha_admin.encode('utf-8')):
+                estatisticas_cache = obter_cache_resultados().estatisticas()
+                st.metric("Taxa de Acerto", f"{estatisticas_cache['taxa_acerto']:.1f}%")
+                st.metric(
+                    "Memória em Uso",
+                    f"{estatisticas_cache['bytes_usados'] / 1024**2:,.1f} MB",
+                    help=f"Limite: {estatisticas_cache['max_bytes'] / 1024**2:,.0f} MB"
+                )
+                st.caption(
+                    f"{estatisticas_cache['itens']} resultados em cache · "
+                    f"{estatisticas_cache['acertos']} acertos · {estatisticas_cache['falhas']} falhas · "
+                    f"{estatisticas_cache['expirados']} expirados · {estatisticas_cache['removidos']} removidos por memória"
+                )
+                if st.button("🗑️ Limpar cache", key="limpar_cache"):
+                    obter_cache_resultados().limpar()
 
 def criar_metricas_principais(resultado):
     """Cria métricas principais do dashboard"""
@@ -122,14 +212,48 @@ def criar_metricas_principais(resultado):
             f"{valor_total_estoque:,.0f}",
             help="Soma total de todas as quantidades em estoque"
         )
+    
+    # Métricas de validade (quando a planilha de lotes foi enviada)
+    if 'Perda por Validade no Período' in resultado:
+        col_lotes1, col_lotes2 = st.columns(2)
+        with col_lotes1:
+            st.metric(
+                "Perda por Validade no Período",
+                f"{resultado['Perda por Validade no Período'].sum():,.0f}",
+                help="Quantidade que deve vencer antes de ser consumida dentro do período de previsão (consumo FEFO)"
+            )
+        with col_lotes2:
+            st.metric(
+                "Estoque Utilizável",
+                f"{resultado['Estoque Utilizável'].sum():,.0f}",
+                help="Parte do estoque em lotes que será consumida antes de vencer"
+            )
+    
+    # Métricas de risco (quando a simulação foi solicitada)
+    if 'Probabilidade Ruptura (%)' in resultado:
+        risco_alto = int((resultado['Probabilidade Ruptura (%)'] >= 50).sum())
+        col5, col6 = st.columns(2)
+        with col5:
+            st.metric(
+                "Risco de Ruptura ≥ 50%",
+                risco_alto,
+                delta=f"{risco_alto/total_produtos*100:.1f}%",
+                delta_color="inverse",
+                help="Produtos com probabilidade de faltar estoque no período de pelo menos 50%"
+            )
+        with col6:
+            st.metric(
+                "Nível de Serviço Médio",
+                f"{resultado['Nível de Serviço (%)'].mean():.1f}%",
+                help="Probabilidade média de atender toda a demanda do período sem ruptura"
+            )
 
 def exibir_recomendacoes(resultado):
     """Exibe recomendações baseadas na análise"""
     if resultado is None or len(resultado) == 0:
         return
     
-    analise = AnaliseAvancada()
-    recomendacoes = analise.gerar_recomendacoes(resultado)
+    recomendacoes = obter_analise_avancada().gerar_recomendacoes(resultado)
     
     st.subheader("💡 Recomendações Inteligentes")
     
@@ -154,6 +278,16 @@ def exibir_tabela_resultados(resultado):
             return 'background-color: #ffcccc; color: #cc0000; font-weight: bold'
         return 'background-color: #ccffcc; color: #006600; font-weight: bold'
     
+    # Filtros por classe ABC/XYZ
+    if 'Classe ABC' in resultado:
+        col_abc, col_xyz = st.columns(2)
+        with col_abc:
+            filtro_abc = st.multiselect("Classe ABC", ['A', 'B', 'C'], default=['A', 'B', 'C'], key="filtro_abc")
+        with col_xyz:
+            filtro_xyz = st.multiselect("Classe XYZ", ['X', 'Y', 'Z'], default=['X', 'Y', 'Z'], key="filtro_xyz")
+        resultado = resultado[resultado['Classe ABC'].isin(filtro_abc) & resultado['Classe XYZ'].isin(filtro_xyz)]
+        st.caption(f"{len(resultado)} produtos nas classes selecionadas")
+    
     # Formatar números
     resultado_formatado = resultado.copy()
     resultado_formatado['Quantidade em estoque'] = resultado_formatado['Quantidade em estoque'].apply(lambda x: f"{x:,.0f}")
@@ -163,6 +297,10 @@ def exibir_tabela_resultados(resultado):
     resultado_formatado['Prazo Estoque (dias)'] = resultado_formatado['Prazo Estoque (dias)'].apply(lambda x: f"{x:,.1f}")
     resultado_formatado['Quantidade Sugerida Compra'] = resultado_formatado['Quantidade Sugerida Compra'].apply(lambda x: f"{x:,.2f}")
     resultado_formatado['Estoque Ideal Futuro'] = resultado_formatado['Estoque Ideal Futuro'].apply(lambda x: f"{x:,.2f}")
+    if 'Probabilidade Ruptura (%)' in resultado_formatado:
+        resultado_formatado['Probabilidade Ruptura (%)'] = resultado_formatado['Probabilidade Ruptura (%)'].apply(lambda x: f"{x:,.1f}%")
+        resultado_formatado['Nível de Serviço (%)'] = resultado_formatado['Nível de Serviço (%)'].apply(lambda x: f"{x:,.1f}%")
+        resultado_formatado['Ponto de Pedido'] = resultado_formatado['Ponto de Pedido'].apply(lambda x: f"{x:,.2f}")
     
     # Exibir tabela com formatação
     st.dataframe(
@@ -171,6 +309,285 @@ def exibir_tabela_resultados(resultado):
         hide_index=True
     )
 
+def exibir_validacao_previsao(resultado):
+    """Resume o backtest dos métodos de previsão por tipo de produto"""
+    validados = resultado[resultado['Melhor Método Previsão'].notna()]
+    with st.expander(f"🎯 Validação das previsões ({len(validados)} produtos com histórico suficiente)"):
+        if len(validados) == 0:
+            st.write("Nenhum produto tem meses de saída suficientes para o backtest.")
+            return
+        st.write("Erro do método mais preciso de cada produto nos meses já realizados (viés positivo = previsão acima da saída real).")
+        resumo = validados.groupby(['Tipo Produto', 'Melhor Método Previsão']).agg(
+            Produtos=('Código', 'size'),
+            MAE=('MAE Previsão', 'mean'),
+            **{'MAPE (%)': ('MAPE Previsão (%)', 'mean')},
+            **{'Viés': ('Viés Previsão', 'mean')}
+        ).round(2).reset_index()
+        st.dataframe(resumo, use_container_width=True, hide_index=True)
+
+def exibir_graficos(resultado, chave_resultado):
+    """Gráficos do resultado, agregados e amostrados no servidor para catálogos grandes"""
+    st.subheader("📈 Gráficos")
+    aba_prazo, aba_dispersao, aba_tendencia = st.tabs(["Cobertura", "Estoque × Demanda", "Tendência de Saídas"])
+    
+    with aba_prazo:
+        limite = st.slider("Prazo máximo exibido (dias)", 30, 730, 365, step=15, key="grafico_limite_prazo")
+        st.plotly_chart(grafico_prazo(resultado, limite=limite), use_container_width=True)
+    
+    with aba_dispersao:
+        st.plotly_chart(grafico_estoque_demanda(resultado), use_container_width=True)
+    
+    with aba_tendencia:
+        saidas_mensais = obter_cache_resultados().obter(chave_resultado + ':saidas', contabilizar=False)
+        if saidas_mensais is None:
+            st.info("O histórico mensal desta análise não está disponível. Clique em 'Analisar Estoque' novamente para ver a tendência.")
+            return
+        principais = resultado.nlargest(5, 'Média de Saída Mensal')['Código'].astype(str)
+        codigos = st.text_input(
+            "Códigos para destacar (separados por vírgula)",
+            value=", ".join(principais),
+            key="grafico_codigos"
+        )
+        codigos = [c.strip() for c in codigos.split(',') if c.strip()]
+        st.plotly_chart(grafico_tendencia(saidas_mensais, codigos), use_container_width=True)
+
+def exibir_conciliacao(resultado):
+    """Lista os produtos associados pela descrição para revisão"""
+    conciliados = resultado[resultado['Score Conciliação'].notna()]
+    with st.expander(f"🔗 Produtos conciliados pela descrição ({len(conciliados)})"):
+        if len(conciliados) == 0:
+            st.write("Nenhum produto com código diferente foi conciliado.")
+            return
+        st.write("Revise os pares abaixo: as saídas do código da planilha de saídas foram atribuídas ao código do estoque.")
+        st.dataframe(
+            conciliados[['Código', 'Código Saídas Conciliado', 'Descrição', 'Score Conciliação', 'Situação']]
+            .sort_values('Score Conciliação'),
+            use_container_width=True
+        )
+
+@st.cache_resource(max_entries=4, ttl=3600)
+def obter_cubo_cenarios(chave_resultado, lista_pacientes, lista_periodos, lista_tipos, aplicar_politicas=False):
+    """Calcula (uma vez por resultado e grade) o cubo de cenários compartilhado entre sessões
+    
+    Usa a tabela de fatores e as políticas por classe da análise, para que o cenário
+    com os parâmetros dela reproduza o resultado.
+    """
+    cache = obter_cache_resultados()
+    resultado = cache.obter(chave_resultado, contabilizar=False)
+    if resultado is None:
+        return None
+    
+    analise = obter_analise_avancada()
+    regras = cache.obter(chave_resultado + ':fatores', contabilizar=False)
+    if regras is not None:
+        analise = AnaliseAvancada()
+        analise.configurar_tipo_produto(None, tabela_fatores=TabelaFatores(regras))
+    classificacao = ClassificacaoABCXYZ(politicas=POLITICAS_SUGERIDAS) if aplicar_politicas else None
+    return CuboCenarios(resultado, lista_pacientes, lista_periodos, lista_tipos, analise, classificacao=classificacao)
+
+def exibir_simulacao_cenarios(chave_resultado):
+    """Compara o resultado sob vários cenários de pacientes, período e tipo de produto"""
+    st.subheader("🧪 Simulação de Cenários")
+    
+    with st.expander("Comparar cenários de pacientes, período de previsão e tipo de produto"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            texto_pacientes = st.text_input("Médias de pacientes (separadas por vírgula)", value="500, 1000, 1500, 2000")
+        with col2:
+            lista_periodos = st.multiselect("Períodos de previsão (dias)", [30, 60, 90, 180, 365], default=[30, 90, 180])
+        with col3:
+            lista_tipos = st.multiselect(
+                "Tipos de produto",
+                ["medicamentos", "insumos", "equipamentos"],
+                default=["medicamentos", "insumos", "equipamentos"]
+            )
+        
+        try:
+            lista_pacientes = sorted({int(v) for v in texto_pacientes.replace(';', ',').split(',') if v.strip()})
+        except ValueError:
+            st.error("❌ Informe as médias de pacientes como números separados por vírgula.")
+            return
+        
+        if not lista_pacientes or not lista_periodos or not lista_tipos:
+            st.info("Selecione ao menos um valor de cada parâmetro.")
+            return
+        
+        cubo = obter_cubo_cenarios(
+            chave_resultado, tuple(lista_pacientes), tuple(lista_periodos), tuple(lista_tipos),
+            st.session_state.get('classificar_abc') == "Classificar e aplicar política por classe"
+        )
+        if cubo is None:
+            return
+        
+        st.caption(f"{len(cubo.produtos):,} produtos × {len(cubo.cenarios)} cenários ({cubo.nbytes / 1024**2:,.1f} MB)")
+        st.dataframe(cubo.resumo(), use_container_width=True, hide_index=True)
+        
+        # Detalhar um cenário específico (fatia do cubo, sem recalcular)
+        col4, col5, col6 = st.columns(3)
+        with col4:
+            pacientes = st.selectbox("Pacientes", lista_pacientes, key="cenario_pacientes")
+        with col5:
+            periodo = st.selectbox("Período", lista_periodos, format_func=lambda x: f"{x} dias", key="cenario_periodo")
+        with col6:
+            tipo = st.selectbox("Tipo", lista_tipos, key="cenario_tipo")
+        
+        st.dataframe(cubo.fatiar_cenario(pacientes, periodo, tipo), use_container_width=True, hide_index=True)
+
+def exibir_planejamento_compras(resultado):
+    """Distribui um orçamento de compras entre os produtos"""
+    st.subheader("💰 Planejamento de Compras com Orçamento")
+    
+    with st.expander("Gerar plano de compras a partir de preços e orçamento"):
+        precos_file = st.file_uploader(
+            "Planilha de preços (código e preço unitário)",
+            type=['xlsx', 'xls', 'csv'],
+            key="precos"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            orcamento = st.number_input("Orçamento total", min_value=0.0, value=10000.0, step=1000.0)
+        with col2:
+            st.write("Prioridade por tipo de produto")
+            pesos_tipo = {
+                tipo: st.slider(tipo.title(), 0.5, 3.0, 1.0, 0.5, key=f"peso_{tipo}")
+                for tipo in ["medicamentos", "insumos", "equipamentos"]
+            }
+        
+        if precos_file is None:
+            st.info("Envie a planilha de preços para gerar o plano.")
+            return
+        
+        planejador = PlanejadorCompras()
+        precos = planejador.carregar_precos(precos_file)
+        if precos is None or len(precos) == 0:
+            st.error("❌ Não foi possível ler os preços. Verifique as colunas de código e preço.")
+            return
+        
+        plano = planejador.planejar(resultado, precos, orcamento, pesos_tipo)
+        resumo = planejador.resumir(plano, orcamento)
+        
+        col3, col4, col5, col6 = st.columns(4)
+        col3.metric("Custo do Plano", f"{resumo['custo_total']:,.2f}")
+        col4.metric("Produtos Comprados", resumo['produtos_comprados'])
+        col5.metric(
+            "Dias de Ruptura",
+            f"{resumo['dias_ruptura_depois']:,.0f}",
+            delta=f"{resumo['dias_ruptura_depois'] - resumo['dias_ruptura_antes']:,.0f}",
+            delta_color="inverse"
+        )
+        col6.metric("Produtos sem Preço", resumo['produtos_sem_preco'])
+        
+        st.dataframe(plano[plano['Quantidade Planejada'] > 0], use_container_width=True, hide_index=True)
+
+def exibir_consolidacao_rede():
+    """Painel regional: consolida os resultados exportados de várias unidades"""
+    st.subheader("🏥 Consolidação da Rede")
+    
+    with st.expander("Consolidar resultados de várias unidades de saúde"):
+        arquivos = st.file_uploader(
+            "Resultados exportados (um arquivo por unidade; o nome do arquivo identifica a unidade)",
+            type=['xlsx'],
+            accept_multiple_files=True,
+            key="rede"
+        )
+        
+        # Consolidação mantida na sessão: só unidades novas, alteradas ou removidas são processadas
+        consolidacao = st.session_state.setdefault('consolidacao_rede', ConsolidacaoRede())
+        hashes = st.session_state.setdefault('hashes_rede', {})
+        
+        atuais = {}
+        for arquivo in arquivos or []:
+            nome = arquivo.name.rsplit('.', 1)[0]
+            atuais[nome] = calcular_hash_arquivo(arquivo)
+            if hashes.get(nome) != atuais[nome]:
+                try:
+                    consolidacao.atualizar(nome, pd.read_excel(arquivo, sheet_name=0))
+                    hashes[nome] = atuais[nome]
+                except Exception as e:
+                    st.error(f"❌ Não foi possível consolidar '{arquivo.name}': {e}")
+        for nome in set(hashes) - set(atuais):
+            consolidacao.remover(nome)
+            del hashes[nome]
+        
+        if len(consolidacao.estabelecimentos) == 0:
+            st.info("Envie os resultados exportados de pelo menos uma unidade.")
+            return
+        
+        totais = consolidacao.totais_produtos()
+        transferencias = consolidacao.candidatos_transferencia()
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Unidades", len(consolidacao.estabelecimentos))
+        col2.metric("Produtos na Rede", len(totais))
+        col3.metric("Produtos em Falta na Rede", int((totais['Falta'] > totais['Excedente']).sum()))
+        col4.metric("Transferências Sugeridas", len(transferencias))
+        
+        st.write("**Situação por unidade**")
+        st.dataframe(
+            consolidacao.resumo(('Estabelecimento', 'Situação'))[['Produtos', 'Falta', 'Excedente']]
+            .unstack('Situação', fill_value=0),
+            use_container_width=True
+        )
+        
+        st.write("**Produtos com maior falta na rede**")
+        st.dataframe(
+            totais.nlargest(20, 'Falta').round(2),
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        if len(transferencias) > 0:
+            st.write("**Transferências sugeridas (excedente de uma unidade para a falta de outra)**")
+            st.dataframe(transferencias, use_container_width=True, hide_index=True)
+
+def exibir_historico():
+    """Evolução de um produto nas análises anteriores guardadas no histórico"""
+    st.subheader("🕒 Histórico de Análises")
+    
+    with st.expander("Consultar a evolução de um produto nas últimas análises"):
+        arquivo = obter_arquivo_resultados()
+        execucoes = arquivo.execucoes()
+        if len(execucoes) == 0:
+            st.info("Nenhuma análise no histórico ainda. Cada análise concluída é guardada automaticamente.")
+            return
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            codigo = st.text_input("Código do produto", key="historico_codigo")
+        with col2:
+            coluna = st.selectbox(
+                "Indicador",
+                ['Prazo Estoque (dias)', 'Quantidade em estoque', 'Demanda Esperada',
+                 'Estoque Restante Estimado', 'Quantidade Sugerida Compra'],
+                key="historico_coluna"
+            )
+        with col3:
+            unidades = sorted(execucoes['Estabelecimento'].unique())
+            selecionadas = st.multiselect(
+                "Unidades",
+                unidades,
+                format_func=lambda nome: nome or "(sem nome)",
+                key="historico_unidades"
+            )
+        with col4:
+            ultimas = st.number_input("Últimas análises", min_value=1, value=12, key="historico_ultimas")
+        
+        st.caption(
+            f"{len(execucoes)} análises de {len(unidades)} unidades no histórico, "
+            f"de {execucoes['Execução'].min():%d/%m/%Y} a {execucoes['Execução'].max():%d/%m/%Y}"
+        )
+        if not codigo.strip():
+            return
+        
+        evolucao = arquivo.historico(codigo.strip(), coluna, selecionadas or None, int(ultimas))
+        if evolucao.empty:
+            st.warning(f"O produto {codigo.strip()} não aparece nas análises selecionadas.")
+            return
+        evolucao.columns = [nome or "(sem nome)" for nome in evolucao.columns]
+        # Prazo infinito (sem demanda) fica fora do gráfico
+        st.line_chart(evolucao.replace([np.inf, -np.inf], np.nan))
+        st.dataframe(evolucao.round(2), use_container_width=True)
+
 def exportar_excel(resultado):
     """Exporta os resultados para um arquivo Excel"""
     try:
@@ -204,6 +621,68 @@ def exportar_excel(resultado):
     except Exception as e:
         st.error(f"❌ Erro ao exportar arquivo: {str(e)}")
 
+NOMES_ETAPAS = {
+    'carregar': 'Carregando planilhas',
+    'detectar': 'Detectando início dos dados',
+    'mapear': 'Mapeando colunas',
+    'juntar': 'Cruzando produtos das planilhas',
+    'calcular': 'Calculando indicadores'
+}
+
+def publicar_resultado(chave, parametros):
+    """Associa a sessão a um resultado do cache compartilhado"""
+    st.session_state['chave_resultado'] = chave
+    st.session_state['analise_feita'] = True
+    st.session_state['tipo_produto'] = parametros['tipo_produto']
+    st.session_state['media_pacientes'] = parametros['media_pacientes']
+    st.session_state['periodo_previsao'] = parametros['periodo_previsao']
+    st.session_state['classificar_abc'] = parametros['classificar_abc']
+
+def exibir_criticos_parciais(parcial, limite=100):
+    """Itens a comprar já calculados, do mais urgente ao menos urgente"""
+    if parcial is None or parcial.empty:
+        return
+    criticos = parcial[parcial['Situação'] == 'Comprar']
+    colunas = ['Código', 'Descrição', 'Quantidade em estoque', 'Demanda Esperada',
+               'Estoque Restante Estimado', 'Quantidade Sugerida Compra']
+    if 'Probabilidade Ruptura (%)' in parcial.columns:
+        colunas.append('Probabilidade Ruptura (%)')
+    st.caption(f"🚨 {len(criticos):,} produtos para comprar entre os {len(parcial):,} já calculados")
+    if not criticos.empty:
+        st.dataframe(criticos[colunas].head(limite), hide_index=True, use_container_width=True)
+
+@st.fragment(run_every=1)
+def acompanhar_tarefa():
+    """Exibe o progresso da análise em segundo plano e publica o resultado ao terminar"""
+    tarefa = st.session_state.get('tarefa')
+    if tarefa is None:
+        return
+    
+    if tarefa.em_andamento:
+        etapa, fracao = tarefa.progresso()
+        texto = NOMES_ETAPAS.get(etapa, 'Iniciando análise')
+        if tarefa.cancelamento.is_set():
+            texto = 'Cancelando análise'
+        st.progress(fracao, text=f"⏳ {texto}... ({fracao*100:.0f}%)")
+        if st.button("⏹️ Cancelar análise", key="cancelar_analise", disabled=tarefa.cancelamento.is_set()):
+            tarefa.cancelar()
+        exibir_criticos_parciais(tarefa.resultado_parcial())
+        return
+    
+    # Tarefa encerrada: publicar o resultado na sessão e recarregar a página
+    del st.session_state['tarefa']
+    if tarefa.status == 'concluida':
+        if obter_cache_resultados().obter(tarefa.chave_cache, contabilizar=False) is None:
+            st.session_state['mensagem_tarefa'] = ('error', "❌ O resultado excede o limite de memória do cache compartilhado.")
+        else:
+            publicar_resultado(tarefa.chave_cache, tarefa.parametros)
+            st.session_state['mensagem_tarefa'] = ('success', f"✅ Análise concluída em {tarefa.fim - tarefa.inicio:.1f}s.")
+    elif tarefa.status == 'cancelada':
+        st.session_state['mensagem_tarefa'] = ('warning', "⏹️ Análise cancelada.")
+    else:
+        st.session_state['mensagem_tarefa'] = ('error', f"❌ {tarefa.erro}")
+    st.rerun()
+
 def main():
     # Upload das planilhas
     col1, col2 = st.columns(2)
@@ -220,10 +699,19 @@ def main():
         st.subheader("📁 Upload - Saídas Mensais")
         saidas_file = st.file_uploader(
             "Selecione a planilha de saídas mensais",
-            type=['xlsx', 'xls'],
-            key="saidas"
+            type=['xlsx', 'xls', 'csv'],
+            key="saidas",
+            help="Planilha de saídas mensais ou razão de dispensações (CSV ou Excel, ative a opção na configuração manual)"
         )
     
+    # Lotes e validades (opcional): consumo por ordem de vencimento
+    lotes_file = st.file_uploader(
+        "Planilha de lotes e validades (opcional: código, lote, validade e quantidade)",
+        type=['xlsx', 'xls', 'csv'],
+        key="lotes",
+        help="Com os lotes, a análise projeta a perda por validade e o prazo efetivo do estoque consumindo primeiro o que vence antes"
+    )
+    
     # Configuração manual (opcional)
     st.markdown("---")
     st.subheader("⚙️ Configuração Manual (opcional)")
@@ -245,43 +733,104 @@ def main():
             config_manual['mapeamento_estoque'] = parse_mapeamento(mapeamento_estoque)
         if mapeamento_saidas:
             config_manual['mapeamento_saidas'] = parse_mapeamento(mapeamento_saidas)
+        if st.checkbox(
+            "A planilha de saídas é um razão de dispensações (uma linha por saída, com data)",
+            value=False,
+            help="O razão é lido em blocos e agregado em saídas mensais por produto, sem carregar o arquivo inteiro na memória"
+        ):
+            config_manual['razao_saidas'] = True
+        fatores_file = st.file_uploader(
+            "Tabela de fatores de correção (opcional: por tipo, categoria ou código)",
+            type=['xlsx', 'xls', 'csv'],
+            key="fatores",
+            help="Colunas: codigo, categoria, tipo_produto, fator_paciente, fator_sazonal, estoque_minimo, prazo_seguranca. Permite misturar medicamentos, insumos e equipamentos na mesma análise"
+        )
+        conciliar = st.checkbox(
+            "Conciliar produtos com códigos diferentes pela descrição",
+            value=False,
+            help="Associa produtos sem código correspondente nas duas planilhas quando descrição e unidade são muito parecidas"
+        )
     
     # Botão de análise
     if st.button("🔍 Analisar Estoque", type="primary", use_container_width=True):
-        if estoque_file is None or saidas_file is None:
+        tarefa = st.session_state.get('tarefa')
+        if tarefa is not None and tarefa.em_andamento:
+            # Nunca iniciar uma segunda análise: acompanhar a que já está rodando
+            st.info("ℹ️ Já existe uma análise em andamento. Acompanhe o progresso abaixo ou cancele-a.")
+        elif estoque_file is None or saidas_file is None:
             st.error("❌ Por favor, faça upload de ambas as planilhas para continuar.")
             return
-        
-        try:
-            with st.spinner("Analisando dados com análise avançada..."):
-                analyzer = EstoqueAnalyzer()
-                resultado = analyzer.analisar_estoque(
-                    estoque_file, 
-                    saidas_file, 
-                    config_manual if config_manual else None,
+        else:
+            # Reaproveitar o resultado de qualquer sessão que já analisou os mesmos arquivos
+            cache = obter_cache_resultados()
+            parametros = {
+                'config_manual': config_manual if config_manual else None,
+                'tipo_produto': tipo_produto,
+                'media_pacientes': media_pacientes,
+                'periodo_previsao': periodo_previsao,
+                'conciliar': conciliar,
+                'simular_risco': simular_risco,
+                'validar_previsao': validar_previsao,
+                'classificar_abc': classificar_abc,
+                'memoria_maxima_mb': memoria_maxima_mb,
+                'lotes': calcular_hash_arquivo(lotes_file) if lotes_file is not None else None,
+                'fatores': calcular_hash_arquivo(fatores_file) if fatores_file is not None else None
+            }
+            chave = cache.gerar_chave(
+                calcular_hash_arquivo(estoque_file),
+                calcular_hash_arquivo(saidas_file),
+                parametros
+            )
+            
+            resultado_cache = cache.obter(chave)
+            if resultado_cache is not None:
+                # Resultado do cache já arquivado com a mesma chave não é gravado de novo
+                try:
+                    obter_arquivo_resultados().gravar(resultado_cache, estabelecimento, chave=chave)
+                except Exception as e:
+                    st.warning(f"⚠️ Não foi possível arquivar o resultado: {str(e)}")
+                publicar_resultado(chave, parametros)
+                st.success("⚡ Resultado reaproveitado do cache compartilhado.")
+            else:
+                st.session_state['tarefa'] = TarefaAnalise(
+                    estoque_file,
+                    saidas_file,
+                    parametros['config_manual'],
                     tipo_produto,
                     media_pacientes,
-                    periodo_previsao
-                )
-                
-                if resultado is None:
-                    st.error("❌ Erro ao processar os arquivos. Verifique se as colunas estão corretas ou ajuste manualmente.")
-                    return
-                
-                # Salvar resultado na sessão
-                st.session_state['resultado'] = resultado
-                st.session_state['analise_feita'] = True
-                st.session_state['tipo_produto'] = tipo_produto
-                st.session_state['media_pacientes'] = media_pacientes
-                st.session_state['periodo_previsao'] = periodo_previsao
-                
-        except Exception as e:
-            st.error(f"❌ Erro durante a análise: {str(e)}")
-            st.exception(e)
+                    periodo_previsao,
+                    analyzer=EstoqueAnalyzer(pasta_cache_modelos='.cache_modelos'),
+                    cache=cache,
+                    chave_cache=chave,
+                    conciliar=conciliar,
+                    simular_risco=simular_risco,
+                    validar_previsao=validar_previsao,
+                    classificar_abc={
+                        "Classificar": True,
+                        "Classificar e aplicar política por classe": ClassificacaoABCXYZ(politicas=POLITICAS_SUGERIDAS)
+                    }.get(classificar_abc, False),
+                    memoria_maxima_mb=memoria_maxima_mb,
+                    lotes_file=lotes_file,
+                    fatores_file=fatores_file,
+                    arquivo=obter_arquivo_resultados(),
+                    estabelecimento=estabelecimento
+                ).iniciar()
+    
+    # Acompanhar análise em segundo plano (sobrevive a interações com os widgets)
+    if 'tarefa' in st.session_state:
+        acompanhar_tarefa()
+    
+    if 'mensagem_tarefa' in st.session_state:
+        tipo_mensagem, mensagem = st.session_state.pop('mensagem_tarefa')
+        getattr(st, tipo_mensagem)(mensagem)
     
     # Mostrar resultados se já foram calculados
     if 'analise_feita' in st.session_state and st.session_state['analise_feita']:
-        resultado = st.session_state['resultado']
+        resultado = obter_cache_resultados().obter(st.session_state['chave_resultado'], contabilizar=False)
+        if resultado is None:
+            st.session_state['analise_feita'] = False
+            st.warning("⌛ O resultado desta análise expirou do cache. Clique em 'Analisar Estoque' novamente.")
+            return
         
         # Informações da análise
         st.markdown("---")
@@ -307,6 +856,26 @@ def main():
         st.markdown("---")
         exibir_tabela_resultados(resultado)
         
+        # Gráficos
+        st.markdown("---")
+        exibir_graficos(resultado, st.session_state['chave_resultado'])
+        
+        # Produtos conciliados pela descrição
+        if 'Score Conciliação' in resultado:
+            exibir_conciliacao(resultado)
+        
+        # Backtest dos métodos de previsão
+        if 'Melhor Método Previsão' in resultado:
+            exibir_validacao_previsao(resultado)
+        
+        # Simulação de cenários
+        st.markdown("---")
+        exibir_simulacao_cenarios(st.session_state['chave_resultado'])
+        
+        # Planejamento de compras com orçamento
+        st.markdown("---")
+        exibir_planejamento_compras(resultado)
+        
         # Botão de exportação
         st.divider()
         col1, col2 = st.columns([1, 3])
@@ -317,6 +886,14 @@ def main():
         
         with col2:
             st.info("💡 Dica: Clique em 'Exportar para Excel' para baixar os resultados da análise avançada.")
+    
+    # Consolidação de várias unidades (independe da análise atual)
+    st.markdown("---")
+    exibir_consolidacao_rede()
+    
+    # Histórico das análises anteriores (independe da análise atual)
+    st.markdown("---")
+    exibir_historico()
 
 def parse_mapeamento(texto):
     """Parse do mapeamento manual de colunas"""
@@ -0,0 +1,277 @@
+import bisect
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+class ArquivoResultados:
+    """Histórico dos resultados de análise em arquivos Arrow IPC, somente acréscimo
+
+    Cada execução é gravada uma única vez em um arquivo Arrow IPC sem compressão,
+    com as linhas ordenadas pelo código, e nunca é alterada depois. O índice das
+    execuções (data, estabelecimento, chave, arquivo) fica em indice.arrow e é
+    conciliado com os arquivos da pasta (execuções gravadas ou removidas por outros
+    processos) só quando a pasta muda. As consultas mapeiam os arquivos em memória e
+    leem só as colunas pedidas; as linhas de um código são encontradas por busca
+    binária na coluna ordenada, sem cópia.
+
+    Um resultado com a mesma chave (ex.: a do cache de resultados) e o mesmo
+    estabelecimento de uma execução já arquivada não é gravado de novo. Por
+    estabelecimento, são mantidas no máximo max_execucoes execuções e nenhuma com
+    mais de max_idade_dias dias (None desativa cada limite).
+    """
+
+    INDICE = 'indice.arrow'
+    PREFIXO = 'execucao_'
+    EXTENSAO = '.arrow'
+
+    def __init__(self, pasta='.arquivo_resultados', max_execucoes=200, max_idade_dias=365):
+        self.pasta = pasta
+        self.max_execucoes = max_execucoes
+        self.max_idade_dias = max_idade_dias
+        self.trava = threading.Lock()
+        os.makedirs(self.pasta, exist_ok=True)
+        # Índice em memória e a data de modificação da pasta quando ele foi conciliado
+        self._indice = None
+        self._mtime_pasta = None
+
+    def _abrir(self, nome):
+        """Tabela de um arquivo mapeado em memória (as colunas não são lidas até serem usadas)"""
+        with pa.memory_map(os.path.join(self.pasta, nome), 'r') as fonte:
+            return pa.ipc.open_file(fonte).read_all()
+
+    def _escrever(self, nome, tabela):
+        caminho = os.path.join(self.pasta, nome)
+        temporario = os.path.join(self.pasta, f".{nome}.tmp")
+        conciliado = os.stat(self.pasta).st_mtime_ns == self._mtime_pasta
+        with pa.OSFile(temporario, 'wb') as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+        # Renomear ao final para nunca expor um arquivo parcial
+        os.replace(temporario, caminho)
+        if conciliado:
+            # A pasta só mudou pela própria escrita: o índice em memória continua válido
+            self._mtime_pasta = os.stat(self.pasta).st_mtime_ns
+
+    def _preparar(self, resultado):
+        """Converte o resultado em tabela Arrow ordenada pelo código"""
+        tabela = resultado.copy()
+        tabela['Código'] = tabela['Código'].astype(str)
+        # Colunas de texto com valores mistos (códigos numéricos, NaN) ficam como texto ou nulo
+        for coluna in tabela.columns[tabela.dtypes == object]:
+            serie = tabela[coluna]
+            tabela[coluna] = serie.where(serie.isna(), serie.astype(str))
+        tabela = tabela.sort_values('Código', kind='stable')
+        return pa.Table.from_pandas(tabela, preserve_index=False)
+
+    def gravar(self, resultado, estabelecimento='', execucao=None, chave=None):
+        """Acrescenta o resultado de uma execução ao histórico e retorna a data da execução
+
+        Com chave, um resultado já arquivado para o mesmo estabelecimento não é
+        gravado de novo (retorna a data da execução existente).
+        """
+        execucao = pd.Timestamp(execucao) if execucao is not None else pd.Timestamp.now()
+        estabelecimento = str(estabelecimento or '')
+        chave = str(chave or '')
+
+        if chave:
+            with self.trava:
+                indice = self._carregar_indice()
+            existente = indice[(indice['Chave'] == chave) & (indice['Estabelecimento'] == estabelecimento)]
+            if len(existente):
+                logger.info(f"Resultado já arquivado em {existente['Execução'].iloc[-1]} ('{estabelecimento}')")
+                return existente['Execução'].iloc[-1]
+
+        nome = f"{self.PREFIXO}{execucao:%Y%m%d_%H%M%S_%f}_{uuid.uuid4().hex[:8]}{self.EXTENSAO}"
+        tabela = self._preparar(resultado)
+        tabela = tabela.replace_schema_metadata({
+            **(tabela.schema.metadata or {}),
+            b'execucao': execucao.isoformat().encode('utf-8'),
+            b'estabelecimento': estabelecimento.encode('utf-8'),
+            b'chave': chave.encode('utf-8')
+        })
+        self._escrever(nome, tabela)
+
+        with self.trava:
+            indice = self._carregar_indice()
+            if nome not in set(indice['Arquivo']):
+                entrada = pd.DataFrame({
+                    'Execução': [execucao],
+                    'Estabelecimento': [estabelecimento],
+                    'Chave': [chave],
+                    'Arquivo': [nome],
+                    'Produtos': [len(tabela)]
+                })
+                indice = pd.concat([indice, entrada], ignore_index=True)
+            self._aplicar_retencao(indice, estabelecimento)
+
+        logger.info(f"Execução de {execucao} ('{estabelecimento}') arquivada com {len(tabela)} produtos")
+        return execucao
+
+    def _aplicar_retencao(self, indice, estabelecimento):
+        """Remove as execuções do estabelecimento além dos limites e grava o índice"""
+        do_estabelecimento = indice[indice['Estabelecimento'] == estabelecimento].sort_values('Execução', kind='stable')
+        remover = pd.Series(False, index=do_estabelecimento.index)
+        if self.max_idade_dias is not None:
+            limite = pd.Timestamp.now() - pd.Timedelta(days=self.max_idade_dias)
+            remover |= do_estabelecimento['Execução'] < limite
+        if self.max_execucoes is not None:
+            remover.iloc[:max(len(do_estabelecimento) - self.max_execucoes, 0)] = True
+
+        removidas = do_estabelecimento.loc[remover[remover].index, 'Arquivo']
+        for nome in removidas:
+            try:
+                os.remove(os.path.join(self.pasta, nome))
+            except OSError:
+                pass
+        if len(removidas):
+            logger.info(f"{len(removidas)} execuções antigas de '{estabelecimento}' removidas do histórico")
+        return self._gravar_indice(indice[~indice['Arquivo'].isin(set(removidas))])
+
+    def _ler_indice(self):
+        caminho = os.path.join(self.pasta, self.INDICE)
+        if not os.path.exists(caminho):
+            return pd.DataFrame({
+                'Execução': pd.Series(dtype='datetime64[us]'),
+                'Estabelecimento': pd.Series(dtype=object),
+                'Chave': pd.Series(dtype=object),
+                'Arquivo': pd.Series(dtype=object),
+                'Produtos': pd.Series(dtype='int64')
+            })
+        indice = self._abrir(self.INDICE).to_pandas()
+        if 'Chave' not in indice:
+            # Índices gravados antes da chave
+            indice.insert(2, 'Chave', '')
+        return indice
+
+    def _gravar_indice(self, indice):
+        indice = indice.sort_values(['Execução', 'Arquivo'], kind='stable').reset_index(drop=True)
+        self._escrever(self.INDICE, pa.Table.from_pandas(indice, preserve_index=False))
+        self._indice = indice
+        return indice
+
+    def _carregar_indice(self):
+        """Índice das execuções, conciliado com a pasta só quando ela mudou desde a última leitura"""
+        mtime = os.stat(self.pasta).st_mtime_ns
+        if self._indice is not None and mtime == self._mtime_pasta:
+            return self._indice
+
+        indice = self._ler_indice()
+        presentes = {
+            nome for nome in os.listdir(self.pasta)
+            if nome.startswith(self.PREFIXO) and nome.endswith(self.EXTENSAO)
+        }
+        # Execuções removidas (retenção em outro processo) saem do índice
+        alterado = not indice['Arquivo'].isin(presentes).all()
+        indice = indice[indice['Arquivo'].isin(presentes)]
+
+        novos = []
+        for nome in sorted(presentes - set(indice['Arquivo'])):
+            try:
+                with pa.memory_map(os.path.join(self.pasta, nome), 'r') as fonte:
+                    leitor = pa.ipc.open_file(fonte)
+                    metadados = leitor.schema.metadata or {}
+                    linhas = sum(leitor.get_batch(i).num_rows for i in range(leitor.num_record_batches))
+            except (OSError, pa.ArrowInvalid) as e:
+                logger.warning(f"Arquivo de execução ignorado ({nome}): {str(e)}")
+                continue
+            novos.append({
+                'Execução': pd.Timestamp(metadados.get(b'execucao', b'').decode('utf-8') or None),
+                'Estabelecimento': metadados.get(b'estabelecimento', b'').decode('utf-8'),
+                'Chave': metadados.get(b'chave', b'').decode('utf-8'),
+                'Arquivo': nome,
+                'Produtos': linhas
+            })
+        if novos:
+            indice = pd.concat([indice, pd.DataFrame(novos)], ignore_index=True)
+        # Data lida antes da varredura: uma gravação durante ela força nova conciliação
+        self._mtime_pasta = mtime
+        if novos or alterado:
+            return self._gravar_indice(indice)
+        self._indice = indice.reset_index(drop=True)
+        return self._indice
+
+    def execucoes(self, estabelecimento=None, inicio=None, fim=None, ultimas=None):
+        """Execuções arquivadas, da mais antiga à mais recente
+
+        estabelecimento: um nome ou lista de nomes; ultimas: quantidade de execuções
+        mais recentes mantidas por estabelecimento.
+        """
+        with self.trava:
+            indice = self._carregar_indice()
+        if estabelecimento is not None:
+            nomes = [estabelecimento] if isinstance(estabelecimento, str) else list(estabelecimento)
+            indice = indice[indice['Estabelecimento'].isin(nomes)]
+        if inicio is not None:
+            indice = indice[indice['Execução'] >= pd.Timestamp(inicio)]
+        if fim is not None:
+            indice = indice[indice['Execução'] <= pd.Timestamp(fim)]
+        if ultimas:
+            indice = indice.groupby('Estabelecimento', sort=False).tail(ultimas)
+        return indice.reset_index(drop=True)
+
+    @staticmethod
+    def _posicoes(coluna_codigo, codigos):
+        """Posições das linhas dos códigos na coluna ordenada (busca binária)"""
+        coluna = coluna_codigo.combine_chunks() if coluna_codigo.num_chunks != 1 else coluna_codigo.chunk(0)
+        faixas = []
+        for codigo in codigos:
+            inicio = bisect.bisect_left(coluna, codigo, key=lambda valor: valor.as_py())
+            fim = bisect.bisect_right(coluna, codigo, lo=inicio, key=lambda valor: valor.as_py())
+            if fim > inicio:
+                faixas.append(np.arange(inicio, fim))
+        return np.concatenate(faixas) if faixas else np.array([], dtype=np.int64)
+
+    def consultar(self, colunas=None, codigos=None, estabelecimento=None, inicio=None, fim=None, ultimas=None):
+        """Linhas arquivadas das execuções selecionadas
+
+        colunas: colunas do resultado a ler (None = todas); codigos: um código ou lista
+        de códigos (None = todos). Retorna um DataFrame com Execução, Estabelecimento,
+        Código e as colunas pedidas; colunas ausentes em execuções antigas ficam vazias.
+        """
+        if codigos is not None:
+            codigos = [str(codigos)] if isinstance(codigos, (str, int, np.integer)) else sorted({str(c) for c in codigos})
+
+        partes = []
+        for execucao in self.execucoes(estabelecimento, inicio, fim, ultimas).itertuples(index=False):
+            tabela = self._abrir(execucao.Arquivo)
+            nomes = ['Código'] + [c for c in (colunas or tabela.schema.names) if c in tabela.schema.names and c != 'Código']
+            tabela = tabela.select(nomes)
+            if codigos is not None:
+                tabela = tabela.take(self._posicoes(tabela.column('Código'), codigos))
+            parte = tabela.to_pandas()
+            parte.insert(0, 'Estabelecimento', execucao.Estabelecimento)
+            parte.insert(0, 'Execução', execucao.Execução)
+            partes.append(parte)
+
+        ordem = ['Execução', 'Estabelecimento', 'Código']
+        if not partes:
+            return pd.DataFrame(columns=ordem + list(colunas or []))
+        linhas = pd.concat(partes, ignore_index=True)
+        if colunas is not None:
+            linhas = linhas.reindex(columns=ordem + [c for c in colunas if c != 'Código'])
+        return linhas
+
+    def historico(self, codigo, coluna='Prazo Estoque (dias)', estabelecimento=None, ultimas=12):
+        """Evolução de uma coluna de um produto nas últimas execuções (execução × estabelecimento)"""
+        linhas = self.consultar([coluna], codigos=codigo, estabelecimento=estabelecimento, ultimas=ultimas)
+        linhas = linhas.drop_duplicates(['Execução', 'Estabelecimento'], keep='first')
+        return linhas.pivot(index='Execução', columns='Estabelecimento', values=coluna)
+
+    def estatisticas(self):
+        """Retorna indicadores do histórico"""
+        indice = self.execucoes()
+        return {
+            'execucoes': len(indice),
+            'estabelecimentos': indice['Estabelecimento'].nunique(),
+            'bytes_usados': sum(
+                os.path.getsize(os.path.join(self.pasta, nome)) for nome in indice['Arquivo']
+                if os.path.exists(os.path.join(self.pasta, nome))
+            )
+        }
@@ -0,0 +1,350 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from analise_avancada import AnaliseAvancada
+
+logger = logging.getLogger(__name__)
+
+def _prever_random_forest(nome_memoria, forma, inicio, fim, origens, horizonte):
+    """Previsões do random forest para as séries [inicio, fim) em todas as origens
+
+    As séries ficam em memória compartilhada (matriz SKU × mês preenchida com NaN
+    após o fim de cada série); cada processo lê só as suas linhas. Históricos
+    idênticos (comuns em produtos sem saída) são treinados uma única vez.
+    Retorna uma matriz (fim - inicio) × origens × horizonte, NaN onde não há dobra.
+    """
+    memoria = shared_memory.SharedMemory(name=nome_memoria)
+    try:
+        series = np.ndarray(forma, dtype=np.float64, buffer=memoria.buf)[inicio:fim].copy()
+    finally:
+        memoria.close()
+
+    analise = AnaliseAvancada()
+    previsoes = np.full((len(series), len(origens), horizonte), np.nan)
+    ja_treinados = {}
+    for i, serie in enumerate(series):
+        tamanho = int(np.count_nonzero(~np.isnan(serie)))
+        for j, origem in enumerate(origens):
+            if origem + horizonte > tamanho:
+                break
+            historico = serie[:origem]
+            chave = historico.tobytes()
+            if chave not in ja_treinados:
+                ja_treinados[chave] = analise.prever_demanda_futura(historico, horizonte)
+            if ja_treinados[chave] is not None:
+                previsoes[i, j] = ja_treinados[chave]
+    return previsoes
+
+class ValidacaoPrevisao:
+    """Backtest com origem móvel dos métodos de previsão de demanda
+
+    Para cada SKU e cada origem t (do mês min_historico em diante), o método recebe
+    só os meses anteriores a t e prevê os `horizonte` meses seguintes, que são
+    comparados com as saídas reais. Métodos:
+    - 'media_historica': média dos meses anteriores (a média de saída da análise)
+    - 'demanda_esperada': calcular_demanda_esperada sobre essa média (pacientes e fatores)
+    - 'random_forest': prever_demanda_futura (modelo treinado a cada dobra)
+    As dobras do random forest são distribuídas em blocos de SKUs entre processos,
+    que leem as séries de uma matriz em memória compartilhada. O pool de processos
+    é criado no primeiro uso e reaproveitado nas partes seguintes; feche-o com fechar().
+    """
+
+    METODOS = ('media_historica', 'demanda_esperada', 'random_forest')
+
+    def __init__(self, metodos=None, horizonte=1, min_historico=3, max_origens=6,
+                 tamanho_bloco=50, n_processos=None, analise_avancada=None):
+        self.metodos = tuple(metodos) if metodos is not None else self.METODOS
+        desconhecidos = set(self.metodos) - set(self.METODOS)
+        if desconhecidos:
+            raise ValueError(f"Métodos de previsão desconhecidos: {', '.join(sorted(desconhecidos))}")
+        self.horizonte = horizonte
+        self.min_historico = min_historico
+        # Só as últimas max_origens origens são avaliadas (None = todas)
+        self.max_origens = max_origens
+        self.tamanho_bloco = tamanho_bloco
+        self.n_processos = n_processos if n_processos is not None else (os.cpu_count() or 1)
+        # Análise avançada com os fatores e a média de pacientes (None = a passada a executar)
+        self.analise_avancada = analise_avancada
+        self._executor = None
+        self._trava = threading.Lock()
+
+    def __getstate__(self):
+        # O pool e a trava não vão junto quando a validação é enviada a outro processo
+        estado = self.__dict__.copy()
+        estado['_executor'] = None
+        del estado['_trava']
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._trava = threading.Lock()
+
+    def _obter_executor(self):
+        """Pool de processos do backtest, criado na primeira chamada ('spawn', ver SimuladorRuptura)"""
+        with self._trava:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.n_processos, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def fechar(self):
+        """Encerra o pool de processos (um novo backtest cria outro)"""
+        with self._trava:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def montar_series(self, df_saidas):
+        """Matriz SKU × mês das saídas (linhas em ordem; com coluna 'mes', ordenadas por ela)
+
+        Séries mais curtas que a maior são completadas com NaN no fim.
+        Retorna (códigos, matriz).
+        """
+        saidas = df_saidas[['codigo', 'saida']].copy()
+        if 'mes' in df_saidas:
+            saidas['mes'] = df_saidas['mes']
+            saidas = saidas.sort_values(['codigo', 'mes'], kind='stable')
+        saidas['saida'] = pd.to_numeric(saidas['saida'], errors='coerce').fillna(0.0)
+        saidas['posicao'] = saidas.groupby('codigo', sort=False).cumcount()
+
+        matriz = saidas.pivot(index='codigo', columns='posicao', values='saida')
+        return matriz.index.astype(str), matriz.to_numpy(dtype=np.float64)
+
+    def _origens(self, n_meses):
+        origens = np.arange(self.min_historico, n_meses - self.horizonte + 1)
+        if self.max_origens is not None:
+            origens = origens[-self.max_origens:]
+        return origens
+
+    def _prever_media(self, series, origens):
+        """Média dos meses anteriores a cada origem, repetida no horizonte"""
+        acumulada = np.nancumsum(series, axis=1)
+        media = acumulada[:, origens - 1] / origens
+        return np.repeat(media[:, :, None], self.horizonte, axis=2)
+
+    def _prever_demanda_esperada(self, series, origens, codigos, analise):
+        """Demanda esperada (fatores por SKU da análise avançada) sobre a média de cada origem"""
+        media = self._prever_media(series, origens)[:, :, 0]
+        fatores = analise.resolver_fatores(codigos)
+        demanda = np.empty_like(media)
+        for j in range(media.shape[1]):
+            demanda[:, j] = analise.calcular_metricas(
+                media[:, j], np.zeros(len(media)), fatores
+            )['Demanda Esperada']
+        return np.repeat(demanda[:, :, None], self.horizonte, axis=2)
+
+    def _prever_random_forest(self, series, origens, cancelamento=None):
+        memoria = shared_memory.SharedMemory(create=True, size=max(series.nbytes, 1))
+        try:
+            np.ndarray(series.shape, dtype=np.float64, buffer=memoria.buf)[:] = series
+            blocos = [
+                (memoria.name, series.shape, i, min(i + self.tamanho_bloco, len(series)), origens, self.horizonte)
+                for i in range(0, len(series), self.tamanho_bloco)
+            ]
+
+            resultados = []
+            if self.n_processos > 1 and len(blocos) > 1:
+                executor = self._obter_executor()
+                futuros = [executor.submit(_prever_random_forest, *bloco) for bloco in blocos]
+                for futuro in futuros:
+                    if cancelamento is not None and cancelamento.is_set():
+                        for pendente in futuros:
+                            pendente.cancel()
+                        # Blocos já em execução ainda leem a memória compartilhada
+                        wait(futuros)
+                        return None
+                    resultados.append(futuro.result())
+            else:
+                for bloco in blocos:
+                    if cancelamento is not None and cancelamento.is_set():
+                        return None
+                    resultados.append(_prever_random_forest(*bloco))
+        finally:
+            memoria.close()
+            memoria.unlink()
+
+        return np.concatenate(resultados) if resultados else np.empty((0, len(origens), self.horizonte))
+
+    def executar(self, df_saidas, tipos=None, codigos=None, analise_avancada=None, cancelamento=None, series=None):
+        """Executa o backtest de todos os métodos
+
+        tipos: Series {código: tipo de produto} para agrupar as métricas (sem ela, o
+        tipo vem da tabela de fatores da análise avançada).
+        codigos: restringe o backtest a esses SKUs.
+        analise_avancada: fatores, tipo e média de pacientes usados em 'demanda_esperada'
+        (se o backtest não foi criado com uma).
+        series: resultado de montar_series(df_saidas), para não refazer a matriz a cada
+        parte de uma análise progressiva.
+        Retorna um dicionário com 'por_sku' e 'por_tipo' (MAE, MAPE, viés e dobras por
+        método), 'tempos' (segundos por método) e 'dobras' (previsão e real de cada dobra),
+        ou None se cancelado.
+        """
+        analise = self.analise_avancada if self.analise_avancada is not None else analise_avancada
+        if analise is None:
+            analise = AnaliseAvancada()
+        codigos_series, series = series if series is not None else self.montar_series(df_saidas)
+        if codigos is not None:
+            manter = codigos_series.isin(pd.Index(codigos).astype(str))
+            codigos_series, series = codigos_series[manter], series[manter]
+
+        origens = self._origens(series.shape[1])
+        tamanhos = np.count_nonzero(~np.isnan(series), axis=1)
+
+        if tipos is not None:
+            tipos = pd.Series(tipos).rename(index=str).reindex(codigos_series).to_numpy(dtype=object)
+        else:
+            tipos = analise.resolver_fatores(codigos_series)['tipo_produto'].to_numpy(dtype=object)
+
+        # Saídas reais de cada dobra: SKU × origem × passo do horizonte
+        passos = origens[:, None] + np.arange(self.horizonte)[None, :]
+        reais = series[:, passos] if len(origens) else np.empty((len(series), 0, self.horizonte))
+        validas = np.broadcast_to(origens[None, :, None] + self.horizonte <= tamanhos[:, None, None], reais.shape)
+
+        dobras, tempos = [], {}
+        for metodo in self.metodos:
+            if cancelamento is not None and cancelamento.is_set():
+                return None
+            inicio = time.perf_counter()
+            if metodo == 'media_historica':
+                previstos = self._prever_media(series, origens)
+            elif metodo == 'demanda_esperada':
+                previstos = self._prever_demanda_esperada(series, origens, codigos_series, analise)
+            else:
+                previstos = self._prever_random_forest(series, origens, cancelamento)
+                if previstos is None:
+                    return None
+            tempos[metodo] = time.perf_counter() - inicio
+
+            sku, origem, passo = np.nonzero(validas & ~np.isnan(previstos))
+            dobras.append(pd.DataFrame({
+                'Código': codigos_series.to_numpy()[sku],
+                'Tipo Produto': tipos[sku],
+                'Método': metodo,
+                'Origem': origens[origem],
+                'Passo': passo + 1,
+                'Real': reais[sku, origem, passo],
+                'Previsto': previstos[sku, origem, passo]
+            }))
+            logger.info(f"Backtest '{metodo}': {len(sku)} previsões em {tempos[metodo]:.2f}s")
+
+        dobras = pd.concat(dobras, ignore_index=True) if dobras else pd.DataFrame(
+            columns=['Código', 'Tipo Produto', 'Método', 'Origem', 'Passo', 'Real', 'Previsto']
+        )
+        return {
+            'por_sku': self._resumir(dobras, ['Código', 'Tipo Produto', 'Método']),
+            'por_tipo': self._resumir_tipos(dobras, tempos, analise),
+            'tempos': tempos,
+            'dobras': dobras
+        }
+
+    def combinar(self, relatorios, analise_avancada=None):
+        """Une relatórios de executar feitos em partes dos SKUs (com o mesmo histórico de saídas)"""
+        analise = self.analise_avancada if self.analise_avancada is not None else analise_avancada
+        if analise is None:
+            analise = AnaliseAvancada()
+
+        dobras = pd.concat([r['dobras'] for r in relatorios], ignore_index=True)
+        tempos = {}
+        for relatorio in relatorios:
+            for metodo, tempo in relatorio['tempos'].items():
+                tempos[metodo] = tempos.get(metodo, 0.0) + tempo
+
+        return {
+            'por_sku': self._resumir(dobras, ['Código', 'Tipo Produto', 'Método']),
+            'por_tipo': self._resumir_tipos(dobras, tempos, analise),
+            'tempos': tempos,
+            'dobras': dobras
+        }
+
+    @staticmethod
+    def _resumir(dobras, chaves):
+        """MAE, MAPE (só meses com saída) e viés (previsto - real) por grupo"""
+        erro = dobras['Previsto'] - dobras['Real']
+        com_saida = dobras['Real'] > 0
+        calculos = pd.DataFrame({
+            **{chave: dobras[chave] for chave in chaves},
+            'erro_absoluto': erro.abs(),
+            'erro_percentual': (erro.abs() / dobras['Real']).where(com_saida) * 100,
+            'erro': erro
+        })
+        resumo = calculos.groupby(chaves, sort=False).agg(
+            Dobras=('erro', 'size'),
+            MAE=('erro_absoluto', 'mean'),
+            **{'MAPE (%)': ('erro_percentual', 'mean')},
+            **{'Viés': ('erro', 'mean')}
+        )
+        return resumo.round(2).reset_index()
+
+    @staticmethod
+    def _resumir_tipos(dobras, tempos, analise):
+        """Métricas por tipo de produto e método, com RMSE e o tempo de cada método"""
+        linhas = []
+        for (tipo, metodo), grupo in dobras.groupby(['Tipo Produto', 'Método'], sort=False):
+            metricas = analise.avaliar_previsoes(grupo['Real'], grupo['Previsto'])
+            linhas.append({
+                'Tipo Produto': tipo,
+                'Método': metodo,
+                'SKUs': grupo['Código'].nunique(),
+                'Dobras': len(grupo),
+                **metricas,
+                'Tempo Método (s)': round(tempos[metodo], 3)
+            })
+        return pd.DataFrame(linhas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest com origem móvel dos métodos de previsão de demanda")
+    parser.add_argument('saidas', help="Planilha de saídas mensais (ou razão de dispensações com --razao)")
+    parser.add_argument('--razao', action='store_true', help="O arquivo é um razão de dispensações")
+    parser.add_argument('--linha-inicio', type=int, default=None, help="Linha de início dos dados (base 0)")
+    parser.add_argument('--mapeamento', default=None, help="Mapeamento de colunas (ex: 0,codigo;1,descricao;2,unidade;14,saida)")
+    parser.add_argument('--metodos', default=','.join(ValidacaoPrevisao.METODOS))
+    parser.add_argument('--horizonte', type=int, default=1, help="Meses previstos a partir de cada origem")
+    parser.add_argument('--min-historico', type=int, default=3)
+    parser.add_argument('--max-origens', type=int, default=6)
+    parser.add_argument('--pacientes', type=float, default=None)
+    parser.add_argument('--tipo', default='medicamentos')
+    parser.add_argument('--processos', type=int, default=None)
+    args = parser.parse_args()
+
+    from estoque_analyzer import EstoqueAnalyzer
+
+    mapeamento = None
+    if args.mapeamento:
+        mapeamento = {chave.strip(): int(idx) for idx, chave in (item.split(',') for item in args.mapeamento.split(';') if ',' in item)}
+
+    analyzer = EstoqueAnalyzer()
+    if args.razao:
+        df_saidas = analyzer.carregar_razao_saidas(args.saidas, mapeamento)
+    else:
+        df_saidas = analyzer.carregar_planilha(args.saidas, args.linha_inicio, mapeamento)
+    if df_saidas is None:
+        raise SystemExit("Não foi possível carregar as saídas")
+    df_saidas = analyzer.separar_codigo_descricao(df_saidas)
+    if 'saida' not in df_saidas and 'quantidade' in df_saidas:
+        df_saidas = df_saidas.rename(columns={'quantidade': 'saida'})
+
+    analyzer.analise_avancada.configurar_tipo_produto(args.tipo, args.pacientes)
+    backtest = ValidacaoPrevisao(
+        args.metodos.split(','), args.horizonte, args.min_historico, args.max_origens,
+        n_processos=args.processos, analise_avancada=analyzer.analise_avancada
+    )
+    try:
+        validacao = backtest.executar(df_saidas)
+    finally:
+        backtest.fechar()
+
+    with pd.option_context('display.width', 160, 'display.max_columns', None):
+        print(validacao['por_tipo'].to_string(index=False))
+
+if __name__ == "__main__":
+    main()
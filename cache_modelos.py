@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class CacheModelos:
+    """Cache em disco de modelos de previsão, indexado pela impressão digital da série"""
+
+    EXTENSAO = '.joblib'
+    # Ao passar do limite, remove até sobrar esta fração (evita varrer a pasta a cada gravação)
+    FRACAO_APOS_LIMPEZA = 0.9
+
+    def __init__(self, pasta='.cache_modelos', max_idade_dias=30, max_bytes=256 * 1024 * 1024):
+        self.pasta = pasta
+        self.max_idade_dias = max_idade_dias
+        self.max_bytes = max_bytes
+        self.acertos = 0
+        self.falhas = 0
+        os.makedirs(self.pasta, exist_ok=True)
+        # Total em disco, atualizado a cada gravação; a pasta só é varrida ao passar do limite
+        self.bytes_usados = 0
+        self.remover_excedentes()
+
+    @staticmethod
+    def gerar_impressao(historico, configuracao):
+        """Gera a impressão digital de uma série histórica e da configuração do modelo"""
+        valores = np.ascontiguousarray(np.asarray(historico, dtype=np.float64))
+        sha = hashlib.sha256(valores.tobytes())
+        sha.update(json.dumps(configuracao, sort_keys=True, default=str).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _caminho(self, impressao):
+        return os.path.join(self.pasta, impressao + self.EXTENSAO)
+
+    def obter(self, impressao, contabilizar=True):
+        """Carrega um modelo do cache ou retorna None
+
+        contabilizar=False não altera acertos e falhas (consultas de apoio, como a
+        procura do modelo anterior para o refit incremental).
+        """
+        caminho = self._caminho(impressao)
+        if not os.path.exists(caminho):
+            if contabilizar:
+                self.falhas += 1
+            return None
+
+        try:
+            entrada = joblib.load(caminho)
+        except Exception as e:
+            logger.warning(f"Entrada de cache inválida removida ({impressao}): {str(e)}")
+            self._remover(caminho)
+            if contabilizar:
+                self.falhas += 1
+            return None
+
+        # Marcar como usado recentemente (base da remoção por idade e por tamanho)
+        os.utime(caminho)
+        if contabilizar:
+            self.acertos += 1
+        return entrada
+
+    def armazenar(self, impressao, entrada):
+        """Grava um modelo e seus parâmetros no cache
+
+        Falhas na gravação só geram um aviso: o modelo já foi calculado e a análise
+        segue sem ele no cache.
+        """
+        caminho = self._caminho(impressao)
+        # Temporário exclusivo: outros processos e threads podem gravar a mesma impressão
+        descritor, temporario = tempfile.mkstemp(dir=self.pasta, suffix='.tmp')
+        try:
+            with os.fdopen(descritor, 'wb') as arquivo:
+                joblib.dump(entrada, arquivo)
+            tamanho = os.path.getsize(temporario)
+            anterior = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+            os.replace(temporario, caminho)
+        except Exception as e:
+            logger.warning(f"Modelo não gravado no cache ({impressao}): {str(e)}")
+            self._remover(temporario)
+            return
+
+        self.bytes_usados += tamanho - anterior
+        if self.bytes_usados > self.max_bytes:
+            self.remover_excedentes()
+
+    def _remover(self, caminho):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+    def remover_excedentes(self):
+        """Remove entradas antigas e, se necessário, as menos usadas até caber no limite"""
+        agora = time.time()
+        entradas = []
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith(self.EXTENSAO):
+                continue
+            caminho = os.path.join(self.pasta, nome)
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            if agora - estado.st_mtime > self.max_idade_dias * 86400:
+                self._remover(caminho)
+            else:
+                entradas.append((estado.st_mtime, estado.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        limite = self.max_bytes * self.FRACAO_APOS_LIMPEZA if total > self.max_bytes else self.max_bytes
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= limite:
+                break
+            self._remover(caminho)
+            total -= tamanho
+        self.bytes_usados = total
+
+    def estatisticas(self):
+        """Retorna indicadores de uso do cache"""
+        arquivos = [os.path.join(self.pasta, n) for n in os.listdir(self.pasta) if n.endswith(self.EXTENSAO)]
+        consultas = self.acertos + self.falhas
+        return {
+            'modelos': len(arquivos),
+            'bytes_usados': sum(os.path.getsize(c) for c in arquivos if os.path.exists(c)),
+            'max_bytes': self.max_bytes,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': (self.acertos / consultas * 100) if consultas > 0 else 0
+        }
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class CacheResultados:
+    """Cache de resultados compartilhado entre sessões, com expiração e limite de memória"""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.trava = threading.Lock()
+        # chave -> (resultado, tamanho em bytes, instante de criação)
+        self._itens = OrderedDict()
+        self.bytes_usados = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.expirados = 0
+        self.removidos = 0
+
+    @staticmethod
+    def gerar_chave(hash_estoque, hash_saidas, parametros):
+        """Gera a chave do cache a partir dos hashes das planilhas e dos parâmetros"""
+        conteudo = json.dumps(
+            {'estoque': hash_estoque, 'saidas': hash_saidas, 'parametros': parametros},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    def _remover(self, chave):
+        _, tamanho, _ = self._itens.pop(chave)
+        self.bytes_usados -= tamanho
+
+    def _remover_expirados(self, agora):
+        expirados = [chave for chave, (_, _, criado) in self._itens.items() if agora - criado > self.ttl]
+        for chave in expirados:
+            self._remover(chave)
+        self.expirados += len(expirados)
+
+    def obter(self, chave, contabilizar=True):
+        """Retorna o resultado armazenado (somente leitura) ou None
+
+        Use contabilizar=False para leituras de exibição, que não devem
+        entrar na taxa de acerto.
+        """
+        with self.trava:
+            item = self._itens.get(chave)
+            if item is None or time.time() - item[2] > self.ttl:
+                if item is not None:
+                    self._remover(chave)
+                    self.expirados += 1
+                if contabilizar:
+                    self.falhas += 1
+                return None
+
+            self._itens.move_to_end(chave)
+            if contabilizar:
+                self.acertos += 1
+            return item[0]
+
+    def armazenar(self, chave, resultado):
+        """Armazena um resultado, removendo os menos usados se o limite de memória for excedido"""
+        tamanho = int(resultado.memory_usage(index=True, deep=True).sum())
+        if tamanho > self.max_bytes:
+            logger.warning(f"Resultado de {tamanho} bytes excede o limite do cache e não será armazenado")
+            return False
+
+        with self.trava:
+            if chave in self._itens:
+                self._remover(chave)
+
+            self._remover_expirados(time.time())
+            while self._itens and self.bytes_usados + tamanho > self.max_bytes:
+                self._remover(next(iter(self._itens)))
+                self.removidos += 1
+
+            self._itens[chave] = (resultado, tamanho, time.time())
+            self.bytes_usados += tamanho
+            return True
+
+    def limpar(self):
+        """Remove todos os resultados do cache"""
+        with self.trava:
+            self._itens.clear()
+            self.bytes_usados = 0
+
+    def estatisticas(self):
+        """Retorna indicadores de uso do cache"""
+        with self.trava:
+            self._remover_expirados(time.time())
+            consultas = self.acertos + self.falhas
+            return {
+                'itens': len(self._itens),
+                'bytes_usados': self.bytes_usados,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acerto': (self.acertos / consultas * 100) if consultas > 0 else 0,
+                'expirados': self.expirados,
+                'removidos': self.removidos
+            }
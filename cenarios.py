@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from analise_avancada import AnaliseAvancada
+
+class CuboCenarios:
+    """Cubo SKU × cenário com as métricas de estoque, pronto para ser fatiado pela interface
+
+    analise deve estar configurada com a tabela de fatores da análise e classificacao
+    (ClassificacaoABCXYZ) deve ter as políticas por classe usadas nela, para que o
+    cenário com os parâmetros da análise reproduza o resultado.
+    """
+
+    # Colunas de classe do resultado usadas para aplicar as políticas por classe
+    COLUNAS_CLASSE = ['Classe ABC', 'Classe XYZ', 'Classe ABC/XYZ']
+
+    def __init__(self, resultado, lista_pacientes, lista_periodos, lista_tipos, analise=None, dtype=np.float32, classificacao=None):
+        analise = analise if analise is not None else AnaliseAvancada()
+
+        self.produtos = resultado[['Código', 'Descrição', 'Quantidade em estoque', 'Média de Saída Mensal']].reset_index(drop=True)
+        self._posicoes = pd.Index(self.produtos['Código'])
+
+        # Base da demanda usada na análise (a política da classe pode trocá-la pelo random forest)
+        base = resultado['Demanda Base'] if 'Demanda Base' in resultado else self.produtos['Média de Saída Mensal']
+        tem_classes = all(coluna in resultado for coluna in self.COLUNAS_CLASSE)
+
+        simulacao = analise.simular_cenarios(
+            base.to_numpy(),
+            self.produtos['Quantidade em estoque'].to_numpy(),
+            lista_pacientes,
+            lista_periodos,
+            lista_tipos,
+            dtype=dtype,
+            codigos=self.produtos['Código'],
+            classificacao=classificacao if tem_classes else None,
+            classes=resultado[self.COLUNAS_CLASSE].reset_index(drop=True) if tem_classes else None
+        )
+        self.cenarios = simulacao['cenarios']
+        self.metricas = simulacao['metricas']
+        self.comprar = self.metricas['Estoque Restante Estimado'] < 0
+
+    @property
+    def nbytes(self):
+        """Memória ocupada pelas matrizes do cubo"""
+        return sum(m.nbytes for m in self.metricas.values()) + self.comprar.nbytes
+
+    def indice_cenario(self, media_pacientes, periodo_previsao, tipo_produto):
+        """Retorna a posição de um cenário na grade"""
+        filtro = (
+            (self.cenarios['periodo_previsao'] == periodo_previsao) &
+            (self.cenarios['tipo_produto'] == tipo_produto)
+        )
+        if media_pacientes is None:
+            filtro &= self.cenarios['media_pacientes'].isna()
+        else:
+            filtro &= self.cenarios['media_pacientes'] == media_pacientes
+
+        posicoes = np.flatnonzero(filtro.to_numpy())
+        if len(posicoes) == 0:
+            raise KeyError(f"Cenário não encontrado: {media_pacientes}, {periodo_previsao}, {tipo_produto}")
+        return int(posicoes[0])
+
+    def fatiar_cenario(self, media_pacientes, periodo_previsao, tipo_produto):
+        """Tabela por SKU de um único cenário, no formato do resultado da análise"""
+        j = self.indice_cenario(media_pacientes, periodo_previsao, tipo_produto)
+        tabela = self.produtos.copy()
+        for nome, matriz in self.metricas.items():
+            tabela[nome] = matriz[:, j]
+        tabela['Situação'] = np.where(self.comprar[:, j], 'Comprar', 'OK')
+        return tabela
+
+    def fatiar_sku(self, codigo):
+        """Métricas de um SKU em todos os cenários"""
+        i = self._posicoes.get_loc(codigo)
+        tabela = self.cenarios.copy()
+        for nome, matriz in self.metricas.items():
+            tabela[nome] = matriz[i, :]
+        tabela['Situação'] = np.where(self.comprar[i, :], 'Comprar', 'OK')
+        return tabela
+
+    def resumo(self):
+        """Indicadores agregados por cenário (uma linha por cenário)"""
+        tabela = self.cenarios.copy()
+        tabela['Produtos Comprar'] = self.comprar.sum(axis=0)
+        tabela['% Comprar'] = tabela['Produtos Comprar'] / max(len(self.produtos), 1) * 100
+        tabela['Demanda Total'] = self.metricas['Demanda Esperada'].sum(axis=0, dtype=np.float64)
+        tabela['Compra Sugerida Total'] = self.metricas['Quantidade Sugerida Compra'].sum(axis=0, dtype=np.float64)
+        tabela['Estoque Ideal Total'] = self.metricas['Estoque Ideal Futuro'].sum(axis=0, dtype=np.float64)
+
+        prazo = self.metricas['Prazo Estoque (dias)']
+        tabela['Prazo Mediano (dias)'] = np.nanmedian(np.where(np.isinf(prazo), np.nan, prazo), axis=0)
+        return tabela
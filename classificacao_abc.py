@@ -0,0 +1,114 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Política sugerida por classe: menos segurança para demanda estável, mais para a
+# errática, e random forest como base de previsão da demanda com tendência (Y)
+POLITICAS_SUGERIDAS = {
+    'X': {'prazo_seguranca': 7},
+    'Y': {'prazo_seguranca': 15, 'metodo_previsao': 'random_forest'},
+    'Z': {'prazo_seguranca': 30},
+    'AZ': {'prazo_seguranca': 45, 'estoque_minimo': 0.4}
+}
+
+class ClassificacaoABCXYZ:
+    """Classificação ABC (volume ou valor das saídas) e XYZ (variabilidade da demanda)
+
+    ABC: os SKUs são ordenados pelo total de saídas (ou valor, se houver preços) e
+    recebem A até limites_abc[0] do total acumulado, B até limites_abc[1] e C no
+    restante. XYZ: coeficiente de variação mensal até limites_xyz[0] é X, até
+    limites_xyz[1] é Y e acima disso (ou sem saídas / com um só mês) é Z.
+    politicas: {classe: {fator: valor, 'metodo_previsao': método}}, com classes
+    'A'..'C', 'X'..'Z' ou combinadas ('AX'); a combinada prevalece sobre XYZ, que
+    prevalece sobre ABC.
+    """
+
+    METODOS_PREVISAO = ('media_historica', 'random_forest')
+
+    def __init__(self, limites_abc=(0.8, 0.95), limites_xyz=(0.5, 1.0), politicas=None, precos=None):
+        self.limites_abc = limites_abc
+        self.limites_xyz = limites_xyz
+        self.politicas = politicas or {}
+        for classe, politica in self.politicas.items():
+            metodo = politica.get('metodo_previsao', 'media_historica')
+            if metodo not in self.METODOS_PREVISAO:
+                raise ValueError(f"Método de previsão desconhecido para a classe {classe}: {metodo}")
+        # Preço unitário por código (Series); com preços o ABC é por valor
+        self.precos = precos
+
+    def classificar(self, df_saidas, codigos):
+        """Classes ABC, XYZ e combinada de cada SKU, alinhadas a `codigos`
+
+        Uma agregação das saídas por SKU, uma ordenação e uma soma acumulada
+        classificam o catálogo inteiro.
+        """
+        codigos = pd.Index(codigos).astype(str)
+        estatisticas = df_saidas.groupby('codigo')['saida'].agg(['sum', 'mean', 'std'])
+        estatisticas = estatisticas.rename(index=str).reindex(codigos)
+
+        total = estatisticas['sum'].fillna(0.0).to_numpy(dtype=float)
+        if self.precos is not None:
+            preco = pd.Series(self.precos).rename(index=str).reindex(codigos).to_numpy(dtype=float)
+            total = total * np.nan_to_num(preco)
+        total = np.maximum(total, 0.0)
+
+        # ABC: participação acumulada antes de cada SKU, do maior para o menor
+        ordem = np.argsort(-total, kind='stable')
+        acumulado = np.cumsum(total[ordem])
+        soma = acumulado[-1] if len(acumulado) and acumulado[-1] > 0 else 1.0
+        anterior = np.empty(len(total))
+        anterior[ordem] = (acumulado - total[ordem]) / soma
+        participacao = np.empty(len(total))
+        participacao[ordem] = acumulado / soma
+        classe_abc = np.select(
+            [total <= 0, anterior < self.limites_abc[0], anterior < self.limites_abc[1]],
+            ['C', 'A', 'B'],
+            default='C'
+        )
+
+        # XYZ: coeficiente de variação mensal
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = (estatisticas['std'] / estatisticas['mean']).to_numpy(dtype=float)
+        cv = np.where(np.isfinite(cv), cv, np.nan)
+        classe_xyz = np.select(
+            [np.isnan(cv), cv <= self.limites_xyz[0], cv <= self.limites_xyz[1]],
+            ['Z', 'X', 'Y'],
+            default='Z'
+        )
+
+        return pd.DataFrame({
+            'Classe ABC': classe_abc,
+            'Classe XYZ': classe_xyz,
+            'Classe ABC/XYZ': np.char.add(classe_abc.astype(str), classe_xyz.astype(str)),
+            'Participação Acumulada (%)': np.round(participacao * 100, 2),
+            'CV Demanda': np.round(cv, 3)
+        }, index=codigos)
+
+    def aplicar_politicas(self, fatores, classes):
+        """Aplica aos fatores de cada SKU a política da sua classe
+
+        Regras por SKU da tabela de fatores não são alteradas. Retorna os fatores
+        (com 'Fonte Fator' indicando a classe aplicada) e o método de previsão de cada SKU.
+        """
+        fatores = fatores.copy()
+        metodo = np.full(len(fatores), 'media_historica', dtype=object)
+        ajustavel = (fatores['Fonte Fator'] != 'SKU').to_numpy()
+
+        for coluna_classe in ('Classe ABC', 'Classe XYZ', 'Classe ABC/XYZ'):
+            classe = classes[coluna_classe].to_numpy(dtype=object)
+            for valor in pd.unique(classe):
+                politica = self.politicas.get(valor)
+                if not politica:
+                    continue
+                linhas = (classe == valor) & ajustavel
+                for chave, ajuste in politica.items():
+                    if chave == 'metodo_previsao':
+                        metodo[linhas] = ajuste
+                    else:
+                        fatores.loc[linhas, chave] = ajuste
+                fatores.loc[linhas, 'Fonte Fator'] = f'Classe: {valor}'
+
+        return fatores, metodo
@@ -0,0 +1,149 @@
+import logging
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+class ConciliadorProdutos:
+    """Concilia produtos cujos códigos diferem entre as planilhas, por descrição e unidade
+
+    As descrições são quebradas em n-gramas de caracteres e indexadas em um índice
+    invertido (matriz esparsa n-grama × produto) bloqueado por unidade. Os candidatos
+    de cada produto vêm apenas dos n-gramas pouco frequentes que ele compartilha com
+    outros (no máximo max_candidatos por produto), e só esses pares recebem o score
+    completo, o que mantém o custo próximo de linear no tamanho do catálogo.
+    """
+
+    def __init__(self, tamanho_ngrama=3, limiar=0.85, max_frequencia=100, max_candidatos=10, min_raros=2,
+                 bloquear_unidade=True, tamanho_bloco=2000):
+        self.tamanho_ngrama = tamanho_ngrama
+        self.limiar = limiar
+        self.max_frequencia = max_frequencia
+        self.max_candidatos = max_candidatos
+        self.min_raros = min_raros
+        self.bloquear_unidade = bloquear_unidade
+        self.tamanho_bloco = tamanho_bloco
+
+    @staticmethod
+    def normalizar(texto):
+        """Remove acentos, pontuação e espaços repetidos, em maiúsculas"""
+        texto = unicodedata.normalize('NFKD', str(texto))
+        texto = ''.join(c for c in texto if not unicodedata.combining(c)).upper()
+        texto = re.sub(r'[^A-Z0-9]+', ' ', texto)
+        return texto.strip()
+
+    def _ngramas(self, texto):
+        texto = f" {texto} "
+        n = self.tamanho_ngrama
+        return {texto[i:i + n] for i in range(max(len(texto) - n + 1, 1))}
+
+    def _caracteristicas(self, produtos):
+        """Lista (posição do produto, característica) de cada n-grama com o bloco de unidade"""
+        descricoes = produtos['descricao'].map(self.normalizar)
+        if self.bloquear_unidade and 'unidade' in produtos:
+            blocos = produtos['unidade'].map(self.normalizar)
+        else:
+            blocos = pd.Series('', index=produtos.index)
+
+        posicoes, caracteristicas = [], []
+        for i, (descricao, bloco) in enumerate(zip(descricoes, blocos)):
+            for ngrama in self._ngramas(descricao):
+                posicoes.append(i)
+                caracteristicas.append(f"{bloco}|{ngrama}")
+
+        return np.asarray(posicoes, dtype=np.int64), np.asarray(caracteristicas, dtype=object)
+
+    def _raros(self, posicoes, frequencias):
+        """Máscara dos n-gramas usados no índice: os pouco frequentes e os min_raros mais raros de cada produto"""
+        ordem = np.lexsort((frequencias, posicoes))
+        posto = np.empty(len(ordem), dtype=np.int64)
+        posto[ordem] = pd.Series(posicoes[ordem]).groupby(posicoes[ordem]).cumcount().to_numpy()
+        return (frequencias <= self.max_frequencia) | (posto < self.min_raros)
+
+    def conciliar(self, produtos_estoque, produtos_saidas):
+        """Encontra o melhor par de saídas para cada produto de estoque sem correspondência
+
+        Os dois DataFrames devem ter as colunas 'codigo' e 'descricao' (e, opcionalmente,
+        'unidade'). Retorna um DataFrame com os pares encontrados e o score (coeficiente
+        de Dice sobre os n-gramas), do maior para o menor, com no máximo um par por produto.
+        """
+        colunas = ['Código Estoque', 'Descrição Estoque', 'Código Saídas', 'Descrição Saídas', 'Unidade', 'Score']
+        if len(produtos_estoque) == 0 or len(produtos_saidas) == 0:
+            return pd.DataFrame(columns=colunas)
+
+        produtos_estoque = produtos_estoque.reset_index(drop=True)
+        produtos_saidas = produtos_saidas.reset_index(drop=True)
+
+        pos_e, carac_e = self._caracteristicas(produtos_estoque)
+        pos_s, carac_s = self._caracteristicas(produtos_saidas)
+
+        # Vocabulário comum e frequência de cada n-grama no lado das saídas
+        codigos_carac, vocabulario = pd.factorize(np.concatenate([carac_e, carac_s]))
+        ids_e, ids_s = codigos_carac[:len(carac_e)], codigos_carac[len(carac_e):]
+        frequencia = np.bincount(ids_s, minlength=len(vocabulario))
+
+        forma_e = (len(produtos_estoque), len(vocabulario))
+        forma_s = (len(produtos_saidas), len(vocabulario))
+        matriz_e = sparse.csr_matrix((np.ones(len(ids_e)), (pos_e, ids_e)), shape=forma_e)
+        matriz_s = sparse.csr_matrix((np.ones(len(ids_s)), (pos_s, ids_s)), shape=forma_s)
+
+        # Geração de candidatos pelo índice invertido sem os n-gramas frequentes demais;
+        # cada produto mantém ao menos seus n-gramas mais raros para não ficar sem candidatos
+        raros_e = self._raros(pos_e, frequencia[ids_e])
+        raros_s = self._raros(pos_s, frequencia[ids_s])
+        indice_e = sparse.csr_matrix((np.ones(raros_e.sum()), (pos_e[raros_e], ids_e[raros_e])), shape=forma_e)
+        indice_s = sparse.csr_matrix((np.ones(raros_s.sum()), (pos_s[raros_s], ids_s[raros_s])), shape=forma_s)
+
+        # Produto esparso em blocos de linhas, guardando só os melhores candidatos de cada
+        # produto, para limitar a memória em catálogos grandes
+        indice_s_t = indice_s.T.tocsr()
+        blocos = []
+        for inicio in range(0, len(produtos_estoque), self.tamanho_bloco):
+            compartilhados = (indice_e[inicio:inicio + self.tamanho_bloco] @ indice_s_t).tocoo()
+            bloco = pd.DataFrame({
+                'e': compartilhados.row + inicio,
+                's': compartilhados.col,
+                'n': compartilhados.data
+            })
+            bloco = bloco.sort_values(['e', 'n'], ascending=[True, False], kind='stable')
+            blocos.append(bloco[bloco.groupby('e').cumcount() < self.max_candidatos])
+
+        candidatos = pd.concat(blocos, ignore_index=True)
+        if len(candidatos) == 0:
+            return pd.DataFrame(columns=colunas)
+
+        # Score completo (Dice sobre todos os n-gramas) apenas para os pares candidatos
+        e, s = candidatos['e'].to_numpy(), candidatos['s'].to_numpy()
+        intersecao = np.asarray(matriz_e[e].multiply(matriz_s[s]).sum(axis=1)).ravel()
+        tamanho_e = np.asarray(matriz_e.sum(axis=1)).ravel()
+        tamanho_s = np.asarray(matriz_s.sum(axis=1)).ravel()
+        candidatos['score'] = 2 * intersecao / (tamanho_e[e] + tamanho_s[s])
+
+        candidatos = candidatos[candidatos['score'] >= self.limiar]
+        candidatos = candidatos.sort_values('score', ascending=False, kind='stable')[['e', 's', 'score']]
+
+        # Atribuição gulosa um-para-um, do maior score para o menor
+        usados_e, usados_s, pares = set(), set(), []
+        for e, s, valor in candidatos.itertuples(index=False):
+            if e in usados_e or s in usados_s:
+                continue
+            usados_e.add(e)
+            usados_s.add(s)
+            pares.append((e, s, valor))
+
+        if not pares:
+            return pd.DataFrame(columns=colunas)
+
+        e, s, valores = map(np.asarray, zip(*pares))
+        return pd.DataFrame({
+            'Código Estoque': produtos_estoque['codigo'].to_numpy()[e],
+            'Descrição Estoque': produtos_estoque['descricao'].to_numpy()[e],
+            'Código Saídas': produtos_saidas['codigo'].to_numpy()[s],
+            'Descrição Saídas': produtos_saidas['descricao'].to_numpy()[s],
+            'Unidade': produtos_estoque['unidade'].to_numpy()[e] if 'unidade' in produtos_estoque else '',
+            'Score': np.round(valores.astype(float), 4)
+        })
@@ -0,0 +1,168 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class ConsolidacaoRede:
+    """Consolidação dos resultados de várias unidades (estabelecimentos) da rede
+
+    Mantém pré-calculados o cubo estabelecimento × tipo de produto × situação e os
+    totais de cada SKU somados sobre a rede. Cada unidade contribui com a sua fatia
+    do cubo e com parcelas somadas aos totais por SKU; ao reanalisar uma unidade,
+    só a contribuição dela é substituída (a anterior é subtraída e a nova somada).
+    Falta: o que a demanda esperada supera o estoque (-Estoque Restante Estimado).
+    Excedente: o estoque além do Estoque Ideal Futuro da unidade.
+    """
+
+    CHAVES_CUBO = ['Estabelecimento', 'Tipo Produto', 'Situação']
+    MEDIDAS_CUBO = ['Produtos', 'Quantidade em estoque', 'Demanda Esperada', 'Quantidade Sugerida Compra', 'Falta', 'Excedente']
+    MEDIDAS_SKU = ['Quantidade em estoque', 'Demanda Esperada', 'Falta', 'Excedente', 'Estabelecimentos', 'Estabelecimentos em Falta']
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.contribuicoes = {}
+        self.fatias_cubo = {}
+        self.totais_sku = pd.DataFrame(columns=self.MEDIDAS_SKU, dtype=float)
+        self.descricoes = pd.Series(dtype=object)
+        self._cubo = None
+
+    def _contribuicao(self, resultado):
+        """Parcelas de uma unidade por SKU (uma linha por código)"""
+        resultado = resultado.drop_duplicates(subset='Código', keep='first')
+        codigos = resultado['Código'].astype(str).to_numpy()
+        restante = resultado['Estoque Restante Estimado'].to_numpy(dtype=float)
+        estoque = resultado['Quantidade em estoque'].to_numpy(dtype=float)
+        ideal = resultado['Estoque Ideal Futuro'].to_numpy(dtype=float) if 'Estoque Ideal Futuro' in resultado else estoque
+
+        return pd.DataFrame({
+            'Descrição': resultado['Descrição'].to_numpy() if 'Descrição' in resultado else '',
+            'Tipo Produto': resultado['Tipo Produto'].to_numpy() if 'Tipo Produto' in resultado else 'medicamentos',
+            'Situação': resultado['Situação'].to_numpy(),
+            'Quantidade em estoque': estoque,
+            'Demanda Esperada': resultado['Demanda Esperada'].to_numpy(dtype=float),
+            'Quantidade Sugerida Compra': resultado['Quantidade Sugerida Compra'].to_numpy(dtype=float),
+            'Falta': np.maximum(-restante, 0.0),
+            'Excedente': np.maximum(estoque - ideal, 0.0),
+            'Estabelecimentos': 1.0,
+            'Estabelecimentos em Falta': (restante < 0).astype(float)
+        }, index=pd.Index(codigos, name='Código'))
+
+    def _fatia_cubo(self, estabelecimento, contribuicao):
+        fatia = contribuicao.assign(Produtos=1, Estabelecimento=estabelecimento)
+        return fatia.groupby(self.CHAVES_CUBO, sort=False)[self.MEDIDAS_CUBO].sum()
+
+    def atualizar(self, estabelecimento, resultado):
+        """Inclui ou substitui o resultado de uma unidade nos agregados da rede"""
+        contribuicao = self._contribuicao(resultado)
+        fatia = self._fatia_cubo(estabelecimento, contribuicao)
+
+        with self.trava:
+            anterior = self.contribuicoes.get(estabelecimento)
+            totais = self.totais_sku
+            if anterior is not None:
+                totais = totais.sub(anterior[self.MEDIDAS_SKU], fill_value=0.0)
+            totais = totais.add(contribuicao[self.MEDIDAS_SKU], fill_value=0.0)
+            # Códigos que não estão em nenhuma unidade saem dos totais
+            self.totais_sku = totais[totais['Estabelecimentos'] > 0]
+
+            self.descricoes = contribuicao['Descrição'].combine_first(self.descricoes)
+            self.contribuicoes[estabelecimento] = contribuicao
+            self.fatias_cubo[estabelecimento] = fatia
+            self._cubo = None
+
+        logger.info(
+            f"Consolidação atualizada com '{estabelecimento}': {len(contribuicao)} produtos, "
+            f"{len(self.contribuicoes)} estabelecimentos na rede"
+        )
+
+    def remover(self, estabelecimento):
+        """Retira uma unidade dos agregados da rede"""
+        with self.trava:
+            anterior = self.contribuicoes.pop(estabelecimento, None)
+            if anterior is None:
+                return
+            totais = self.totais_sku.sub(anterior[self.MEDIDAS_SKU], fill_value=0.0)
+            self.totais_sku = totais[totais['Estabelecimentos'] > 0]
+            del self.fatias_cubo[estabelecimento]
+            self._cubo = None
+
+    @property
+    def estabelecimentos(self):
+        return sorted(self.contribuicoes)
+
+    def cubo(self):
+        """Cubo estabelecimento × tipo de produto × situação (recomposto só após mudanças)"""
+        with self.trava:
+            if self._cubo is None:
+                if self.fatias_cubo:
+                    self._cubo = pd.concat(self.fatias_cubo.values()).sort_index()
+                else:
+                    self._cubo = pd.DataFrame(
+                        columns=self.MEDIDAS_CUBO,
+                        index=pd.MultiIndex.from_tuples([], names=self.CHAVES_CUBO)
+                    )
+            return self._cubo
+
+    def resumo(self, nivel=('Tipo Produto', 'Situação')):
+        """Agregado da rede em um nível do cubo (ex: só 'Situação' ou só 'Estabelecimento')"""
+        return self.cubo().groupby(level=list(nivel)).sum()
+
+    def totais_produtos(self):
+        """Totais de cada SKU sobre a rede, com a descrição"""
+        with self.trava:
+            totais = self.totais_sku.copy()
+            descricoes = self.descricoes
+        totais.insert(0, 'Descrição', descricoes.reindex(totais.index).to_numpy())
+        totais[['Estabelecimentos', 'Estabelecimentos em Falta']] = totais[
+            ['Estabelecimentos', 'Estabelecimentos em Falta']
+        ].round().astype(int)
+        return totais.reset_index()
+
+    def candidatos_transferencia(self, quantidade_minima=1.0):
+        """Sugere transferências de unidades com excedente para unidades em falta
+
+        Só os SKUs com falta e excedente na rede (pelos totais pré-calculados) são
+        examinados. Em cada um, as maiores faltas são atendidas pelos maiores
+        excedentes, em ordem; só as transferências sugeridas consomem falta e excedente.
+        """
+        with self.trava:
+            totais = self.totais_sku
+            candidatos = totais.index[(totais['Falta'] > 0) & (totais['Excedente'] > 0)]
+            if len(candidatos) == 0:
+                return pd.DataFrame(columns=['Código', 'Descrição', 'Origem', 'Destino', 'Quantidade'])
+            partes = [
+                c.loc[c.index.isin(candidatos), ['Falta', 'Excedente']].assign(Estabelecimento=nome)
+                for nome, c in self.contribuicoes.items()
+            ]
+            descricoes = self.descricoes
+
+        posicoes = pd.concat(partes).reset_index()
+        transferencias = []
+        for codigo, grupo in posicoes.groupby('Código', sort=False):
+            faltas = grupo[grupo['Falta'] > 0].sort_values('Falta', ascending=False)
+            sobras = grupo[grupo['Excedente'] > 0].sort_values('Excedente', ascending=False)
+            disponivel = sobras['Excedente'].to_numpy(dtype=float).copy()
+            origens = sobras['Estabelecimento'].to_numpy()
+            inicio = 0
+            for destino, falta in zip(faltas['Estabelecimento'], faltas['Falta']):
+                # Origens esgotadas no início não são revisitadas
+                while inicio < len(disponivel) and disponivel[inicio] <= 0:
+                    inicio += 1
+                for j in range(inicio, len(disponivel)):
+                    if falta <= 0:
+                        break
+                    quantidade = min(falta, disponivel[j])
+                    # Origem ignorada (sem consumir falta nem excedente) se for o próprio destino
+                    # ou se a quantidade ficar abaixo do mínimo
+                    if origens[j] == destino or quantidade < quantidade_minima:
+                        continue
+                    transferencias.append((codigo, origens[j], destino, round(quantidade, 2)))
+                    falta -= quantidade
+                    disponivel[j] -= quantidade
+
+        resultado = pd.DataFrame(transferencias, columns=['Código', 'Origem', 'Destino', 'Quantidade'])
+        resultado.insert(1, 'Descrição', descricoes.reindex(resultado['Código']).to_numpy())
+        return resultado.sort_values('Quantidade', ascending=False, kind='stable').reset_index(drop=True)
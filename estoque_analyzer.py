@@ -1,18 +1,74 @@
 import pandas as pd
 import numpy as np
 import logging
+import hashlib
 import re
+from collections import OrderedDict
 from analise_avancada import AnaliseAvancada
+from cache_modelos import CacheModelos
+from conciliacao import ConciliadorProdutos
+from risco_ruptura import SimuladorRuptura
+from lotes_validade import ConsumoFEFO
+from tabela_fatores import TabelaFatores
+from razao_saidas import AgregadorRazao
+from backtest_previsao import ValidacaoPrevisao
+from classificacao_abc import ClassificacaoABCXYZ
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Etapas reportadas ao acompanhamento de progresso, na ordem de execução
+ETAPAS_ANALISE = ['carregar', 'detectar', 'mapear', 'juntar', 'calcular']
+
+class AnaliseCancelada(Exception):
+    """Indica que a análise foi cancelada antes de terminar"""
+
+def calcular_hash_arquivo(arquivo, tamanho_bloco=1024 * 1024):
+    """Calcula o SHA-256 do conteúdo de um arquivo (caminho ou objeto de arquivo)"""
+    sha = hashlib.sha256()
+    
+    if hasattr(arquivo, 'read'):
+        posicao = arquivo.tell() if hasattr(arquivo, 'tell') else None
+        arquivo.seek(0)
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            sha.update(bloco)
+        if posicao is not None:
+            arquivo.seek(posicao)
+    else:
+        with open(arquivo, 'rb') as f:
+            for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+                sha.update(bloco)
+    
+    return sha.hexdigest()
+
 class EstoqueAnalyzer:
     """Analisador de estoque com suporte a análise avançada"""
     
-    def __init__(self):
-        self.analise_avancada = AnaliseAvancada()
+    def __init__(self, max_planilhas_cache=0, pasta_cache_modelos=None):
+        # Pasta dos modelos de previsão persistidos entre análises (None desativa)
+        cache_modelos = CacheModelos(pasta_cache_modelos) if pasta_cache_modelos else None
+        self.analise_avancada = AnaliseAvancada(cache_modelos=cache_modelos)
+        
+        # Pares encontrados na última conciliação por descrição (para revisão)
+        self.conciliacao = None
+        # Relatório do último backtest das previsões (por SKU, por tipo e tempos)
+        self.validacao_previsao = None
+        # Saídas mensais (SKU × mês) dos produtos da última análise, para os gráficos
+        self.saidas_mensais = None
+        
+        # Cache opcional de planilhas já processadas (chave: hash do arquivo e configuração)
+        self.max_planilhas_cache = max_planilhas_cache
+        self._cache_planilhas = OrderedDict()
+        self.cache_acertos = 0
+        self.cache_falhas = 0
+    
+    def _reportar_etapa(self, progresso, cancelamento, etapa, fracao=0.0):
+        """Notifica a etapa atual e interrompe a análise se ela foi cancelada"""
+        if cancelamento is not None and cancelamento.is_set():
+            raise AnaliseCancelada()
+        if progresso is not None:
+            progresso(etapa, fracao)
     
     def detectar_linha_inicio(self, df):
         """Detecta automaticamente a linha de início dos dados"""
@@ -81,13 +137,41 @@ class EstoqueAnalyzer:
         
         return mapeamento
     
-    def carregar_planilha(self, arquivo, linha_inicio=None, mapeamento=None):
+    def carregar_planilha(self, arquivo, linha_inicio=None, mapeamento=None, progresso=None, cancelamento=None, fracao=0.0):
         """Carrega e processa uma planilha Excel"""
+        if not self.max_planilhas_cache:
+            return self._carregar_planilha(arquivo, linha_inicio, mapeamento, progresso, cancelamento, fracao)
+        
+        chave = (
+            calcular_hash_arquivo(arquivo),
+            linha_inicio,
+            tuple(sorted(mapeamento.items())) if mapeamento else None
+        )
+        
+        if chave in self._cache_planilhas:
+            self._reportar_etapa(progresso, cancelamento, 'mapear', fracao)
+            self.cache_acertos += 1
+            self._cache_planilhas.move_to_end(chave)
+            return self._cache_planilhas[chave].copy()
+        
+        self.cache_falhas += 1
+        df = self._carregar_planilha(arquivo, linha_inicio, mapeamento, progresso, cancelamento, fracao)
+        if df is not None:
+            self._cache_planilhas[chave] = df.copy()
+            while len(self._cache_planilhas) > self.max_planilhas_cache:
+                self._cache_planilhas.popitem(last=False)
+        
+        return df
+    
+    def _carregar_planilha(self, arquivo, linha_inicio=None, mapeamento=None, progresso=None, cancelamento=None, fracao=0.0):
+        """Lê a planilha do disco e extrai as colunas mapeadas"""
         try:
             # Carregar planilha
+            self._reportar_etapa(progresso, cancelamento, 'carregar', fracao)
             df = pd.read_excel(arquivo, header=None)
             
             # Detectar linha de início se não especificada
+            self._reportar_etapa(progresso, cancelamento, 'detectar', fracao)
             if linha_inicio is None:
                 linha_inicio = self.detectar_linha_inicio(df)
             
@@ -95,144 +179,525 @@ class EstoqueAnalyzer:
             df_dados = df.iloc[linha_inicio:].reset_index(drop=True)
             
             # Mapear colunas se não especificado
+            self._reportar_etapa(progresso, cancelamento, 'mapear', fracao)
             if mapeamento is None:
                 mapeamento = self.mapear_colunas_automaticamente(df_dados)
             
-            # Extrair dados
-            dados = {}
-            
-            if 'codigo' in mapeamento and 'descricao' in mapeamento:
-                # Combinar código e descrição
-                codigos = df_dados.iloc[:, mapeamento['codigo']].astype(str)
-                descricoes = df_dados.iloc[:, mapeamento['descricao']].astype(str)
-                dados['codigo_descricao'] = codigos + ' - ' + descricoes
-            elif 'codigo' in mapeamento:
-                dados['codigo_descricao'] = df_dados.iloc[:, mapeamento['codigo']].astype(str)
-            elif 'descricao' in mapeamento:
-                dados['codigo_descricao'] = df_dados.iloc[:, mapeamento['descricao']].astype(str)
-            
-            if 'unidade' in mapeamento:
-                dados['unidade'] = df_dados.iloc[:, mapeamento['unidade']].astype(str)
-            
-            if 'quantidade' in mapeamento:
-                dados['quantidade'] = pd.to_numeric(df_dados.iloc[:, mapeamento['quantidade']], errors='coerce')
-            
-            if 'saida' in mapeamento:
-                dados['saida'] = pd.to_numeric(df_dados.iloc[:, mapeamento['saida']], errors='coerce')
-            
-            # Criar DataFrame
-            df_final = pd.DataFrame(dados)
-            
-            # Limpar dados
-            df_final = df_final.dropna(subset=['codigo_descricao'])
-            df_final = df_final[df_final['codigo_descricao'].str.strip() != '']
-            
-            return df_final
+            return self.extrair_colunas(df_dados, mapeamento)
             
+        except AnaliseCancelada:
+            raise
         except Exception as e:
             logger.error(f"Erro ao carregar planilha: {str(e)}")
             return None
     
-    def analisar_estoque(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90):
-        """Analisa estoque com suporte a análise avançada"""
+    def extrair_colunas(self, df_dados, mapeamento):
+        """Extrai as colunas mapeadas (código e descrição combinados, unidade, quantidade, saída)"""
+        dados = {}
+        
+        if 'codigo' in mapeamento and 'descricao' in mapeamento:
+            # Combinar código e descrição
+            codigos = df_dados.iloc[:, mapeamento['codigo']].astype(str)
+            descricoes = df_dados.iloc[:, mapeamento['descricao']].astype(str)
+            dados['codigo_descricao'] = codigos + ' - ' + descricoes
+        elif 'codigo' in mapeamento:
+            dados['codigo_descricao'] = df_dados.iloc[:, mapeamento['codigo']].astype(str)
+        elif 'descricao' in mapeamento:
+            dados['codigo_descricao'] = df_dados.iloc[:, mapeamento['descricao']].astype(str)
+        
+        if 'unidade' in mapeamento:
+            dados['unidade'] = df_dados.iloc[:, mapeamento['unidade']].astype(str)
+        
+        if 'quantidade' in mapeamento:
+            dados['quantidade'] = pd.to_numeric(df_dados.iloc[:, mapeamento['quantidade']], errors='coerce')
+        
+        if 'saida' in mapeamento:
+            dados['saida'] = pd.to_numeric(df_dados.iloc[:, mapeamento['saida']], errors='coerce')
+        
+        # Criar DataFrame
+        df_final = pd.DataFrame(dados)
+        
+        # Limpar dados
+        df_final = df_final.dropna(subset=['codigo_descricao'])
+        df_final = df_final[df_final['codigo_descricao'].str.strip() != '']
+        
+        return df_final
+    
+    def carregar_razao_saidas(self, arquivo, mapeamento=None, progresso=None, cancelamento=None):
+        """Agrega um razão de dispensações (uma linha por saída) em saídas mensais
+        
+        O arquivo é lido em blocos, sem carregá-lo inteiro; o mapeamento aceita 'saida'
+        como sinônimo de 'quantidade' e precisa de uma coluna 'data'.
+        """
         try:
-            # Configurar análise avançada
-            self.analise_avancada.configurar_tipo_produto(tipo_produto, media_pacientes)
+            if mapeamento:
+                mapeamento = {('quantidade' if papel == 'saida' else papel): i for papel, i in mapeamento.items()}
             
-            # Configurações manuais
-            linha_inicio_estoque = config_manual.get('linha_inicio_estoque', None) if config_manual else None
-            linha_inicio_saidas = config_manual.get('linha_inicio_saidas', None) if config_manual else None
-            mapeamento_estoque = config_manual.get('mapeamento_estoque', None) if config_manual else None
-            mapeamento_saidas = config_manual.get('mapeamento_saidas', None) if config_manual else None
+            self._reportar_etapa(progresso, cancelamento, 'carregar', 0.5)
+            agregador = AgregadorRazao().agregar(
+                arquivo,
+                mapeamento,
+                lambda linhas: self._reportar_etapa(progresso, cancelamento, 'carregar', 0.5)
+            )
+            return self.formatar_saidas_razao(agregador.finalizar())
             
-            # Carregar planilhas
-            df_estoque = self.carregar_planilha(estoque_file, linha_inicio_estoque, mapeamento_estoque)
-            df_saidas = self.carregar_planilha(saidas_file, linha_inicio_saidas, mapeamento_saidas)
-            
-            if df_estoque is None or df_saidas is None:
-                return None
-            
-            logger.info(f"Planilha estoque carregada com {len(df_estoque)} registros")
-            logger.info(f"Planilha saidas carregada com {len(df_saidas)} registros")
-            
-            # Processar dados de estoque
-            df_estoque['codigo'] = df_estoque['codigo_descricao'].str.extract(r'(\d+)').astype(str)
-            df_estoque['descricao'] = df_estoque['codigo_descricao'].str.replace(r'^\d+\s*-\s*', '', regex=True)
-            
-            # Processar dados de saídas
-            df_saidas['codigo'] = df_saidas['codigo_descricao'].str.extract(r'(\d+)').astype(str)
-            df_saidas['descricao'] = df_saidas['codigo_descricao'].str.replace(r'^\d+\s*-\s*', '', regex=True)
+        except AnaliseCancelada:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao agregar razão de saídas: {str(e)}")
+            return None
+    
+    def formatar_saidas_razao(self, saidas):
+        """Converte as saídas mensais do razão (AgregadorRazao.finalizar) no formato das planilhas"""
+        return pd.DataFrame({
+            'codigo_descricao': saidas['codigo'] + ' - ' + saidas['descricao'],
+            'unidade': saidas['unidade'],
+            'mes': saidas['mes'],
+            'saida': saidas['saida']
+        })
+    
+    def separar_codigo_descricao(self, df):
+        """Separa o código numérico e a descrição da coluna combinada"""
+        # Sem dígitos o código fica 'nan' (com o tipo str do pandas 3, astype(str) mantém o NaN)
+        df['codigo'] = df['codigo_descricao'].str.extract(r'(\d+)', expand=False).astype(str).fillna('nan')
+        df['descricao'] = df['codigo_descricao'].str.replace(r'^\d+\s*-\s*', '', regex=True)
+        return df
+    
+    def preparar_planilhas(self, estoque_file, saidas_file, config_manual=None, progresso=None, cancelamento=None):
+        """Carrega as planilhas de estoque e saídas prontas para a análise"""
+        # Configurações manuais
+        linha_inicio_estoque = config_manual.get('linha_inicio_estoque', None) if config_manual else None
+        linha_inicio_saidas = config_manual.get('linha_inicio_saidas', None) if config_manual else None
+        mapeamento_estoque = config_manual.get('mapeamento_estoque', None) if config_manual else None
+        mapeamento_saidas = config_manual.get('mapeamento_saidas', None) if config_manual else None
+        
+        # Carregar planilhas
+        df_estoque = self.carregar_planilha(
+            estoque_file, linha_inicio_estoque, mapeamento_estoque, progresso, cancelamento, 0.0
+        )
+        if config_manual and config_manual.get('razao_saidas'):
+            df_saidas = self.carregar_razao_saidas(saidas_file, mapeamento_saidas, progresso, cancelamento)
+        else:
+            df_saidas = self.carregar_planilha(
+                saidas_file, linha_inicio_saidas, mapeamento_saidas, progresso, cancelamento, 0.5
+            )
+        
+        if df_estoque is None or df_saidas is None:
+            return None, None
+        
+        logger.info(f"Planilha estoque carregada com {len(df_estoque)} registros")
+        logger.info(f"Planilha saidas carregada com {len(df_saidas)} registros")
+        
+        # Processar dados de estoque e saídas
+        df_estoque = self.separar_codigo_descricao(df_estoque)
+        df_saidas = self.separar_codigo_descricao(df_saidas)
+        
+        return df_estoque, df_saidas
+    
+    def conciliar_produtos(self, df_estoque, df_saidas, produtos_comuns, conciliador=None):
+        """Associa produtos sem código correspondente pela descrição e unidade
+        
+        As linhas de saídas conciliadas recebem o código do produto de estoque.
+        Retorna as saídas atualizadas, o novo conjunto de produtos em comum e os pares.
+        """
+        conciliador = conciliador if conciliador is not None else ConciliadorProdutos()
+        
+        sobras_estoque = df_estoque[~df_estoque['codigo'].isin(produtos_comuns)]
+        sobras_saidas = df_saidas[~df_saidas['codigo'].isin(produtos_comuns)]
+        
+        pares = conciliador.conciliar(
+            sobras_estoque.drop_duplicates(subset=['codigo', 'descricao']),
+            sobras_saidas.drop_duplicates(subset=['codigo', 'descricao'])
+        )
+        
+        # Só é possível reatribuir para códigos de estoque válidos (o regex encontrou dígitos)
+        pares = pares[pares['Código Estoque'] != 'nan'].drop_duplicates(subset='Código Estoque')
+        logger.info(f"Produtos conciliados por descrição: {len(pares)}")
+        
+        if len(pares) > 0:
+            chave_pares = pares['Código Saídas'] + '\x00' + pares['Descrição Saídas']
+            novo_codigo = pd.Series(pares['Código Estoque'].to_numpy(), index=chave_pares.to_numpy())
             
-            # Encontrar produtos em comum
-            produtos_comuns = set(df_estoque['codigo']) & set(df_saidas['codigo'])
-            logger.info(f"Produtos encontrados em ambas as planilhas: {len(produtos_comuns)}")
+            chave_saidas = df_saidas['codigo'] + '\x00' + df_saidas['descricao']
+            conciliadas = chave_saidas.isin(novo_codigo.index)
+            df_saidas = df_saidas.copy()
+            df_saidas.loc[conciliadas, 'codigo'] = chave_saidas[conciliadas].map(novo_codigo)
             
-            if len(produtos_comuns) == 0:
-                return None
+            produtos_comuns = set(produtos_comuns) | set(pares['Código Estoque'])
+        
+        return df_saidas, produtos_comuns, pares.reset_index(drop=True)
+    
+    def prever_base_random_forest(self, df_saidas, codigos, meses_futuros=3):
+        """Média mensal prevista pelo random forest para os próximos meses de cada código
+        
+        Códigos com menos de três meses de histórico ficam com NaN.
+        """
+        codigos = pd.Index(codigos).astype(str)
+        saidas = df_saidas[df_saidas['codigo'].isin(codigos)]
+        if 'mes' in saidas:
+            saidas = saidas.sort_values(['codigo', 'mes'], kind='stable')
+        historicos = {
+            codigo: grupo.to_numpy(dtype=float)
+            for codigo, grupo in pd.to_numeric(saidas['saida'], errors='coerce').fillna(0.0).groupby(saidas['codigo'], sort=False)
+        }
+        previsoes = self.analise_avancada.prever_demanda_lote(historicos, meses_futuros)
+        return pd.Series(
+            [np.mean(previsoes[c]) if previsoes.get(c) is not None else np.nan for c in codigos],
+            index=codigos, dtype=float
+        )
+    
+    def montar_saidas_mensais(self, df_saidas, codigos):
+        """Matriz SKU × mês (float32) das saídas dos códigos informados
+        
+        Com a coluna 'mes' (razão de dispensações) as colunas são os meses; sem ela,
+        as linhas de cada código são os meses em ordem ('Mês 1', 'Mês 2', ...).
+        """
+        codigos = pd.Index(codigos).astype(str)
+        saidas = df_saidas[df_saidas['codigo'].isin(codigos)]
+        valores = pd.to_numeric(saidas['saida'], errors='coerce') if 'saida' in saidas else pd.Series(0.0, index=saidas.index)
+        if 'mes' in saidas:
+            colunas = saidas['mes']
+        else:
+            colunas = 'Mês ' + (saidas.groupby('codigo', sort=False).cumcount() + 1).astype(str)
+        
+        matriz = pd.DataFrame({'codigo': saidas['codigo'].to_numpy(), 'coluna': colunas.to_numpy(), 'saida': valores.to_numpy()})
+        matriz = matriz.pivot_table(index='codigo', columns='coluna', values='saida', aggfunc='sum', sort=False)
+        if 'mes' in saidas:
+            matriz = matriz.sort_index(axis=1)
+        return matriz.reindex(codigos).astype(np.float32)
+    
+    def calcular_resultados(self, df_estoque, df_saidas, codigos, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90, progresso=None, cancelamento=None, classificacao=None):
+        """Calcula as métricas de estoque para os códigos informados
+        
+        Os fatores de correção são resolvidos por SKU (tabela de fatores da análise
+        avançada, se houver) e aplicados de uma só vez a todo o catálogo.
+        classificacao (ClassificacaoABCXYZ) acrescenta as classes ABC/XYZ e aplica a
+        política de cada classe (fatores e base de previsão da demanda).
+        """
+        self._reportar_etapa(progresso, cancelamento, 'calcular', 0.0)
+        codigos = pd.Index(list(codigos))
+        
+        # Dados do estoque (primeira ocorrência de cada código)
+        estoque = df_estoque.drop_duplicates(subset='codigo').set_index('codigo').reindex(codigos)
+        estoque_atual = estoque['quantidade'] if 'quantidade' in estoque else pd.Series(0, index=codigos)
+        descricao = estoque['descricao'] if 'descricao' in estoque else pd.Series('', index=codigos)
+        unidade = estoque['unidade'] if 'unidade' in estoque else pd.Series('', index=codigos)
+        
+        # Média das saídas de cada código
+        if 'saida' in df_saidas:
+            media_saida_mensal = df_saidas.groupby('codigo')['saida'].mean().reindex(codigos)
+        else:
+            media_saida_mensal = pd.Series(0.0, index=codigos)
+        
+        self._reportar_etapa(progresso, cancelamento, 'calcular', 0.5)
+        
+        # Fatores por SKU e métricas calculadas em lote
+        fatores = self.analise_avancada.resolver_fatores(codigos, tipo_produto)
+        base_demanda = media_saida_mensal.to_numpy(dtype=float)
+        classes = None
+        if classificacao is not None:
+            classes = classificacao.classificar(df_saidas, codigos)
+            fatores, metodo = classificacao.aplicar_politicas(fatores, classes)
+            usar_modelo = metodo == 'random_forest'
+            if usar_modelo.any():
+                # Sem histórico suficiente para o modelo, a base continua sendo a média
+                previsto = self.prever_base_random_forest(df_saidas, codigos[usar_modelo]).to_numpy()
+                sem_previsao = np.isnan(previsto)
+                base_demanda = base_demanda.copy()
+                base_demanda[usar_modelo] = np.where(sem_previsao, base_demanda[usar_modelo], previsto)
+                metodo[np.flatnonzero(usar_modelo)[sem_previsao]] = 'media_historica'
+        
+        metricas = self.analise_avancada.calcular_metricas(
+            base_demanda,
+            estoque_atual.to_numpy(dtype=float),
+            fatores,
+            media_pacientes,
+            periodo_previsao
+        )
+        
+        df_resultado = pd.DataFrame({
+            'Código': codigos.to_numpy(),
+            'Descrição': descricao.to_numpy(),
+            'Unidade': unidade.to_numpy(),
+            'Quantidade em estoque': estoque_atual.to_numpy(),
+            'Média de Saída Mensal': media_saida_mensal.to_numpy(),
+            **metricas,
+            'Situação': np.where(metricas['Estoque Restante Estimado'] < 0, 'Comprar', 'OK')
+        })
+        
+        # Adicionar informações de análise avançada
+        df_resultado['Tipo Produto'] = fatores['tipo_produto'].to_numpy()
+        if fatores['categoria'].notna().any():
+            df_resultado['Categoria'] = fatores['categoria'].to_numpy()
+        df_resultado['Fonte Fator'] = fatores['Fonte Fator'].to_numpy()
+        if classes is not None:
+            for coluna in classes.columns:
+                df_resultado[coluna] = classes[coluna].to_numpy()
+            df_resultado['Base Previsão'] = metodo
+            df_resultado['Demanda Base'] = base_demanda
+        if media_pacientes:
+            df_resultado['Média Pacientes'] = media_pacientes
+        df_resultado['Período Previsão (dias)'] = periodo_previsao
+        
+        return df_resultado
+    
+    def avaliar_risco_ruptura(self, df_resultado, df_saidas, simulador=None, desvio=None, primeiro_bloco=0):
+        """Acrescenta ao resultado a probabilidade de ruptura e o ponto de pedido simulados
+        
+        desvio (estimado no catálogo todo) e primeiro_bloco permitem simular o
+        resultado em partes com os mesmos valores da simulação completa.
+        """
+        proprio = simulador is None
+        simulador = simulador if simulador is not None else SimuladorRuptura()
+        
+        if desvio is None:
+            desvio = simulador.estimar_variacao(df_saidas, df_resultado['Código'], df_resultado['Demanda Esperada'])
+        try:
+            risco = simulador.simular(
+                df_resultado['Demanda Esperada'].to_numpy(dtype=float),
+                desvio,
+                df_resultado['Quantidade em estoque'].to_numpy(dtype=float),
+                df_resultado['Período Previsão (dias)'].iloc[0] if len(df_resultado) > 0 else 90,
+                primeiro_bloco
+            )
+        finally:
+            if proprio:
+                simulador.fechar()
+        
+        df_resultado = df_resultado.copy()
+        for coluna in risco.columns:
+            df_resultado[coluna] = risco[coluna].to_numpy()
+        return df_resultado
+    
+    def aplicar_lotes(self, df_resultado, lotes, data_base=None, consumo=None):
+        """Acrescenta ao resultado o estoque utilizável e a perda por validade no consumo FEFO"""
+        consumo = consumo if consumo is not None else ConsumoFEFO()
+        periodo = df_resultado['Período Previsão (dias)'].iloc[0] if len(df_resultado) > 0 else 90
+        
+        fefo = consumo.simular(
+            lotes,
+            df_resultado['Código'],
+            df_resultado['Demanda Esperada'].to_numpy(dtype=float) / 30,
+            data_base,
+            periodo
+        )
+        
+        df_resultado = df_resultado.copy()
+        for coluna in fefo.columns:
+            df_resultado[coluna] = fefo[coluna].to_numpy()
+        return df_resultado
+    
+    def validar_previsoes(self, df_resultado, df_saidas, validacao=None, cancelamento=None, series=None):
+        """Acrescenta ao resultado o erro do método de previsão mais preciso de cada produto
+        
+        O relatório completo do backtest (todos os métodos, por SKU e por tipo, e o
+        tempo de cada método) fica em self.validacao_previsao. series: matriz de
+        saídas já montada (ValidacaoPrevisao.montar_series), usada nas partes.
+        """
+        proprio = validacao is None
+        validacao = validacao if validacao is not None else ValidacaoPrevisao()
+        
+        try:
+            relatorio = validacao.executar(
+                df_saidas,
+                tipos=df_resultado.set_index('Código')['Tipo Produto'],
+                codigos=df_resultado['Código'],
+                analise_avancada=self.analise_avancada,
+                cancelamento=cancelamento,
+                series=series
+            )
+        finally:
+            if proprio:
+                validacao.fechar()
+        if relatorio is None:
+            raise AnaliseCancelada()
+        self.validacao_previsao = relatorio
+        
+        por_sku = relatorio['por_sku'].sort_values(['MAE', 'Método'], kind='stable')
+        melhor = por_sku.drop_duplicates(subset='Código').set_index('Código')
+        
+        df_resultado = df_resultado.copy()
+        df_resultado['Melhor Método Previsão'] = df_resultado['Código'].map(melhor['Método'])
+        df_resultado['MAE Previsão'] = df_resultado['Código'].map(melhor['MAE'])
+        df_resultado['MAPE Previsão (%)'] = df_resultado['Código'].map(melhor['MAPE (%)'])
+        df_resultado['Viés Previsão'] = df_resultado['Código'].map(melhor['Viés'])
+        return df_resultado
+    
+    def ordenar_por_urgencia(self, df_resultado):
+        """Ordena os produtos da maior para a menor falta projetada (Estoque Restante Estimado)"""
+        return df_resultado.sort_values(
+            ['Estoque Restante Estimado', 'Código'], kind='stable'
+        ).reset_index(drop=True)
+    
+    def juntar_partes(self, partes):
+        """Une as partes de analisar_estoque_progressivo no resultado de analisar_estoque"""
+        # Colunas opcionais (ex.: 'Categoria') podem faltar em algumas partes
+        colunas = list(max((p.columns for p in partes), key=len))
+        colunas += list(dict.fromkeys(c for p in partes for c in p.columns if c not in colunas))
+        return self.ordenar_por_urgencia(pd.concat(partes, ignore_index=True).reindex(columns=colunas))
+    
+    def analisar_estoque(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90, progresso=None, cancelamento=None, conciliar=False, simular_risco=False, lotes_file=None, tabela_fatores=None, validar_previsao=False, classificar_abc=False, memoria_maxima_mb=None):
+        """Analisa estoque com suporte a análise avançada
+        
+        progresso, se informado, é chamado como progresso(etapa, fracao) a cada etapa
+        de ETAPAS_ANALISE. Se o evento cancelamento for acionado, a análise é
+        interrompida com AnaliseCancelada.
+        conciliar (True ou um ConciliadorProdutos) tenta associar pela descrição os
+        produtos cujos códigos não coincidem; os pares ficam em self.conciliacao e nas
+        colunas 'Código Saídas Conciliado' e 'Score Conciliação' do resultado.
+        simular_risco (True ou um SimuladorRuptura) acrescenta a probabilidade de
+        ruptura no período, o nível de serviço e o ponto de pedido de cada produto.
+        lotes_file, uma planilha de lotes com validade, acrescenta o estoque
+        utilizável, a perda projetada por validade e o prazo efetivo (consumo FEFO).
+        tabela_fatores (planilha ou TabelaFatores) define fatores de correção por tipo,
+        categoria ou SKU; tipo_produto vale para os produtos que a tabela não classifica.
+        validar_previsao (True ou um ValidacaoPrevisao) executa o backtest com origem
+        móvel dos métodos de previsão e acrescenta o erro do melhor método de cada produto.
+        classificar_abc (True ou um ClassificacaoABCXYZ, com políticas por classe)
+        acrescenta as classes ABC (volume de saídas) e XYZ (variabilidade da demanda).
+        memoria_maxima_mb executa a análise fora da memória (AnaliseParticionada): as
+        planilhas são particionadas por SKU em disco e analisadas por partes dentro desse
+        limite; conciliação, backtest e classificação ABC/XYZ não são feitos nesse modo.
+        Os produtos saem ordenados por urgência (ordenar_por_urgencia).
+        """
+        try:
+            partes = list(self.analisar_estoque_progressivo(
+                estoque_file, saidas_file, config_manual, tipo_produto, media_pacientes, periodo_previsao,
+                progresso, cancelamento, conciliar, simular_risco, lotes_file, tabela_fatores,
+                validar_previsao, classificar_abc, memoria_maxima_mb, tamanho_parte=None
+            ))
+            return self.juntar_partes(partes) if partes else None
             
-            # Criar resultado
-            resultados = []
+        except AnaliseCancelada:
+            raise
+        except Exception as e:
+            logger.error(f"Erro na análise: {str(e)}")
+            return None
+    
+    def analisar_estoque_progressivo(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos', media_pacientes=None, periodo_previsao=90, progresso=None, cancelamento=None, conciliar=False, simular_risco=False, lotes_file=None, tabela_fatores=None, validar_previsao=False, classificar_abc=False, memoria_maxima_mb=None, tamanho_parte=2000):
+        """Gera o resultado da análise em partes, dos produtos mais urgentes aos menos urgentes
+        
+        Os indicadores de todo o catálogo são calculados de uma vez (em lote); as etapas
+        mais lentas (lotes, risco de ruptura e backtest) são feitas parte a parte, na
+        ordem do Estoque Restante Estimado, e cada parte é entregue assim que fica pronta.
+        Os parâmetros são os de analisar_estoque, e juntar_partes(partes) é idêntico ao
+        resultado dele. tamanho_parte=None gera uma parte só; com simular_risco ele é
+        arredondado para um múltiplo do bloco da simulação. Na análise fora da memória,
+        cada parte é uma partição (ordenada por urgência dentro dela).
+        Erros de leitura encerram o gerador sem partes.
+        """
+        # Configurar análise avançada
+        if tabela_fatores is not None and not isinstance(tabela_fatores, TabelaFatores):
+            arquivo_fatores, tabela_fatores = tabela_fatores, TabelaFatores()
+            if tabela_fatores.carregar(arquivo_fatores) is None:
+                return
+        self.analise_avancada.configurar_tipo_produto(tipo_produto, media_pacientes, tabela_fatores)
+        
+        if memoria_maxima_mb:
+            # Importado aqui: analise_particionada depende deste módulo
+            from analise_particionada import AnaliseParticionada
             
-            for codigo in produtos_comuns:
-                # Dados do estoque
-                estoque_produto = df_estoque[df_estoque['codigo'] == codigo].iloc[0]
-                estoque_atual = estoque_produto.get('quantidade', 0)
-                descricao = estoque_produto.get('descricao', '')
-                unidade = estoque_produto.get('unidade', '')
-                
-                # Dados das saídas
-                saidas_produto = df_saidas[df_saidas['codigo'] == codigo]
-                media_saida_mensal = saidas_produto.get('saida', pd.Series([0])).mean()
-                
-                # Calcular demanda esperada com análise avançada
-                demanda_esperada = self.analise_avancada.calcular_demanda_esperada(media_saida_mensal)
-                
-                # Calcular estoque restante
-                estoque_restante = estoque_atual - demanda_esperada
+            if conciliar or validar_previsao or classificar_abc:
+                logger.warning("Conciliação, backtest e classificação ABC/XYZ são ignorados na análise fora da memória")
+            self.conciliacao = None
+            self.validacao_previsao = None
+            self.saidas_mensais = None
+            for parte in AnaliseParticionada(self, memoria_mb=memoria_maxima_mb).analisar_particoes(
+                estoque_file, saidas_file, config_manual, tipo_produto, media_pacientes, periodo_previsao,
+                progresso, cancelamento, simular_risco=simular_risco, lotes_file=lotes_file,
+                tabela_fatores=tabela_fatores
+            ):
+                yield self.ordenar_por_urgencia(parte)
+            return
+        
+        # Lotes pedidos e ilegíveis encerram a análise (o resultado sairia sem as colunas FEFO)
+        lotes = ConsumoFEFO().carregar_lotes(lotes_file) if lotes_file is not None else None
+        if lotes_file is not None and lotes is None:
+            logger.error("Planilha de lotes não pôde ser lida; análise interrompida")
+            return
+        
+        df_estoque, df_saidas = self.preparar_planilhas(
+            estoque_file, saidas_file, config_manual, progresso, cancelamento
+        )
+        
+        if df_estoque is None or df_saidas is None:
+            return
+        
+        # Encontrar produtos em comum
+        self._reportar_etapa(progresso, cancelamento, 'juntar')
+        produtos_comuns = set(df_estoque['codigo']) & set(df_saidas['codigo'])
+        logger.info(f"Produtos encontrados em ambas as planilhas: {len(produtos_comuns)}")
+        
+        self.conciliacao = None
+        if conciliar:
+            df_saidas, produtos_comuns, self.conciliacao = self.conciliar_produtos(
+                df_estoque, df_saidas, produtos_comuns,
+                conciliar if isinstance(conciliar, ConciliadorProdutos) else None
+            )
+        
+        if len(produtos_comuns) == 0:
+            return
+        
+        # Códigos em ordem: o resultado (e os empates da classificação) não dependem da ordem do conjunto
+        df_resultado = self.calcular_resultados(
+            df_estoque, df_saidas, sorted(produtos_comuns, key=str), tipo_produto, media_pacientes, periodo_previsao,
+            progresso, cancelamento,
+            classificacao=(
+                classificar_abc if isinstance(classificar_abc, ClassificacaoABCXYZ)
+                else ClassificacaoABCXYZ() if classificar_abc else None
+            )
+        )
+        df_resultado = self.ordenar_por_urgencia(df_resultado)
+        
+        self.saidas_mensais = self.montar_saidas_mensais(df_saidas, df_resultado['Código'])
+        
+        if self.conciliacao is not None:
+            pares = self.conciliacao.set_index('Código Estoque')
+            df_resultado['Código Saídas Conciliado'] = df_resultado['Código'].map(pares['Código Saídas'])
+            df_resultado['Score Conciliação'] = df_resultado['Código'].map(pares['Score'])
+        
+        tamanho = tamanho_parte or max(len(df_resultado), 1)
+        simulador = desvio = None
+        if simular_risco:
+            simulador = simular_risco if isinstance(simular_risco, SimuladorRuptura) else SimuladorRuptura()
+            # Variação estimada no catálogo todo; partes alinhadas aos blocos da simulação
+            desvio = simulador.estimar_variacao(df_saidas, df_resultado['Código'], df_resultado['Demanda Esperada'])
+            tamanho = -(-tamanho // simulador.tamanho_bloco) * simulador.tamanho_bloco
+        
+        self.validacao_previsao = None
+        validacao = series = None
+        relatorios = []
+        if validar_previsao:
+            validacao = validar_previsao if isinstance(validar_previsao, ValidacaoPrevisao) else ValidacaoPrevisao()
+            # Matriz SKU × mês montada uma vez; cada parte só seleciona as suas linhas
+            series = validacao.montar_series(df_saidas)
+        
+        try:
+            for inicio in range(0, len(df_resultado), tamanho):
+                parte = df_resultado.iloc[inicio:inicio + tamanho]
                 
-                # Determinar situação
-                if estoque_restante < 0:
-                    situacao = 'Comprar'
-                else:
-                    situacao = 'OK'
+                if lotes is not None:
+                    parte = self.aplicar_lotes(parte, lotes)
                 
-                # Calcular prazo de estoque
-                prazo_estoque = self.analise_avancada.calcular_prazo_estoque(estoque_atual, demanda_esperada)
+                if simulador is not None:
+                    parte = self.avaliar_risco_ruptura(
+                        parte, df_saidas, simulador, desvio[inicio:inicio + tamanho], inicio // simulador.tamanho_bloco
+                    )
                 
-                # Sugerir quantidade para compra
-                quantidade_sugerida = self.analise_avancada.sugerir_quantidade_compra(
-                    estoque_atual, demanda_esperada
-                )
+                if validacao is not None:
+                    parte = self.validar_previsoes(parte, df_saidas, validacao, cancelamento, series)
+                    relatorios.append(self.validacao_previsao)
                 
-                # Calcular estoque ideal futuro baseado no período de previsão
-                estoque_ideal_futuro = self.analise_avancada.calcular_estoque_ideal_futuro(
-                    demanda_esperada, periodo_previsao
+                self._reportar_etapa(
+                    progresso, cancelamento, 'calcular', 0.5 + 0.5 * min(inicio + tamanho, len(df_resultado)) / len(df_resultado)
                 )
-                
-                resultados.append({
-                    'Código': codigo,
-                    'Descrição': descricao,
-                    'Unidade': unidade,
-                    'Quantidade em estoque': estoque_atual,
-                    'Média de Saída Mensal': media_saida_mensal,
-                    'Demanda Esperada': demanda_esperada,
-                    'Estoque Restante Estimado': estoque_restante,
-                    'Prazo Estoque (dias)': prazo_estoque,
-                    'Quantidade Sugerida Compra': quantidade_sugerida,
-                    'Estoque Ideal Futuro': estoque_ideal_futuro,
-                    'Situação': situacao
-                })
-            
-            df_resultado = pd.DataFrame(resultados)
-            
-            # Adicionar informações de análise avançada
-            df_resultado['Tipo Produto'] = tipo_produto
-            if media_pacientes:
-                df_resultado['Média Pacientes'] = media_pacientes
-            df_resultado['Período Previsão (dias)'] = periodo_previsao
-            
-            return df_resultado
-            
-        except Exception as e:
-            logger.error(f"Erro na análise: {str(e)}")
-            return None 
\ No newline at end of file
+                yield parte
+        finally:
+            # Pools criados aqui são encerrados; os recebidos ficam com quem os passou
+            if simulador is not None and simulador is not simular_risco:
+                simulador.fechar()
+            if validacao is not None and validacao is not validar_previsao:
+                validacao.fechar()
+        
+        if len(relatorios) > 1:
+            self.validacao_previsao = validacao.combinar(relatorios, self.analise_avancada)
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Cores das situações, iguais às da tabela de resultados
+CORES_SITUACAO = {'OK': '#2e8b57', 'Comprar': '#cc0000'}
+
+def binar_prazo(prazo, situacao, limite=365, n_faixas=40):
+    """Contagem de produtos por faixa de prazo de estoque (dias) e situação
+
+    Prazos acima do limite entram na última faixa; prazos infinitos (sem demanda)
+    são contados à parte. Retorna (DataFrame faixa × situação, quantidade sem demanda).
+    """
+    prazo = np.asarray(prazo, dtype=float)
+    situacao = np.asarray(situacao, dtype=object)
+    finito = np.isfinite(prazo)
+
+    bordas = np.linspace(0, limite, n_faixas + 1)
+    faixa = np.clip(np.searchsorted(bordas, np.clip(prazo[finito], 0, limite), side='right') - 1, 0, n_faixas - 1)
+    contagem = pd.crosstab(faixa, situacao[finito]).reindex(range(n_faixas), fill_value=0)
+    contagem.index = (bordas[:-1] + bordas[1:]) / 2
+    return contagem, int((~finito).sum())
+
+def grafico_prazo(resultado, limite=365, n_faixas=40):
+    """Histograma pré-agrupado da cobertura em dias (só as contagens vão ao navegador)"""
+    contagem, sem_demanda = binar_prazo(resultado['Prazo Estoque (dias)'], resultado['Situação'], limite, n_faixas)
+    largura = limite / n_faixas
+
+    figura = go.Figure()
+    for situacao in contagem.columns:
+        figura.add_trace(go.Bar(
+            x=contagem.index,
+            y=contagem[situacao],
+            width=largura,
+            name=situacao,
+            marker_color=CORES_SITUACAO.get(situacao)
+        ))
+    figura.update_layout(
+        barmode='stack',
+        title=f"Cobertura do estoque em dias (≥ {limite} na última faixa; {sem_demanda} produtos sem demanda)",
+        xaxis_title="Prazo de estoque (dias)",
+        yaxis_title="Produtos",
+        bargap=0
+    )
+    return figura
+
+def amostrar_dispersao(x, y, prioridade, max_pontos=4000, n_celulas=150):
+    """Índices de uma amostra da dispersão com no máximo max_pontos pontos
+
+    Os pontos são agrupados em uma grade em escala logarítmica e cada célula ocupada
+    fica com o ponto de maior prioridade, o que preserva a forma da nuvem e os
+    extremos. Retorna (índices, produtos representados por cada ponto).
+    """
+    x = np.log1p(np.maximum(np.nan_to_num(np.asarray(x, dtype=float)), 0))
+    y = np.log1p(np.maximum(np.nan_to_num(np.asarray(y, dtype=float)), 0))
+    if len(x) <= max_pontos:
+        return np.arange(len(x)), np.ones(len(x), dtype=int)
+
+    def celula(v):
+        escala = v.max() if len(v) and v.max() > 0 else 1.0
+        return np.minimum((v / escala * n_celulas).astype(np.int64), n_celulas - 1)
+
+    ids = celula(x) * n_celulas + celula(y)
+    ordem = np.lexsort((-np.asarray(prioridade, dtype=float), ids))
+    _, inicio, contagem = np.unique(ids[ordem], return_index=True, return_counts=True)
+    indices, representados = ordem[inicio], contagem
+
+    if len(indices) > max_pontos:
+        manter = np.argsort(-np.asarray(prioridade, dtype=float)[indices], kind='stable')[:max_pontos]
+        indices, representados = indices[manter], representados[manter]
+    return indices, representados
+
+def eixo_log1p(maximo):
+    """Posições (em log1p) e rótulos dos ticks 0, 1, 10, 100... de um eixo até maximo"""
+    potencias = 10.0 ** np.arange(0, max(int(np.ceil(np.log10(max(maximo, 1.0)))), 0) + 1)
+    valores = np.r_[0.0, potencias]
+    return np.log1p(valores), [f"{v:,.0f}" for v in valores]
+
+def grafico_estoque_demanda(resultado, max_pontos=4000):
+    """Dispersão estoque × demanda esperada em WebGL, com amostra limitada a max_pontos
+
+    Os eixos usam log(1 + valor) com rótulos nos valores originais: a escala comprime
+    os produtos grandes como um eixo logarítmico, mas mantém visíveis os zeros
+    (produtos sem estoque ou sem demanda). Valores negativos são tratados como zero.
+    """
+    demanda = np.maximum(np.nan_to_num(resultado['Demanda Esperada'].to_numpy(dtype=float)), 0)
+    estoque = np.maximum(np.nan_to_num(resultado['Quantidade em estoque'].to_numpy(dtype=float)), 0)
+    # Prioridade para os produtos com maior falta (Estoque Restante mais negativo)
+    prioridade = -resultado['Estoque Restante Estimado'].to_numpy(dtype=float)
+    indices, representados = amostrar_dispersao(demanda, estoque, prioridade, max_pontos)
+    amostra = resultado.iloc[indices]
+    situacoes = amostra['Situação'].to_numpy()
+
+    figura = go.Figure()
+    for situacao in pd.unique(situacoes):
+        posicoes = np.flatnonzero(situacoes == situacao)
+        grupo = amostra.iloc[posicoes]
+        figura.add_trace(go.Scattergl(
+            x=np.log1p(demanda[indices[posicoes]]),
+            y=np.log1p(estoque[indices[posicoes]]),
+            mode='markers',
+            name=situacao,
+            marker=dict(color=CORES_SITUACAO.get(situacao), size=5, opacity=0.7),
+            # Colunas object: os valores numéricos mantêm o tipo para a formatação do hover
+            customdata=np.column_stack([np.asarray(coluna, dtype=object) for coluna in (
+                grupo['Código'].astype(str), grupo['Descrição'].astype(str), representados[posicoes],
+                demanda[indices[posicoes]], estoque[indices[posicoes]]
+            )]),
+            hovertemplate="%{customdata[0]} - %{customdata[1]}<br>Demanda: %{customdata[3]:,.1f}"
+                          "<br>Estoque: %{customdata[4]:,.0f}"
+                          "<br>Produtos representados: %{customdata[2]}<extra></extra>"
+        ))
+
+    maximo = float(np.max(np.r_[demanda, estoque, 1.0]))
+    # log1p preserva a igualdade: a reta estoque = demanda continua sendo y = x
+    figura.add_trace(go.Scattergl(
+        x=[0, np.log1p(maximo)], y=[0, np.log1p(maximo)], mode='lines', name='Estoque = demanda do mês',
+        line=dict(color='gray', dash='dash'), hoverinfo='skip'
+    ))
+    posicoes_ticks, rotulos_ticks = eixo_log1p(maximo)
+    figura.update_layout(
+        title=f"Estoque × demanda esperada ({len(amostra):,} de {len(resultado):,} produtos exibidos; escala log(1 + valor))",
+        xaxis=dict(title="Demanda esperada (mensal)", tickvals=posicoes_ticks, ticktext=rotulos_ticks),
+        yaxis=dict(title="Quantidade em estoque", tickvals=posicoes_ticks, ticktext=rotulos_ticks)
+    )
+    return figura
+
+def lttb(x, y, n_pontos):
+    """Reduz uma série a n_pontos pelo método Largest-Triangle-Three-Buckets
+
+    Mantém o primeiro e o último ponto e, em cada faixa intermediária, o ponto que
+    forma o maior triângulo com o ponto escolhido na faixa anterior e a média da
+    faixa seguinte (preserva picos e vales).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if n_pontos >= len(x) or n_pontos < 3:
+        return x, y
+
+    faixas = np.linspace(1, len(x) - 1, n_pontos - 1).astype(int)
+    escolhidos = [0]
+    for i in range(n_pontos - 2):
+        inicio, fim = faixas[i], faixas[i + 1]
+        proximo_fim = faixas[i + 2] if i + 2 < len(faixas) else len(x)
+        media_x = x[fim:proximo_fim].mean() if proximo_fim > fim else x[-1]
+        media_y = y[fim:proximo_fim].mean() if proximo_fim > fim else y[-1]
+        a = escolhidos[-1]
+        areas = np.abs(
+            (x[a] - media_x) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (media_y - y[a])
+        )
+        escolhidos.append(inicio + int(np.argmax(areas)))
+    escolhidos.append(len(x) - 1)
+    return x[escolhidos], y[escolhidos]
+
+def grafico_tendencia(saidas_mensais, codigos=None, max_pontos=300):
+    """Tendência das saídas: faixa p10–p90 e mediana do catálogo, mais os SKUs escolhidos
+
+    saidas_mensais: DataFrame SKU × mês. A faixa é calculada no servidor (uma linha
+    por mês, independentemente do número de SKUs) e cada série é reduzida por LTTB
+    a no máximo max_pontos pontos.
+    """
+    meses = np.arange(saidas_mensais.shape[1])
+    rotulos = np.asarray(saidas_mensais.columns.astype(str))
+    matriz = saidas_mensais.to_numpy(dtype=float)
+    with np.errstate(all='ignore'):
+        p10, p50, p90 = np.nanpercentile(matriz, [10, 50, 90], axis=0) if len(matriz) else (np.zeros(len(meses)),) * 3
+
+    def reduzir(valores):
+        x, y = lttb(meses, valores, max_pontos)
+        return rotulos[x.astype(int)], y
+
+    figura = go.Figure()
+    x, y = reduzir(p90)
+    figura.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(width=0), name='p90 do catálogo', showlegend=False))
+    x, y = reduzir(p10)
+    figura.add_trace(go.Scatter(
+        x=x, y=y, mode='lines', line=dict(width=0),
+        fill='tonexty', fillcolor='rgba(100, 100, 200, 0.2)', name='Faixa p10–p90 do catálogo'
+    ))
+    x, y = reduzir(p50)
+    figura.add_trace(go.Scattergl(
+        x=x, y=y, mode='lines', name='Mediana do catálogo', line=dict(color='rgb(100, 100, 200)', dash='dot')
+    ))
+
+    for codigo in codigos or []:
+        if codigo not in saidas_mensais.index:
+            continue
+        x, y = reduzir(saidas_mensais.loc[codigo].to_numpy(dtype=float))
+        figura.add_trace(go.Scattergl(x=x, y=y, mode='lines+markers', name=str(codigo)))
+
+    figura.update_layout(
+        title=f"Saídas mensais ({len(saidas_mensais):,} produtos no catálogo)",
+        xaxis_title="Mês",
+        yaxis_title="Saídas"
+    )
+    return figura
@@ -0,0 +1,108 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class ConsumoFEFO:
+    """Consumo de lotes por ordem de vencimento (FEFO: primeiro a vencer, primeiro a sair)"""
+
+    def carregar_lotes(self, arquivo):
+        """Lê uma planilha (Excel ou CSV) com código, lote, validade e quantidade de cada lote"""
+        try:
+            nome = getattr(arquivo, 'name', str(arquivo)).lower()
+            df = pd.read_csv(arquivo, sep=None, engine='python') if nome.endswith('.csv') else pd.read_excel(arquivo)
+
+            colunas = [str(c).lower() for c in df.columns]
+
+            def localizar(termos, padrao):
+                return next((i for i, c in enumerate(colunas) if any(t in c for t in termos)), padrao)
+
+            col_codigo = localizar(('cod', 'cód'), 0)
+            col_lote = localizar(('lote',), 1)
+            col_validade = localizar(('valid', 'venc'), 2)
+            col_quantidade = localizar(('quant', 'qtd', 'saldo', 'estoque'), 3)
+
+            lotes = pd.DataFrame({
+                'codigo': df.iloc[:, col_codigo].astype(str).str.extract(r'(\d+)')[0],
+                'lote': df.iloc[:, col_lote].astype(str),
+                'validade': pd.to_datetime(df.iloc[:, col_validade], errors='coerce', dayfirst=True),
+                'quantidade': pd.to_numeric(
+                    df.iloc[:, col_quantidade].astype(str).str.replace(',', '.', regex=False),
+                    errors='coerce'
+                )
+            })
+
+            lotes = lotes.dropna(subset=['codigo', 'quantidade'])
+            lotes = lotes[lotes['quantidade'] > 0].reset_index(drop=True)
+            logger.info(f"Lotes carregados: {len(lotes)} de {lotes['codigo'].nunique()} produtos")
+            return lotes
+
+        except Exception as e:
+            logger.error(f"Erro ao carregar lotes: {str(e)}")
+            return None
+
+    def simular(self, lotes, codigos, demanda_diaria, data_base=None, periodo_previsao=90):
+        """Simula o consumo FEFO de todos os lotes do catálogo com demanda diária constante
+
+        Os lotes de cada SKU são ordenados por validade (sem validade por último) e
+        consumidos em sequência; o que não for consumido até o vencimento é perdido.
+        A recorrência é sequencial só dentro do SKU, então o laço percorre a posição
+        do lote e cada passo atualiza todos os SKUs de uma vez.
+        Retorna um DataFrame alinhado a `codigos` com o estoque utilizável, a perda
+        projetada por validade (total e dentro do período) e o prazo efetivo em dias.
+        """
+        codigos = pd.Index(codigos).astype(str)
+        demanda_diaria = np.maximum(np.nan_to_num(np.asarray(demanda_diaria, dtype=float)), 0)
+        data_base = pd.Timestamp.today().normalize() if data_base is None else pd.Timestamp(data_base)
+
+        lotes = lotes[lotes['codigo'].astype(str).isin(codigos)]
+        lotes = lotes.sort_values(['codigo', 'validade'], kind='stable', na_position='last')
+
+        sku = codigos.get_indexer(lotes['codigo'].astype(str))
+        quantidade = lotes['quantidade'].to_numpy(dtype=float)
+        dias_validade = ((lotes['validade'] - data_base) / pd.Timedelta(days=1)).to_numpy(dtype=float)
+        dias_validade = np.where(np.isnan(dias_validade), np.inf, dias_validade)
+        posicao = lotes.groupby('codigo', sort=False).cumcount().to_numpy()
+
+        # Dia (a partir da data base) em que cada SKU passa a consumir o próximo lote
+        inicio = np.zeros(len(codigos))
+        consumido = np.zeros(len(lotes))
+        d = demanda_diaria[sku]
+
+        ordem = np.argsort(posicao, kind='stable')
+        limites = np.searchsorted(posicao[ordem], np.arange(posicao.max() + 2 if len(posicao) else 1))
+        for a, b in zip(limites[:-1], limites[1:]):
+            idx = ordem[a:b]
+            s = sku[idx]
+            janela = np.maximum(dias_validade[idx] - inicio[s], 0)
+            with np.errstate(invalid='ignore'):
+                consumo = np.where(d[idx] > 0, np.minimum(quantidade[idx], janela * d[idx]), 0.0)
+            consumido[idx] = consumo
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inicio[s] += np.where(d[idx] > 0, consumo / d[idx], 0.0)
+
+        # Lotes sem validade nunca são perdidos, mesmo sem consumo
+        vencido = np.where(np.isinf(dias_validade), 0.0, quantidade - consumido)
+        no_periodo = dias_validade <= periodo_previsao
+
+        n = len(codigos)
+        total_lotes = np.bincount(sku, weights=quantidade, minlength=n)
+        utilizavel = np.bincount(sku, weights=consumido, minlength=n)
+        perda = np.bincount(sku, weights=vencido, minlength=n)
+        perda_periodo = np.bincount(sku, weights=np.where(no_periodo, vencido, 0.0), minlength=n)
+        com_lotes = np.bincount(sku, minlength=n) > 0
+
+        prazo = np.where(demanda_diaria > 0, inicio, np.inf)
+
+        def so_com_lotes(valores):
+            return np.where(com_lotes, valores, np.nan)
+
+        return pd.DataFrame({
+            'Estoque em Lotes': so_com_lotes(total_lotes),
+            'Estoque Utilizável': so_com_lotes(np.round(utilizavel, 2)),
+            'Perda Projetada por Validade': so_com_lotes(np.round(perda, 2)),
+            'Perda por Validade no Período': so_com_lotes(np.round(perda_periodo, 2)),
+            'Prazo Efetivo (dias)': so_com_lotes(prazo)
+        }, index=codigos)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Serviço que monitora uma pasta de exportações do ERP e reanalisa o estoque
+sempre que uma planilha nova ou alterada é detectada.
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from analise_incremental import AnaliseIncremental
+from arquivo_resultados import ArquivoResultados
+from consolidacao_rede import ConsolidacaoRede
+from estoque_analyzer import EstoqueAnalyzer, calcular_hash_arquivo
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES_PLANILHA = ('.xlsx', '.xls')
+
+def classificar_planilha(nome_arquivo):
+    """Identifica se o arquivo é uma planilha de estoque ou de saídas pelo nome"""
+    nome = nome_arquivo.lower()
+    if 'saida' in nome or 'saída' in nome:
+        return 'saidas'
+    if 'estoque' in nome or 'saldo' in nome:
+        return 'estoque'
+    return None
+
+class MonitorPasta:
+    """Monitora uma pasta e processa as planilhas em um pool limitado de trabalhadores
+
+    Os trabalhadores são threads do mesmo processo, que guarda o estado incremental
+    de cada grupo: a leitura e a gravação de arquivos de grupos diferentes se
+    sobrepõem, mas o cálculo (pandas e scikit-learn) fica em grande parte serializado
+    pelo GIL, então mais trabalhadores não multiplicam a vazão de análise.
+    """
+
+    def __init__(self, pasta, pasta_saida=None, config_manual=None, tipo_produto='medicamentos',
+                 media_pacientes=None, periodo_previsao=90, intervalo=5, espera_estabilidade=10,
+                 max_trabalhadores=2, pasta_cache_modelos='.cache_modelos'):
+        self.pasta = os.path.abspath(pasta)
+        self.pasta_saida = os.path.abspath(pasta_saida or os.path.join(pasta, 'resultados'))
+        self.config_manual = config_manual
+        self.tipo_produto = tipo_produto
+        self.media_pacientes = media_pacientes
+        self.periodo_previsao = periodo_previsao
+        self.intervalo = intervalo
+        self.espera_estabilidade = espera_estabilidade
+        self.pasta_cache_modelos = pasta_cache_modelos
+
+        self.executor = ThreadPoolExecutor(max_workers=max_trabalhadores)
+        self.parar_evento = threading.Event()
+        self.trava = threading.Lock()
+
+        # Estado por arquivo: (mtime, tamanho, instante da última mudança observada)
+        self.observados = {}
+        # Último conteúdo processado por arquivo: ((mtime, tamanho), hash)
+        self.hashes_processados = {}
+        # Estado por grupo (subpasta): análise incremental, arquivos atuais e fila
+        self.grupos = {}
+        # Agregados da rede (cada subpasta é um estabelecimento)
+        self.consolidacao = ConsolidacaoRede()
+        self.trava_consolidacao = threading.Lock()
+        # Histórico de todas as análises, para consultas por produto ao longo do tempo
+        self.arquivo = ArquivoResultados(os.path.join(self.pasta_saida, '_historico'))
+
+    def _grupo(self, nome):
+        """Retorna (criando se necessário) o estado de um grupo de planilhas"""
+        if nome not in self.grupos:
+            self.grupos[nome] = {
+                'analise': AnaliseIncremental(EstoqueAnalyzer(pasta_cache_modelos=self.pasta_cache_modelos)),
+                'arquivos': {},
+                'trava': threading.Lock(),
+                'agendado': False,
+                'pendente': False
+            }
+        return self.grupos[nome]
+
+    def listar_planilhas(self):
+        """Lista as planilhas da pasta monitorada e de suas subpastas"""
+        for raiz, dirs, arquivos in os.walk(self.pasta):
+            # Não monitorar a pasta de resultados
+            dirs[:] = [d for d in dirs if os.path.join(raiz, d) != self.pasta_saida]
+            for nome in arquivos:
+                if nome.startswith(('~$', '.')) or not nome.lower().endswith(EXTENSOES_PLANILHA):
+                    continue
+                yield raiz, nome
+
+    def verificar_pasta(self):
+        """Varre a pasta uma vez e agenda os grupos com planilhas novas ou alteradas"""
+        agora = time.time()
+        vistos = set()
+
+        for raiz, nome in self.listar_planilhas():
+            tipo = classificar_planilha(nome)
+            if tipo is None:
+                continue
+
+            caminho = os.path.join(raiz, nome)
+            vistos.add(caminho)
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+
+            assinatura = (estado.st_mtime, estado.st_size)
+            anterior = self.observados.get(caminho)
+            if anterior is None or anterior[:2] != assinatura:
+                # Arquivo novo ou ainda sendo escrito: aguardar estabilizar
+                self.observados[caminho] = assinatura + (agora,)
+                continue
+
+            if agora - anterior[2] < self.espera_estabilidade:
+                continue
+
+            # Só recalcular o hash quando mtime ou tamanho mudaram desde o último processamento
+            processado = self.hashes_processados.get(caminho)
+            if processado is not None and processado[0] == assinatura:
+                continue
+            hash_atual = calcular_hash_arquivo(caminho)
+            self.hashes_processados[caminho] = (assinatura, hash_atual)
+            if processado is not None and processado[1] == hash_atual:
+                continue
+
+            nome_grupo = os.path.relpath(raiz, self.pasta)
+            grupo = self._grupo(nome_grupo)
+            arquivo_atual = grupo['arquivos'].get(tipo)
+
+            # Usar sempre a exportação mais recente de cada tipo
+            if arquivo_atual is None or arquivo_atual == caminho or not os.path.exists(arquivo_atual) \
+                    or estado.st_mtime >= os.path.getmtime(arquivo_atual):
+                grupo['arquivos'][tipo] = caminho
+                logger.info(f"Planilha de {tipo} detectada: {caminho}")
+                self.agendar(nome_grupo)
+
+        # Esquecer arquivos removidos
+        for caminho in set(self.observados) - vistos:
+            self.observados.pop(caminho, None)
+            self.hashes_processados.pop(caminho, None)
+            self._remover_do_grupo(caminho)
+
+    def _remover_do_grupo(self, caminho):
+        """Tira uma planilha removida do grupo; a exportação restante mais recente volta a valer"""
+        raiz = os.path.dirname(caminho)
+        grupo = self.grupos.get(os.path.relpath(raiz, self.pasta))
+        if grupo is None:
+            return
+        for tipo, arquivo in list(grupo['arquivos'].items()):
+            if arquivo != caminho:
+                continue
+            del grupo['arquivos'][tipo]
+            logger.info(f"Planilha de {tipo} removida: {caminho}")
+            # Reconsiderar as outras planilhas da pasta na próxima varredura
+            for outro in list(self.hashes_processados):
+                if os.path.dirname(outro) == raiz:
+                    del self.hashes_processados[outro]
+
+    def agendar(self, nome_grupo):
+        """Agenda a análise de um grupo, agrupando rajadas em uma única execução"""
+        grupo = self._grupo(nome_grupo)
+        if 'estoque' not in grupo['arquivos'] or 'saidas' not in grupo['arquivos']:
+            return
+
+        with self.trava:
+            if grupo['agendado']:
+                # Já existe uma análise na fila ou em execução: reprocessar ao final
+                grupo['pendente'] = True
+                return
+            grupo['agendado'] = True
+
+        self.executor.submit(self.processar_grupo, nome_grupo)
+
+    def processar_grupo(self, nome_grupo):
+        """Executa a análise incremental de um grupo e grava os resultados"""
+        grupo = self._grupo(nome_grupo)
+
+        while True:
+            with grupo['trava']:
+                try:
+                    sucesso = self._analisar(nome_grupo, grupo)
+                except Exception as e:
+                    logger.error(f"Erro ao processar '{nome_grupo}': {str(e)}")
+                    sucesso = False
+                if not sucesso:
+                    # Falhas passageiras (arquivo bloqueado, leitura incompleta): as
+                    # planilhas do grupo voltam a ser processadas na próxima varredura
+                    for caminho in grupo['arquivos'].values():
+                        self.hashes_processados.pop(caminho, None)
+
+            with self.trava:
+                if not grupo['pendente'] or self.parar_evento.is_set():
+                    grupo['agendado'] = False
+                    grupo['pendente'] = False
+                    return
+                grupo['pendente'] = False
+
+    def _analisar(self, nome_grupo, grupo):
+        """Analisa o par de planilhas atual de um grupo (False se a análise falhou)"""
+        arquivos = dict(grupo['arquivos'])
+        inicio = time.time()
+
+        resultado, relatorio = grupo['analise'].atualizar(
+            arquivos['estoque'],
+            arquivos['saidas'],
+            self.config_manual,
+            self.tipo_produto,
+            self.media_pacientes,
+            self.periodo_previsao
+        )
+
+        if resultado is None:
+            logger.error(f"Falha na análise do grupo '{nome_grupo}'")
+            return False
+
+        self.exportar(nome_grupo, resultado, relatorio)
+        try:
+            self.arquivo.gravar(resultado, nome_grupo)
+        except Exception as e:
+            # O histórico é complementar: uma falha não impede a consolidação
+            logger.warning(f"Não foi possível arquivar o resultado do grupo '{nome_grupo}': {str(e)}")
+        self.consolidacao.atualizar(nome_grupo, resultado)
+        if len(self.consolidacao.estabelecimentos) > 1:
+            self.exportar_consolidacao()
+        logger.info(
+            f"Grupo '{nome_grupo}' analisado em {time.time() - inicio:.1f}s: "
+            f"{len(relatorio['alterados'])} itens recalculados, "
+            f"{len(relatorio['mudancas_situacao'])} mudanças de situação"
+        )
+        return True
+
+    def exportar(self, nome_grupo, resultado, relatorio):
+        """Grava o resultado atualizado e as mudanças de situação em Excel"""
+        pasta = os.path.normpath(os.path.join(self.pasta_saida, nome_grupo))
+        os.makedirs(pasta, exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        caminho = os.path.join(pasta, f"analise_estoque_{timestamp}.xlsx")
+        temporario = os.path.join(pasta, f".analise_estoque_{timestamp}.xlsx")
+
+        with pd.ExcelWriter(temporario, engine='openpyxl') as writer:
+            resultado.to_excel(writer, sheet_name='Análise Avançada', index=False)
+            relatorio['mudancas_situacao'].to_excel(writer, sheet_name='Mudanças de Situação', index=False)
+
+        # Renomear ao final para nunca expor um arquivo parcial
+        os.replace(temporario, caminho)
+        logger.info(f"Resultado gravado em {caminho}")
+
+    def exportar_consolidacao(self):
+        """Grava o consolidado da rede: cubo, totais por produto e transferências sugeridas"""
+        with self.trava_consolidacao:
+            pasta = os.path.join(self.pasta_saida, '_rede')
+            os.makedirs(pasta, exist_ok=True)
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            caminho = os.path.join(pasta, f"consolidado_rede_{timestamp}.xlsx")
+            temporario = os.path.join(pasta, f".consolidado_rede_{timestamp}.xlsx")
+
+            with pd.ExcelWriter(temporario, engine='openpyxl') as writer:
+                self.consolidacao.cubo().reset_index().to_excel(writer, sheet_name='Cubo', index=False)
+                self.consolidacao.totais_produtos().to_excel(writer, sheet_name='Totais por Produto', index=False)
+                self.consolidacao.candidatos_transferencia().to_excel(writer, sheet_name='Transferências', index=False)
+
+            os.replace(temporario, caminho)
+            logger.info(f"Consolidado da rede gravado em {caminho}")
+
+    def executar(self):
+        """Loop principal do monitoramento"""
+        os.makedirs(self.pasta_saida, exist_ok=True)
+        logger.info(f"Monitorando {self.pasta} (resultados em {self.pasta_saida})")
+
+        try:
+            while not self.parar_evento.is_set():
+                self.verificar_pasta()
+                self.parar_evento.wait(self.intervalo)
+        finally:
+            # Antes de aguardar os trabalhadores: grupos pendentes não são reanalisados
+            # e análises ainda na fila são canceladas (ex.: Ctrl+C)
+            self.parar_evento.set()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def parar(self):
+        """Solicita o encerramento do monitoramento"""
+        self.parar_evento.set()
+
+def main():
+    """Função principal."""
+    parser = argparse.ArgumentParser(description="Monitora uma pasta de exportações e reanalisa o estoque")
+    parser.add_argument('pasta', help="Pasta onde o ERP grava as planilhas")
+    parser.add_argument('--saida', help="Pasta para os resultados (padrão: <pasta>/resultados)")
+    parser.add_argument('--tipo-produto', default='medicamentos', choices=['medicamentos', 'insumos', 'equipamentos'])
+    parser.add_argument('--pacientes', type=int, default=None, help="Média mensal de pacientes")
+    parser.add_argument('--periodo', type=int, default=90, help="Período de previsão em dias")
+    parser.add_argument('--config', help="Arquivo JSON com a configuração manual de leitura")
+    parser.add_argument('--intervalo', type=float, default=5, help="Intervalo entre varreduras (segundos)")
+    parser.add_argument('--estabilidade', type=float, default=10, help="Tempo sem alterações antes de processar (segundos)")
+    parser.add_argument('--trabalhadores', type=int, default=2, help="Número máximo de análises simultâneas (threads: o cálculo é em grande parte serial)")
+    parser.add_argument('--cache-modelos', default='.cache_modelos', help="Pasta do cache de modelos de previsão")
+    args = parser.parse_args()
+
+    config_manual = None
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            config_manual = json.load(f)
+
+    monitor = MonitorPasta(
+        args.pasta,
+        pasta_saida=args.saida,
+        config_manual=config_manual,
+        tipo_produto=args.tipo_produto,
+        media_pacientes=args.pacientes,
+        periodo_previsao=args.periodo,
+        intervalo=args.intervalo,
+        espera_estabilidade=args.estabilidade,
+        max_trabalhadores=args.trabalhadores,
+        pasta_cache_modelos=args.cache_modelos
+    )
+
+    print("📂 Monitoramento de planilhas iniciado")
+    print("⏹️  Pressione Ctrl+C para parar")
+    try:
+        monitor.executar()
+    except KeyboardInterrupt:
+        monitor.parar()
+        print("\n👋 Monitoramento encerrado pelo usuário.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Perfil rápido da estrutura de planilhas: lê só as dimensões e as primeiras linhas.
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+UNIDADES = {'UN', 'UND', 'UNID', 'AMP', 'COM', 'CP', 'CPR', 'FR', 'FA', 'CX', 'KG', 'G', 'MG', 'L', 'ML', 'PCT', 'ROLO', 'PAR', 'TB', 'BIS', 'ENV'}
+
+TERMOS_CABECALHO = {
+    'codigo': ('codigo', 'código', 'cod'),
+    'descricao': ('descricao', 'descrição', 'produto'),
+    'unidade': ('unidade', 'unid'),
+    'quantidade': ('quantidade', 'estoque', 'saldo', 'saida', 'saída', 'qtd')
+}
+
+# Leitura completa com pd.read_excel (openpyxl) em relação ao tempo de processar as
+# linhas da amostra, mais o custo fixo de abrir o livro (medidos em planilhas de
+# 2 mil a 200 mil linhas)
+FATOR_LEITURA_COMPLETA = 4.0
+CUSTO_FIXO_LEITURA = 0.3
+BYTES_POR_CELULA = 60
+
+def _sem_namespace(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _indice_coluna(referencia):
+    """Converte a referência de célula (ex.: 'AB12') no índice da coluna (base 0)"""
+    indice = 0
+    for letra in re.match(r'[A-Z]+', referencia).group():
+        indice = indice * 26 + ord(letra) - 64
+    return indice - 1
+
+class PerfiladorPlanilhas:
+    """Perfil da estrutura de planilhas em tempo constante
+
+    Arquivos .xlsx são lidos direto do pacote zip: a dimensão declarada da aba, as
+    primeiras max_linhas linhas (iterparse, interrompido ao atingir o limite) e só as
+    strings compartilhadas usadas por elas. O custo não depende do tamanho do arquivo.
+    """
+
+    def __init__(self, max_linhas=200):
+        self.max_linhas = max_linhas
+
+    def _primeira_aba(self, pacote):
+        """Nome e caminho da primeira aba do livro"""
+        livro = ET.fromstring(pacote.read('xl/workbook.xml'))
+        relacoes = ET.fromstring(pacote.read('xl/_rels/workbook.xml.rels'))
+        alvos = {r.get('Id'): r.get('Target') for r in relacoes}
+
+        abas = [e for e in livro.iter() if _sem_namespace(e.tag) == 'sheet']
+        nomes = [a.get('name') for a in abas]
+        id_relacao = next(v for k, v in abas[0].attrib.items() if k.endswith('}id'))
+        alvo = alvos[id_relacao].lstrip('/')
+        caminho = alvo if alvo.startswith('xl/') else 'xl/' + alvo
+        return nomes, caminho
+
+    def _ler_prefixo_xlsx(self, pacote, caminho):
+        """Dimensão declarada e as primeiras linhas da aba (índices de strings pendentes)"""
+        dimensao = None
+        linhas = []
+        strings_usadas = set()
+        tempo_linhas = 0.0
+
+        with pacote.open(caminho) as fluxo:
+            for evento, elemento in ET.iterparse(fluxo, events=('start', 'end')):
+                tag = _sem_namespace(elemento.tag)
+                if evento == 'start':
+                    if tag == 'dimension':
+                        dimensao = elemento.get('ref')
+                    continue
+                if tag != 'row':
+                    continue
+
+                inicio = time.perf_counter()
+                linha = {}
+                for celula in elemento:
+                    if _sem_namespace(celula.tag) != 'c':
+                        continue
+                    tipo = celula.get('t')
+                    valor = None
+                    for filho in celula:
+                        nome = _sem_namespace(filho.tag)
+                        if nome == 'v':
+                            valor = filho.text
+                        elif nome == 'is':
+                            valor = ''.join(t.text or '' for t in filho.iter() if _sem_namespace(t.tag) == 't')
+                    if valor is None:
+                        continue
+                    if tipo == 's':
+                        valor = ('s', int(valor))
+                        strings_usadas.add(valor[1])
+                    elif tipo not in ('str', 'inlineStr', 'e', 'b', 'd'):
+                        # Datas ISO (t="d") ficam como texto; um número ilegível também
+                        try:
+                            valor = float(valor)
+                        except ValueError:
+                            pass
+                    referencia = celula.get('r')
+                    coluna = _indice_coluna(referencia) if referencia else len(linha)
+                    linha[coluna] = valor
+
+                linhas.append((int(elemento.get('r', len(linhas) + 1)) - 1, linha))
+                elemento.clear()
+                tempo_linhas += time.perf_counter() - inicio
+                if len(linhas) >= self.max_linhas:
+                    break
+
+        return dimensao, linhas, strings_usadas, tempo_linhas
+
+    def _ler_strings(self, pacote, indices):
+        """Strings compartilhadas até o maior índice usado (leitura interrompida)"""
+        if not indices or 'xl/sharedStrings.xml' not in pacote.namelist():
+            return {}
+
+        maximo = max(indices)
+        strings = {}
+        posicao = 0
+        with pacote.open('xl/sharedStrings.xml') as fluxo:
+            for _, elemento in ET.iterparse(fluxo, events=('end',)):
+                if _sem_namespace(elemento.tag) != 'si':
+                    continue
+                if posicao in indices:
+                    strings[posicao] = ''.join(
+                        t.text or '' for t in elemento.iter() if _sem_namespace(t.tag) == 't'
+                    )
+                elemento.clear()
+                posicao += 1
+                if posicao > maximo:
+                    break
+        return strings
+
+    def _amostra_xlsx(self, arquivo):
+        inicio = time.perf_counter()
+        with zipfile.ZipFile(arquivo) as pacote:
+            abas, caminho = self._primeira_aba(pacote)
+            dimensao, linhas, usadas, tempo_linhas = self._ler_prefixo_xlsx(pacote, caminho)
+            strings = self._ler_strings(pacote, usadas)
+
+        n_colunas = max((max(l) + 1 for _, l in linhas if l), default=0)
+        grade = [[None] * n_colunas for _ in linhas]
+        for i, (_, linha) in enumerate(linhas):
+            for j, valor in linha.items():
+                grade[i][j] = strings.get(valor[1]) if isinstance(valor, tuple) else valor
+        amostra = pd.DataFrame(grade, index=[r for r, _ in linhas], dtype=object)
+
+        total_linhas = total_colunas = None
+        if dimensao and ':' in dimensao:
+            ultima = dimensao.split(':')[1]
+            total_linhas = int(re.search(r'\d+', ultima).group())
+            total_colunas = _indice_coluna(ultima) + 1
+
+        return {
+            'abas': abas,
+            'amostra': amostra,
+            'total_linhas': total_linhas,
+            'total_colunas': total_colunas,
+            'tempo_linhas': tempo_linhas,
+            'tempo_amostra': time.perf_counter() - inicio
+        }
+
+    def _amostra_generica(self, arquivo):
+        """Formatos sem leitura direta do pacote (.xls): lê só as primeiras linhas"""
+        inicio = time.perf_counter()
+        amostra = pd.read_excel(arquivo, header=None, nrows=self.max_linhas, dtype=object)
+        return {
+            'abas': None,
+            'amostra': amostra,
+            'total_linhas': None,
+            'total_colunas': amostra.shape[1],
+            'tempo_linhas': time.perf_counter() - inicio,
+            'tempo_amostra': time.perf_counter() - inicio
+        }
+
+    @staticmethod
+    def _numeros(coluna):
+        texto = coluna.dropna().astype(str).str.strip()
+        texto = texto[texto != '']
+        return texto, pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce')
+
+    def detectar_linha_inicio(self, amostra):
+        """Linha candidata de início dos dados, com confiança e a linha de cabeçalho
+
+        As linhas de dados compartilham o mesmo conjunto de colunas preenchidas; o
+        conjunto mais frequente (entre linhas com duas ou mais células) define o padrão,
+        e o início é a primeira linha com esse padrão e algum valor numérico. O
+        cabeçalho é a última linha anterior com texto nessas colunas.
+        Retorna (linha, confiança, linha do cabeçalho ou None), com índices base 0.
+        """
+        preenchidas = amostra.notna() & (amostra.astype(str).apply(lambda c: c.str.strip()) != '')
+        assinaturas = pd.Series([frozenset(np.flatnonzero(l)) for l in preenchidas.to_numpy()], index=amostra.index)
+        validas = assinaturas[assinaturas.map(len) >= 2]
+        if len(validas) == 0:
+            return (int(amostra.index[0]) if len(amostra) else 0), 0.0, None
+
+        padrao = validas.value_counts().index[0]
+        colunas = sorted(padrao)
+        _, numeros = self._numeros(amostra[colunas].stack())
+        tem_numero = numeros.notna().groupby(level=0).any().reindex(amostra.index, fill_value=False)
+
+        candidatas = amostra.index[(assinaturas == padrao).to_numpy() & tem_numero.to_numpy()]
+        linha = int(candidatas[0]) if len(candidatas) else int(validas.index[0])
+        seguintes = assinaturas[assinaturas.index >= linha]
+        confianca = float((seguintes == padrao).mean())
+
+        cabecalho = None
+        for i in reversed(amostra.index[amostra.index < linha]):
+            valores = amostra.loc[i, colunas].dropna().astype(str)
+            if len(valores) and pd.to_numeric(valores.str.replace(',', '.', regex=False), errors='coerce').isna().all():
+                cabecalho = int(i)
+                break
+
+        return linha, round(confianca, 3), cabecalho
+
+    def inferir_papeis(self, amostra, linha_inicio, linha_cabecalho=None):
+        """Papel provável de cada coluna (código, descrição, unidade, quantidade) com confiança
+
+        Colunas com código e descrição juntos ('123 - PRODUTO') recebem o papel 'codigo',
+        como no carregamento das planilhas, que separa os dois depois.
+        """
+        dados = amostra.loc[amostra.index >= linha_inicio]
+        cabecalho = amostra.loc[linha_cabecalho] if linha_cabecalho is not None else pd.Series(dtype=object)
+
+        colunas = []
+        for j in dados.columns:
+            texto, numeros = self._numeros(dados[j])
+            preenchidas = len(texto)
+            taxa_numerica = float(numeros.notna().mean()) if preenchidas else 0.0
+            inteiros = texto.str.fullmatch(r'\d+(\.0)?')
+            combinados = texto.str.match(r'^\d+\s*-\s*\S')
+            unicidade = texto.nunique() / preenchidas if preenchidas else 0.0
+            nao_numericos = texto[numeros.isna() & ~combinados]
+
+            confianca = {
+                'codigo': max(float(inteiros.mean()), float(combinados.mean())) * unicidade if preenchidas else 0.0,
+                'descricao': (len(nao_numericos) / preenchidas) * min(1.0, nao_numericos.str.len().mean() / 15)
+                if len(nao_numericos) else 0.0,
+                'unidade': float(texto.str.upper().isin(UNIDADES).mean()) if preenchidas else 0.0,
+                'quantidade': taxa_numerica * 0.8
+            }
+
+            # Colunas quase vazias (títulos e rodapés de página) não recebem papel
+            taxa_preenchida = preenchidas / max(len(dados), 1)
+            confianca = {p: v * min(1.0, taxa_preenchida / 0.5) for p, v in confianca.items()}
+
+            # Nome do cabeçalho, se houver, prevalece sobre o conteúdo
+            nome = str(cabecalho.get(j, '') or '').lower()
+            for papel, termos in TERMOS_CABECALHO.items():
+                if nome and any(t in nome for t in termos):
+                    confianca[papel] = max(confianca[papel], 0.95)
+
+            exemplo = texto.iloc[0] if preenchidas else None
+            if exemplo is not None and inteiros.iloc[0]:
+                exemplo = exemplo[:-2] if exemplo.endswith('.0') else exemplo
+
+            colunas.append({
+                'coluna': int(j),
+                'cabecalho': str(cabecalho.get(j)) if pd.notna(cabecalho.get(j)) else None,
+                'taxa_preenchida': round(taxa_preenchida, 3),
+                'taxa_numerica': round(taxa_numerica, 3),
+                'exemplo': exemplo,
+                'confiancas': confianca
+            })
+
+        # Cada papel fica com a coluna de maior confiança (código antes de quantidade)
+        for coluna in colunas:
+            coluna['papel'], coluna['confianca'] = None, 0.0
+        candidatos = sorted(
+            ((c['confiancas'][p], -c['coluna'], p, c) for c in colunas for p in c['confiancas']),
+            key=lambda x: (x[0], x[1]), reverse=True
+        )
+        atribuidos = set()
+        for valor, _, papel, coluna in candidatos:
+            if valor < 0.3 or papel in atribuidos or coluna['papel'] is not None:
+                continue
+            coluna['papel'], coluna['confianca'] = papel, round(valor, 3)
+            atribuidos.add(papel)
+
+        for coluna in colunas:
+            del coluna['confiancas']
+        return colunas
+
+    def perfilar(self, arquivo):
+        """Gera o perfil de uma planilha sem carregá-la inteira"""
+        nome = getattr(arquivo, 'name', str(arquivo))
+        tamanho = os.path.getsize(arquivo) if isinstance(arquivo, (str, os.PathLike)) else None
+
+        if zipfile.is_zipfile(arquivo):
+            leitura = self._amostra_xlsx(arquivo)
+        else:
+            leitura = self._amostra_generica(arquivo)
+
+        amostra = leitura['amostra']
+        linha_inicio, confianca_inicio, linha_cabecalho = self.detectar_linha_inicio(amostra)
+        colunas = self.inferir_papeis(amostra, linha_inicio, linha_cabecalho)
+
+        # Estimativa de custo da leitura completa pela proporção da amostra
+        linhas_amostra = len(amostra)
+        total_linhas = leitura['total_linhas']
+        total_colunas = leitura['total_colunas'] or amostra.shape[1]
+        proporcao = (total_linhas / linhas_amostra) if total_linhas and linhas_amostra else None
+        celulas = total_linhas * total_colunas if total_linhas else None
+
+        return {
+            'arquivo': nome,
+            'tamanho_bytes': tamanho,
+            'abas': leitura['abas'],
+            'total_linhas': total_linhas,
+            'total_colunas': total_colunas,
+            'linhas_amostra': linhas_amostra,
+            'linha_inicio': linha_inicio,
+            'confianca_linha_inicio': confianca_inicio,
+            'linha_cabecalho': linha_cabecalho,
+            'colunas': colunas,
+            'mapeamento_sugerido': {c['papel']: c['coluna'] for c in colunas if c['papel']},
+            'celulas_estimadas': celulas,
+            'memoria_estimada_mb': round(celulas * BYTES_POR_CELULA / 1024 ** 2, 1) if celulas else None,
+            'tempo_estimado_s': round(
+                leitura['tempo_linhas'] * proporcao * FATOR_LEITURA_COMPLETA + CUSTO_FIXO_LEITURA, 1
+            ) if proporcao else None,
+            'tempo_perfil_s': round(leitura['tempo_amostra'], 3)
+        }
+
+    def formatar(self, perfil):
+        """Relatório em texto de um perfil"""
+        linhas = [
+            '=' * 60,
+            f"PERFIL: {perfil['arquivo']}",
+            '=' * 60
+        ]
+        if perfil['tamanho_bytes'] is not None:
+            linhas.append(f"Tamanho: {perfil['tamanho_bytes'] / 1024 ** 2:,.1f} MB")
+        if perfil['abas']:
+            linhas.append(f"Abas: {', '.join(perfil['abas'])} (perfil da primeira)")
+        linhas.append(
+            f"Dimensão declarada: {perfil['total_linhas'] or '?'} linhas × {perfil['total_colunas'] or '?'} colunas "
+            f"(amostra de {perfil['linhas_amostra']} linhas em {perfil['tempo_perfil_s']}s)"
+        )
+        linhas.append(
+            f"Linha de início dos dados (base 0): {perfil['linha_inicio']} "
+            f"(confiança {perfil['confianca_linha_inicio']:.0%}"
+            + (f", cabeçalho na linha {perfil['linha_cabecalho']})" if perfil['linha_cabecalho'] is not None else ")")
+        )
+        linhas.append('')
+        linhas.append(f"{'Col':>4}  {'Papel':<11} {'Conf.':>5}  {'Preench.':>8}  {'Numérico':>8}  Cabeçalho / exemplo")
+        for c in perfil['colunas']:
+            rotulo = ' '.join((c['cabecalho'] or '').split())
+            exemplo = '' if c['exemplo'] is None else ' '.join(str(c['exemplo']).split())[:30]
+            linhas.append(
+                f"{c['coluna']:>4}  {(c['papel'] or '-'):<11} {c['confianca']:>5.2f}  "
+                f"{c['taxa_preenchida']:>8.0%}  {c['taxa_numerica']:>8.0%}  {rotulo[:20]} {exemplo}"
+            )
+        linhas.append('')
+        mapeamento = ';'.join(f"{i},{p}" for p, i in sorted(perfil['mapeamento_sugerido'].items(), key=lambda x: x[1]))
+        linhas.append(f"Mapeamento sugerido: {mapeamento or '(nenhum)'}")
+        if perfil['celulas_estimadas']:
+            linhas.append(
+                f"Leitura completa estimada: {perfil['celulas_estimadas']:,} células, "
+                f"~{perfil['memoria_estimada_mb']:,} MB, ~{perfil['tempo_estimado_s']:,}s"
+            )
+        return '\n'.join(linhas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil rápido da estrutura de planilhas")
+    parser.add_argument('arquivos', nargs='+', help="Planilhas a analisar")
+    parser.add_argument('--linhas', type=int, default=200, help="Número de linhas lidas do início de cada aba")
+    parser.add_argument('--json', action='store_true', help="Imprime o perfil em JSON")
+    args = parser.parse_args()
+
+    perfilador = PerfiladorPlanilhas(max_linhas=args.linhas)
+    for arquivo in args.arquivos:
+        try:
+            perfil = perfilador.perfilar(arquivo)
+        except Exception as e:
+            print(f"Erro ao analisar {arquivo}: {e}")
+            continue
+        print(json.dumps(perfil, ensure_ascii=False, indent=2, default=str) if args.json else perfilador.formatar(perfil))
+
+if __name__ == "__main__":
+    main()
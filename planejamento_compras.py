@@ -0,0 +1,208 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class PlanejadorCompras:
+    """Distribui um orçamento de compras entre os produtos minimizando os dias projetados de ruptura"""
+
+    # Produtos examinados por volta da alocação gulosa depois de um corte
+    JANELA_INICIAL = 64
+
+    def carregar_precos(self, arquivo):
+        """Lê uma planilha (Excel ou CSV) com código e preço unitário dos produtos"""
+        try:
+            nome = getattr(arquivo, 'name', str(arquivo)).lower()
+            df = pd.read_csv(arquivo, sep=None, engine='python') if nome.endswith('.csv') else pd.read_excel(arquivo)
+
+            colunas = [str(c).lower() for c in df.columns]
+            col_codigo = next((i for i, c in enumerate(colunas) if 'cod' in c or 'cód' in c), 0)
+            col_preco = next(
+                (i for i, c in enumerate(colunas) if any(p in c for p in ('preco', 'preço', 'valor', 'custo'))),
+                1
+            )
+
+            codigos = df.iloc[:, col_codigo].astype(str).str.extract(r'(\d+)')[0]
+            precos = pd.to_numeric(
+                df.iloc[:, col_preco].astype(str).str.replace(',', '.', regex=False),
+                errors='coerce'
+            )
+
+            tabela = pd.DataFrame({'codigo': codigos, 'preco': precos}).dropna()
+            # Preço zero ou negativo é tratado como preço ausente
+            invalidos = tabela['preco'] <= 0
+            if invalidos.any():
+                logger.warning(f"{int(invalidos.sum())} preços zerados ou negativos ignorados")
+                tabela = tabela[~invalidos]
+            return tabela.drop_duplicates(subset='codigo', keep='last').set_index('codigo')['preco']
+
+        except Exception as e:
+            logger.error(f"Erro ao carregar preços: {str(e)}")
+            return None
+
+    def _preparar(self, resultado, precos, pesos_tipo, horizonte):
+        """Calcula necessidade, preço, peso e dias de ruptura de cada produto"""
+        if isinstance(precos, dict):
+            precos = pd.Series(precos)
+        precos = precos.copy()
+        precos.index = precos.index.astype(str)
+
+        if horizonte is None:
+            horizonte = resultado['Período Previsão (dias)'].to_numpy(dtype=float) \
+                if 'Período Previsão (dias)' in resultado else np.full(len(resultado), 90.0)
+        else:
+            horizonte = np.full(len(resultado), float(horizonte))
+
+        estoque = np.maximum(resultado['Quantidade em estoque'].to_numpy(dtype=float), 0)
+        demanda_diaria = np.maximum(resultado['Demanda Esperada'].to_numpy(dtype=float), 0) / 30
+        preco = precos.reindex(resultado['Código'].astype(str)).to_numpy(dtype=float)
+        # Preço zero ou negativo conta como ausente (quebraria o custo acumulado da alocação)
+        preco = np.where(preco > 0, preco, np.nan)
+
+        peso = np.ones(len(resultado))
+        if pesos_tipo and 'Tipo Produto' in resultado:
+            peso = resultado['Tipo Produto'].map(pesos_tipo).fillna(1.0).to_numpy(dtype=float)
+
+        # Unidades inteiras necessárias para cobrir o horizonte
+        necessidade = np.ceil(np.maximum(demanda_diaria * horizonte - estoque, 0) - 1e-9)
+        necessidade[np.isnan(preco) | (demanda_diaria <= 0)] = 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ruptura = np.where(demanda_diaria > 0, np.maximum(horizonte - estoque / demanda_diaria, 0), 0.0)
+            # Dias de ruptura evitados (ponderados) por unidade monetária gasta
+            eficiencia = np.where(necessidade > 0, peso / (demanda_diaria * preco), -np.inf)
+
+        return {
+            'estoque': estoque,
+            'demanda_diaria': demanda_diaria,
+            'preco': preco,
+            'peso': peso,
+            'necessidade': necessidade,
+            'ruptura': ruptura,
+            'eficiencia': eficiencia
+        }
+
+    def _alocar_guloso(self, dados, orcamento):
+        """Alocação gulosa por eficiência (ótima para a versão contínua do problema)
+
+        Equivale a percorrer os produtos da maior para a menor eficiência comprando
+        o que couber de cada um, mas aloca de uma vez as sequências que cabem inteiras.
+        """
+        necessidade = dados['necessidade']
+        preco = np.nan_to_num(dados['preco'])
+        quantidade = np.zeros(len(necessidade))
+
+        candidatos = np.flatnonzero((necessidade > 0) & (preco > 0))
+        ordem = candidatos[np.argsort(-dados['eficiencia'][candidatos], kind='stable')]
+
+        # Cada volta olha uma janela a partir de `posicao`: aloca a sequência que cabe
+        # inteira e, no produto do corte, o que couber. Janelas que cabem inteiras
+        # dobram de tamanho; depois de um corte a janela volta ao tamanho inicial, então
+        # cada volta custa no máximo JANELA_INICIAL mais o dobro do que avança (linear).
+        posicao, janela, saldo = 0, len(ordem), float(orcamento)
+        while posicao < len(ordem) and saldo > 0:
+            indices = np.arange(posicao, min(posicao + janela, len(ordem)))
+            # Produtos mais caros que o saldo não cabem mais (o saldo só diminui)
+            indices = indices[preco[ordem[indices]] <= saldo]
+            produtos = ordem[indices]
+            custo = np.cumsum(necessidade[produtos] * preco[produtos])
+            inteiros = np.searchsorted(custo, saldo, side='right')
+            quantidade[produtos[:inteiros]] = necessidade[produtos[:inteiros]]
+            saldo -= custo[inteiros - 1] if inteiros > 0 else 0.0
+            if inteiros == len(produtos):
+                posicao += janela
+                janela *= 2
+                continue
+
+            i = produtos[inteiros]
+            unidades = min(necessidade[i], np.floor(saldo / preco[i]))
+            quantidade[i] = unidades
+            saldo -= unidades * preco[i]
+            posicao = indices[inteiros] + 1
+            janela = self.JANELA_INICIAL
+
+        return quantidade
+
+    def _alocar_lp(self, dados, orcamento):
+        """Alocação por programação linear (scipy/HiGHS), arredondada para unidades inteiras"""
+        from scipy.optimize import linprog
+
+        necessidade = dados['necessidade']
+        candidatos = np.flatnonzero((necessidade > 0) & (np.nan_to_num(dados['preco']) > 0))
+        quantidade = np.zeros(len(necessidade))
+        if len(candidatos) == 0:
+            return quantidade
+
+        preco = dados['preco'][candidatos]
+        beneficio = dados['peso'][candidatos] / dados['demanda_diaria'][candidatos]
+
+        solucao = linprog(
+            -beneficio,
+            A_ub=preco[None, :],
+            b_ub=[orcamento],
+            bounds=np.column_stack([np.zeros(len(candidatos)), necessidade[candidatos]]),
+            method='highs'
+        )
+        if not solucao.success:
+            raise ValueError(f"Programação linear sem solução: {solucao.message}")
+
+        quantidade[candidatos] = np.floor(solucao.x + 1e-9)
+        return quantidade
+
+    def planejar(self, resultado, precos, orcamento, pesos_tipo=None, horizonte=None, metodo='guloso'):
+        """Gera o plano de compras respeitando o orçamento total
+
+        precos: Series ou dict {código: preço unitário}
+        pesos_tipo: prioridade por 'Tipo Produto' (ex.: {'medicamentos': 2.0})
+        metodo: 'guloso' (ordenação por eficiência, ~0,1 s para 100 mil produtos) ou
+                'lp' (scipy linprog, mesma solução contínua; útil para conferência
+                em catálogos menores, pois é muito mais lento)
+        Retorna um DataFrame com uma linha por produto do resultado.
+        """
+        dados = self._preparar(resultado, precos, pesos_tipo, horizonte)
+
+        if metodo == 'lp':
+            quantidade = self._alocar_lp(dados, orcamento)
+        else:
+            quantidade = self._alocar_guloso(dados, orcamento)
+
+        demanda_diaria = dados['demanda_diaria']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ruptura_depois = np.where(
+                demanda_diaria > 0,
+                np.maximum(dados['ruptura'] - quantidade / demanda_diaria, 0),
+                0.0
+            )
+
+        plano = pd.DataFrame({
+            'Código': resultado['Código'].to_numpy(),
+            'Descrição': resultado['Descrição'].to_numpy(),
+            'Preço Unitário': dados['preco'],
+            'Necessidade (un)': dados['necessidade'],
+            'Quantidade Planejada': quantidade,
+            'Custo Planejado': quantidade * np.nan_to_num(dados['preco']),
+            'Dias Ruptura Sem Compra': dados['ruptura'],
+            'Dias Ruptura Com Compra': ruptura_depois,
+            'Peso Prioridade': dados['peso']
+        })
+        if 'Tipo Produto' in resultado:
+            plano.insert(2, 'Tipo Produto', resultado['Tipo Produto'].to_numpy())
+
+        return plano.sort_values(
+            ['Quantidade Planejada', 'Dias Ruptura Sem Compra'], ascending=False, kind='stable'
+        ).reset_index(drop=True)
+
+    def resumir(self, plano, orcamento):
+        """Indicadores gerais do plano de compras"""
+        sem_preco = plano['Preço Unitário'].isna()
+        return {
+            'orcamento': orcamento,
+            'custo_total': plano['Custo Planejado'].sum(),
+            'saldo': orcamento - plano['Custo Planejado'].sum(),
+            'produtos_comprados': int((plano['Quantidade Planejada'] > 0).sum()),
+            'produtos_sem_preco': int(sem_preco.sum()),
+            'dias_ruptura_antes': plano['Dias Ruptura Sem Compra'].sum(),
+            'dias_ruptura_depois': plano['Dias Ruptura Com Compra'].sum()
+        }
@@ -0,0 +1,265 @@
+import logging
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class AgregadorRazao:
+    """Agrega o razão de dispensações (uma linha por saída) em saídas mensais por SKU
+
+    O arquivo é lido em blocos (CSV com chunksize, Excel com o leitor somente leitura
+    do openpyxl) e cada bloco é somado em uma matriz compacta SKU × mês que cresce sob
+    demanda, de modo que o razão completo nunca fica em memória.
+    """
+
+    PAPEIS = {
+        'codigo': ('codigo', 'cod'),
+        'descricao': ('descricao', 'produto', 'item'),
+        'unidade': ('unidade', 'unid'),
+        # Só termos de data: 'Qtd Dispensada' antes da data não pode ser tomada por ela
+        'data': ('data', 'dt', 'date', 'emissao'),
+        'quantidade': ('quantidade', 'qtd', 'quant', 'saida')
+    }
+    # Colunas do estabelecimento ('Unidade de Saúde', 'Cód. Estabelecimento') não são do produto
+    TERMOS_ESTABELECIMENTO = ('saude', 'estabelecimento', 'ubs')
+    PAPEIS_PRODUTO = ('codigo', 'descricao', 'unidade')
+
+    def __init__(self, tamanho_bloco=200000):
+        self.tamanho_bloco = tamanho_bloco
+        self.limpar()
+
+    def limpar(self):
+        """Descarta os totais acumulados"""
+        self._indice_sku = {}
+        self._indice_mes = {}
+        self.descricoes = []
+        self.unidades = []
+        self.totais = np.zeros((1024, 12))
+        self.linhas_lidas = 0
+        self.linhas_descartadas = 0
+
+    @staticmethod
+    def _normalizar_nome(nome):
+        nome = unicodedata.normalize('NFKD', str(nome).strip().lower())
+        return ''.join(c for c in nome if not unicodedata.combining(c))
+
+    def mapear_colunas(self, cabecalho):
+        """Identifica pelo cabeçalho a posição de código, descrição, unidade, data e quantidade"""
+        nomes = [self._normalizar_nome(c) for c in cabecalho]
+        mapeamento = {}
+        for papel, termos in self.PAPEIS.items():
+            for i, nome in enumerate(nomes):
+                if papel in self.PAPEIS_PRODUTO and any(t in nome for t in self.TERMOS_ESTABELECIMENTO):
+                    continue
+                if i not in mapeamento.values() and any(t in nome for t in termos):
+                    mapeamento[papel] = i
+                    break
+
+        faltando = {'codigo', 'data', 'quantidade'} - set(mapeamento)
+        if faltando:
+            raise ValueError(f"Colunas obrigatórias não encontradas no razão: {', '.join(sorted(faltando))}")
+        return mapeamento
+
+    @staticmethod
+    def _detectar_separador(arquivo):
+        """Detecta o separador pela primeira linha (permite usar o leitor C do pandas)"""
+        if hasattr(arquivo, 'read'):
+            posicao = arquivo.tell()
+            primeira = arquivo.readline()
+            arquivo.seek(posicao)
+            if isinstance(primeira, bytes):
+                primeira = primeira.decode('utf-8', errors='ignore')
+        else:
+            with open(arquivo, encoding='utf-8', errors='ignore') as f:
+                primeira = f.readline()
+        return max([';', ',', '\t', '|'], key=primeira.count)
+
+    def ler_blocos(self, arquivo, mapeamento=None):
+        """Gera DataFrames com as colunas mapeadas, um bloco de linhas por vez"""
+        nome = getattr(arquivo, 'name', str(arquivo)).lower()
+
+        if nome.endswith('.csv') or nome.endswith('.txt'):
+            leitor = pd.read_csv(
+                arquivo, sep=self._detectar_separador(arquivo), dtype=str, chunksize=self.tamanho_bloco
+            )
+            for bloco in leitor:
+                if mapeamento is None:
+                    mapeamento = self.mapear_colunas(bloco.columns)
+                yield bloco.iloc[:, list(mapeamento.values())].set_axis(list(mapeamento), axis=1)
+            return
+
+        from openpyxl import load_workbook
+
+        livro = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = livro.active.iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if mapeamento is None:
+                mapeamento = self.mapear_colunas(cabecalho or [])
+            posicoes = list(mapeamento.values())
+
+            bloco = []
+            for linha in linhas:
+                bloco.append([linha[i] if i < len(linha) else None for i in posicoes])
+                if len(bloco) >= self.tamanho_bloco:
+                    yield pd.DataFrame(bloco, columns=list(mapeamento))
+                    bloco = []
+            if bloco:
+                yield pd.DataFrame(bloco, columns=list(mapeamento))
+        finally:
+            livro.close()
+
+    def _indices(self, chaves, indice, ao_criar=None):
+        """Converte chaves em posições estáveis, criando as novas (só as únicas do bloco)
+
+        ao_criar, se informado, é chamado com a posição no bloco da primeira linha de
+        cada chave nova.
+        """
+        codigos, unicos = pd.factorize(chaves)
+        primeira = np.full(len(unicos), len(codigos), dtype=np.int64)
+        np.minimum.at(primeira, codigos, np.arange(len(codigos)))
+        posicoes = np.empty(len(unicos), dtype=np.int64)
+        for j, chave in enumerate(unicos):
+            posicao = indice.get(chave)
+            if posicao is None:
+                posicao = indice[chave] = len(indice)
+                if ao_criar is not None:
+                    ao_criar(primeira[j])
+            posicoes[j] = posicao
+        return posicoes[codigos]
+
+    @staticmethod
+    def _converter_datas(data):
+        """Converte a coluna de data aceitando formatos misturados no mesmo arquivo
+
+        Primeiro como ISO (aaaa-mm-dd); o restante com o dia primeiro, no formato do
+        primeiro valor e, por último, valor a valor.
+        """
+        if pd.api.types.is_datetime64_any_dtype(data):
+            return data
+        convertida = pd.to_datetime(data, errors='coerce', format='ISO8601')
+        for opcoes in ({'dayfirst': True}, {'dayfirst': True, 'format': 'mixed'}):
+            pendentes = (convertida.isna() & data.notna()).to_numpy()
+            if not pendentes.any():
+                return convertida
+            convertida[pendentes] = pd.to_datetime(data[pendentes].astype(str).str.strip(), errors='coerce', **opcoes)
+
+        invalidas = data[(convertida.isna() & data.notna()).to_numpy()]
+        if len(invalidas):
+            logger.warning(f"{len(invalidas)} linhas do razão com data inválida descartadas (ex.: '{invalidas.iloc[0]}')")
+        return convertida
+
+    def normalizar(self, bloco):
+        """Linhas válidas de um bloco: código numérico, descrição, unidade, mês e quantidade
+
+        O mês é um inteiro (ano * 12 + mês - 1); linhas sem código, data ou quantidade
+        são descartadas.
+        """
+        self.linhas_lidas += len(bloco)
+
+        # Extrair o código numérico só dos valores distintos do bloco
+        posicoes, distintos = pd.factorize(bloco['codigo'].astype(str))
+        extraidos = pd.Series(distintos).str.extract(r'(\d+)')[0].to_numpy(dtype=object)
+        codigo = pd.Series(extraidos[posicoes], index=bloco.index)
+        data = self._converter_datas(bloco['data'])
+        quantidade = pd.to_numeric(
+            bloco['quantidade'].astype(str).str.replace(',', '.', regex=False),
+            errors='coerce'
+        )
+
+        validas = (codigo.notna() & data.notna() & quantidade.notna()).to_numpy()
+        self.linhas_descartadas += int((~validas).sum())
+
+        bloco = bloco[validas]
+        return pd.DataFrame({
+            'codigo': codigo[validas].to_numpy(dtype=object),
+            'descricao': bloco['descricao'].astype(str).to_numpy(dtype=object) if 'descricao' in bloco else '',
+            'unidade': bloco['unidade'].astype(str).to_numpy(dtype=object) if 'unidade' in bloco else '',
+            'mes': (data[validas].dt.year * 12 + data[validas].dt.month - 1).to_numpy(dtype=np.int64),
+            'quantidade': quantidade[validas].to_numpy(dtype=float)
+        })
+
+    def acumular(self, linhas):
+        """Soma linhas normalizadas (ver normalizar) na matriz SKU × mês"""
+        if len(linhas) == 0:
+            return
+
+        codigo = linhas['codigo'].to_numpy()
+        mes = linhas['mes'].to_numpy()
+        quantidade = linhas['quantidade'].to_numpy(dtype=float)
+        descricao = linhas['descricao'].to_numpy()
+        unidade = linhas['unidade'].to_numpy()
+
+        def registrar_sku(i):
+            self.descricoes.append(descricao[i])
+            self.unidades.append(unidade[i])
+
+        linha = self._indices(codigo, self._indice_sku, registrar_sku)
+        coluna = self._indices(mes, self._indice_mes)
+
+        # Crescer a matriz de totais (dobrando) quando surgem SKUs ou meses novos
+        n_linhas, n_colunas = self.totais.shape
+        novas_linhas, novas_colunas = n_linhas, n_colunas
+        while novas_linhas < len(self._indice_sku):
+            novas_linhas *= 2
+        while novas_colunas < len(self._indice_mes):
+            novas_colunas *= 2
+        if (novas_linhas, novas_colunas) != (n_linhas, n_colunas):
+            maior = np.zeros((novas_linhas, novas_colunas))
+            maior[:n_linhas, :n_colunas] = self.totais
+            self.totais = maior
+
+        np.add.at(self.totais, (linha, coluna), quantidade)
+
+    def agregar(self, arquivo, mapeamento=None, a_cada_bloco=None):
+        """Lê o razão em blocos acumulando as saídas por SKU e mês
+
+        mapeamento: {papel: índice da coluna}, com os papéis 'codigo', 'data' e
+        'quantidade' (e, opcionalmente, 'descricao' e 'unidade'); se None, as
+        colunas são identificadas pelo cabeçalho.
+        a_cada_bloco, se informado, é chamado com o total de linhas lidas após cada bloco.
+        """
+        for bloco in self.ler_blocos(arquivo, mapeamento):
+            self.acumular(self.normalizar(bloco))
+            if a_cada_bloco is not None:
+                a_cada_bloco(self.linhas_lidas)
+
+        logger.info(
+            f"Razão agregado: {self.linhas_lidas} linhas, {len(self._indice_sku)} SKUs, "
+            f"{len(self._indice_mes)} meses ({self.linhas_descartadas} linhas descartadas)"
+        )
+        return self
+
+    def finalizar(self, intervalo=None):
+        """Tabela de saídas mensais (uma linha por SKU e mês, incluindo meses sem saída)
+
+        Todos os meses entre o primeiro e o último do razão entram na tabela, para que
+        a média mensal de cada SKU considere os meses sem dispensação. intervalo
+        (primeiro mês, último mês), no formato de normalizar, amplia esse período
+        (ex.: parte de um razão maior).
+        """
+        colunas = ['codigo', 'descricao', 'unidade', 'mes', 'saida']
+        n_skus, n_meses = len(self._indice_sku), len(self._indice_mes)
+        if n_skus == 0:
+            return pd.DataFrame(columns=colunas)
+
+        meses = np.fromiter(self._indice_mes.keys(), dtype=np.int64, count=n_meses)
+        primeiro, ultimo = meses.min(), meses.max()
+        if intervalo is not None:
+            primeiro, ultimo = min(primeiro, intervalo[0]), max(ultimo, intervalo[1])
+        todos_meses = np.arange(primeiro, ultimo + 1)
+        totais = np.zeros((n_skus, len(todos_meses)))
+        totais[:, meses - primeiro] = self.totais[:n_skus, :n_meses]
+
+        codigos = np.fromiter(self._indice_sku.keys(), dtype=object, count=n_skus)
+        rotulos = np.array([f"{m // 12:04d}-{m % 12 + 1:02d}" for m in todos_meses], dtype=object)
+
+        return pd.DataFrame({
+            'codigo': np.repeat(codigos, len(todos_meses)),
+            'descricao': np.repeat(np.asarray(self.descricoes, dtype=object), len(todos_meses)),
+            'unidade': np.repeat(np.asarray(self.unidades, dtype=object), len(todos_meses)),
+            'mes': np.tile(rotulos, n_skus),
+            'saida': totais.ravel()
+        }, columns=colunas)
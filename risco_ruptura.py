@@ -0,0 +1,173 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+def _simular_bloco(media, desvio, estoque, periodo, prazo_reposicao, n_caminhos, nivel_servico, semente):
+    """Simula um bloco de SKUs e retorna a probabilidade de ruptura e o ponto de pedido
+
+    A demanda mensal de cada SKU segue uma distribuição gama com a média e o desvio
+    informados; como a soma de gamas de mesma escala é gama, cada trecho do caminho
+    (até o prazo de reposição e dele até o fim do período) é sorteado de uma só vez.
+    Como a demanda nunca é negativa, há ruptura no período se a demanda acumulada
+    no fim dele supera o estoque.
+    """
+    rng = np.random.Generator(np.random.PCG64(semente))
+
+    aleatoria = (media > 0) & (desvio > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        forma_mensal = np.where(aleatoria, (media / desvio) ** 2, 0.0)
+        escala = np.where(aleatoria, desvio ** 2 / media, 0.0)
+
+    # Pontos do caminho (em dias): prazo de reposição e fim do período, em ordem
+    pontos = sorted({float(prazo_reposicao), float(periodo)})
+    acumulada = np.zeros((len(media), n_caminhos), dtype=np.float32)
+    no_ponto = {}
+    anterior = 0.0
+    for ponto in pontos:
+        meses = (ponto - anterior) / 30
+        forma = np.where(aleatoria, forma_mensal * meses, 1.0).astype(np.float32)
+        sorteio = rng.standard_gamma(forma[:, None], size=acumulada.shape, dtype=np.float32)
+        sorteio *= escala.astype(np.float32)[:, None]
+        # SKUs sem variação histórica têm demanda determinística
+        sorteio[~aleatoria] = (np.maximum(media[~aleatoria], 0) * meses)[:, None]
+        acumulada += sorteio
+        no_ponto[ponto] = acumulada.copy() if ponto != pontos[-1] else acumulada
+        anterior = ponto
+
+    probabilidade = (no_ponto[float(periodo)] > estoque[:, None]).mean(axis=1)
+
+    # Ponto de pedido: quantil da demanda durante o prazo de reposição
+    k = min(int(np.ceil(nivel_servico * n_caminhos)) - 1, n_caminhos - 1)
+    ponto_pedido = np.partition(no_ponto[float(prazo_reposicao)], max(k, 0), axis=1)[:, max(k, 0)]
+
+    return probabilidade, ponto_pedido.astype(np.float64)
+
+class SimuladorRuptura:
+    """Simulação de Monte Carlo do risco de ruptura de estoque por SKU
+
+    Os sorteios são feitos em blocos de SKUs × caminhos limitados a max_bytes_bloco,
+    e os blocos podem ser distribuídos entre processos. Cada bloco tem sua própria
+    semente derivada de `semente`, então o resultado não depende do número de processos.
+    O pool de processos é criado na primeira simulação e reaproveitado nas seguintes
+    (partes e partições da mesma análise); feche-o com fechar().
+    """
+
+    def __init__(self, n_caminhos=10000, nivel_servico=0.95, prazo_reposicao=30, cv_padrao=None,
+                 max_bytes_bloco=64 * 1024 * 1024, n_processos=None, semente=42):
+        self.n_caminhos = n_caminhos
+        self.nivel_servico = nivel_servico
+        self.prazo_reposicao = prazo_reposicao
+        # Coeficiente de variação dos SKUs com menos de dois meses de histórico
+        # (None = mediana dos demais SKUs)
+        self.cv_padrao = cv_padrao
+        self.max_bytes_bloco = max_bytes_bloco
+        self.n_processos = n_processos if n_processos is not None else (os.cpu_count() or 1)
+        self.semente = semente
+        self._executor = None
+        self._trava = threading.Lock()
+
+    def __getstate__(self):
+        # O pool e a trava não vão junto quando o simulador é enviado a outro processo
+        estado = self.__dict__.copy()
+        estado['_executor'] = None
+        del estado['_trava']
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._trava = threading.Lock()
+
+    def _obter_executor(self):
+        """Pool de processos do simulador, criado na primeira chamada
+
+        Usa 'spawn': um fork copiaria as threads e travas do processo chamador
+        (o Streamlit executa a análise em uma thread de fundo).
+        """
+        with self._trava:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.n_processos, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def fechar(self):
+        """Encerra o pool de processos (uma nova simulação cria outro)"""
+        with self._trava:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def tamanho_bloco(self):
+        """SKUs por bloco: demanda acumulada, sorteio e cópia no prazo de reposição"""
+        return max(1, self.max_bytes_bloco // (self.n_caminhos * 4 * 3))
+
+    def estimar_variacao(self, df_saidas, codigos, demanda_esperada):
+        """Desvio padrão mensal da demanda de cada SKU a partir do histórico de saídas
+
+        O coeficiente de variação histórico é aplicado à demanda esperada, de modo que
+        o ajuste por pacientes e tipo de produto escala também a variação.
+        """
+        estatisticas = df_saidas.groupby('codigo')['saida'].agg(['mean', 'std'])
+        estatisticas = estatisticas.reindex(pd.Index(codigos).astype(str))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = (estatisticas['std'] / estatisticas['mean']).to_numpy(dtype=float)
+        cv = np.where(np.isfinite(cv), cv, np.nan)
+
+        cv_padrao = self.cv_padrao
+        if cv_padrao is None:
+            cv_padrao = float(np.nanmedian(cv)) if np.isfinite(cv).any() else 0.0
+        cv = np.where(np.isnan(cv), cv_padrao, cv)
+
+        return np.asarray(demanda_esperada, dtype=float) * cv
+
+    def simular(self, demanda_mensal, desvio_mensal, estoque_atual, periodo_previsao=90, primeiro_bloco=0):
+        """Probabilidade de ruptura no período e ponto de pedido de cada SKU
+
+        Retorna um DataFrame com 'Probabilidade Ruptura (%)', 'Nível de Serviço (%)'
+        e 'Ponto de Pedido', na ordem dos SKUs informados.
+        primeiro_bloco: posição do primeiro bloco no catálogo completo, para simular o
+        catálogo em partes (múltiplas de tamanho_bloco) com as mesmas sementes.
+        """
+        media = np.asarray(demanda_mensal, dtype=float)
+        desvio = np.nan_to_num(np.asarray(desvio_mensal, dtype=float))
+        estoque = np.asarray(estoque_atual, dtype=float)
+
+        tamanho_bloco = self.tamanho_bloco
+        inicios = list(range(0, len(media), tamanho_bloco))
+        # Mesmas sementes de SeedSequence(semente).spawn(), a partir do primeiro bloco
+        sementes = [
+            np.random.SeedSequence(self.semente, spawn_key=(primeiro_bloco + j,)) for j in range(len(inicios))
+        ]
+        argumentos = [
+            (media[i:i + tamanho_bloco], desvio[i:i + tamanho_bloco], estoque[i:i + tamanho_bloco],
+             periodo_previsao, self.prazo_reposicao, self.n_caminhos, self.nivel_servico, semente)
+            for i, semente in zip(inicios, sementes)
+        ]
+
+        if self.n_processos > 1 and len(argumentos) > 1:
+            blocos = list(self._obter_executor().map(_simular_bloco, *zip(*argumentos)))
+        else:
+            blocos = [_simular_bloco(*args) for args in argumentos]
+
+        if blocos:
+            probabilidade = np.concatenate([b[0] for b in blocos])
+            ponto_pedido = np.concatenate([b[1] for b in blocos])
+        else:
+            probabilidade = ponto_pedido = np.empty(0)
+
+        logger.info(f"Simulação de ruptura: {len(media)} SKUs × {self.n_caminhos} caminhos em {len(blocos)} blocos")
+
+        return pd.DataFrame({
+            'Probabilidade Ruptura (%)': np.round(probabilidade * 100, 2),
+            'Nível de Serviço (%)': np.round((1 - probabilidade) * 100, 2),
+            'Ponto de Pedido': np.round(ponto_pedido, 2)
+        })
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class TabelaFatores:
+    """Tabela de fatores de correção por tipo de produto, categoria ou SKU
+
+    Cada linha da tabela é uma regra com as colunas 'codigo', 'categoria' e
+    'tipo_produto' (a mais específica preenchida define o nível da regra) e os
+    fatores 'fator_paciente', 'fator_sazonal', 'estoque_minimo' e 'prazo_seguranca'.
+    Linhas de SKU também classificam o produto: o tipo e a categoria informados nelas
+    definem quais regras de categoria e de tipo se aplicam. Fatores em branco são
+    herdados do nível menos específico (SKU > categoria > tipo > padrão).
+    """
+
+    COLUNAS_FATORES = ['fator_paciente', 'fator_sazonal', 'estoque_minimo', 'prazo_seguranca']
+    COLUNAS_CHAVE = ['codigo', 'categoria', 'tipo_produto']
+
+    def __init__(self, regras=None):
+        colunas = self.COLUNAS_CHAVE + self.COLUNAS_FATORES
+        self.regras = pd.DataFrame(columns=colunas) if regras is None else self._normalizar(regras)
+
+    @staticmethod
+    def _nome_coluna(nome):
+        nome = unicodedata.normalize('NFKD', str(nome).strip().lower())
+        nome = ''.join(c for c in nome if not unicodedata.combining(c))
+        return nome.replace(' ', '_')
+
+    def _normalizar(self, regras):
+        regras = regras.rename(columns=self._nome_coluna).rename(columns={'tipo': 'tipo_produto', 'sku': 'codigo'})
+        regras = regras.reindex(columns=self.COLUNAS_CHAVE + self.COLUNAS_FATORES)
+
+        for coluna in self.COLUNAS_CHAVE:
+            valores = regras[coluna].astype('string').str.strip()
+            regras[coluna] = valores.where(valores != '', None)
+        regras['codigo'] = regras['codigo'].str.extract(r'(\d+)')[0]
+        regras['tipo_produto'] = regras['tipo_produto'].str.lower()
+
+        for coluna in self.COLUNAS_FATORES:
+            regras[coluna] = pd.to_numeric(
+                regras[coluna].astype(str).str.replace(',', '.', regex=False),
+                errors='coerce'
+            )
+
+        return regras.dropna(subset=self.COLUNAS_CHAVE, how='all').reset_index(drop=True)
+
+    def carregar(self, arquivo):
+        """Lê a tabela de fatores de uma planilha (Excel ou CSV)"""
+        try:
+            nome = getattr(arquivo, 'name', str(arquivo)).lower()
+            df = pd.read_csv(arquivo, sep=None, engine='python') if nome.endswith('.csv') else pd.read_excel(arquivo)
+            self.regras = self._normalizar(df)
+            logger.info(f"Tabela de fatores carregada com {len(self.regras)} regras")
+            return self.regras
+
+        except Exception as e:
+            logger.error(f"Erro ao carregar tabela de fatores: {str(e)}")
+            return None
+
+    def impressao(self):
+        """Hash do conteúdo das regras (tabelas iguais têm a mesma impressão)"""
+        hashes = pd.util.hash_pandas_object(self.regras, index=False).to_numpy()
+        sha = hashlib.sha256(hashes.tobytes())
+        sha.update('\x00'.join(self.regras.columns).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _regras_nivel(self, nivel):
+        """Regras de um nível, indexadas pela chave (a última definição prevalece)"""
+        regras = self.regras
+        if nivel == 'codigo':
+            regras = regras[regras['codigo'].notna()]
+        elif nivel == 'categoria':
+            regras = regras[regras['codigo'].isna() & regras['categoria'].notna()]
+        else:
+            regras = regras[regras['codigo'].isna() & regras['categoria'].isna()]
+        return regras.drop_duplicates(subset=nivel, keep='last').set_index(nivel)
+
+    def resolver(self, codigos, tipo_padrao, fatores_padrao):
+        """Fatores de cada SKU, com o tipo, a categoria e a fonte da regra aplicada
+
+        fatores_padrao: dicionário {tipo: {fator: valor}} usado quando nenhuma regra
+        da tabela define o fator (tipos desconhecidos usam 'medicamentos').
+        Retorna um DataFrame alinhado a `codigos`.
+        """
+        codigos = pd.Index(codigos).astype(str)
+
+        sku = self._regras_nivel('codigo').reindex(codigos)
+        tipo = sku['tipo_produto'].fillna(tipo_padrao).to_numpy(dtype=object)
+        categoria = sku['categoria'].to_numpy(dtype=object)
+
+        por_categoria = self._regras_nivel('categoria').reindex(categoria)[self.COLUNAS_FATORES]
+        por_tipo = self._regras_nivel('tipo_produto').reindex(tipo)[self.COLUNAS_FATORES]
+        padrao = pd.DataFrame.from_dict(fatores_padrao, orient='index')[self.COLUNAS_FATORES]
+        padrao = padrao.reindex(tipo).fillna(padrao.loc['medicamentos'])
+
+        niveis = [sku[self.COLUNAS_FATORES], por_categoria, por_tipo, padrao]
+        fatores = pd.DataFrame(index=codigos)
+        for coluna in self.COLUNAS_FATORES:
+            valores = niveis[0][coluna].to_numpy(dtype=float)
+            for nivel in niveis[1:]:
+                valores = np.where(np.isnan(valores), nivel[coluna].to_numpy(dtype=float), valores)
+            fatores[coluna] = valores
+
+        # Fonte: nível mais específico que definiu ao menos um fator
+        rotulo_tipo = pd.Series(tipo, dtype=str)
+        fatores['Fonte Fator'] = np.select(
+            [
+                sku[self.COLUNAS_FATORES].notna().any(axis=1).to_numpy(),
+                por_categoria.notna().any(axis=1).to_numpy(),
+                por_tipo.notna().any(axis=1).to_numpy()
+            ],
+            [
+                'SKU',
+                ('Categoria: ' + pd.Series(categoria, dtype=str)).to_numpy(),
+                ('Tipo: ' + rotulo_tipo).to_numpy()
+            ],
+            default=('Padrão: ' + rotulo_tipo).to_numpy()
+        )
+        fatores['tipo_produto'] = tipo
+        fatores['categoria'] = categoria
+        return fatores
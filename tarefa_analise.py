@@ -0,0 +1,183 @@
+import io
+import logging
+import threading
+import time
+
+from estoque_analyzer import EstoqueAnalyzer, AnaliseCancelada, ETAPAS_ANALISE
+
+logger = logging.getLogger(__name__)
+
+class TarefaAnalise:
+    """Executa uma análise de estoque em segundo plano, com progresso e cancelamento"""
+
+    def __init__(self, estoque_file, saidas_file, config_manual=None, tipo_produto='medicamentos',
+                 media_pacientes=None, periodo_previsao=90, analyzer=None, cache=None, chave_cache=None,
+                 conciliar=False, simular_risco=False, lotes_file=None, fatores_file=None,
+                 validar_previsao=False, classificar_abc=False, memoria_maxima_mb=None,
+                 arquivo=None, estabelecimento=''):
+        # Copiar o conteúdo dos uploads: os objetos do Streamlit pertencem à execução do script
+        self.estoque_file = self._copiar_arquivo(estoque_file)
+        self.saidas_file = self._copiar_arquivo(saidas_file)
+        self.lotes_file = self._copiar_arquivo(lotes_file)
+        self.fatores_file = self._copiar_arquivo(fatores_file)
+        self.parametros = {
+            'config_manual': config_manual,
+            'tipo_produto': tipo_produto,
+            'media_pacientes': media_pacientes,
+            'periodo_previsao': periodo_previsao,
+            'conciliar': conciliar,
+            'simular_risco': simular_risco,
+            'validar_previsao': validar_previsao,
+            'classificar_abc': classificar_abc,
+            'memoria_maxima_mb': memoria_maxima_mb
+        }
+        self.analyzer = analyzer if analyzer is not None else EstoqueAnalyzer()
+        # Cache compartilhado onde o resultado é publicado ao terminar
+        self.cache = cache
+        self.chave_cache = chave_cache
+        # Histórico (ArquivoResultados) onde cada resultado calculado é acrescentado
+        self.arquivo = arquivo
+        self.estabelecimento = estabelecimento
+
+        self.cancelamento = threading.Event()
+        self.trava = threading.Lock()
+        self.status = 'aguardando'
+        self.etapa = None
+        self.fracao_etapa = 0.0
+        self.resultado = None
+        # Partes já calculadas, dos produtos mais urgentes aos menos urgentes
+        self.partes = []
+        self.erro = None
+        self.inicio = None
+        self.fim = None
+        self._thread = threading.Thread(target=self._executar, name='tarefa-analise', daemon=True)
+
+    def _copiar_arquivo(self, arquivo):
+        """Retorna uma cópia em memória de um arquivo enviado (caminhos são mantidos)"""
+        if hasattr(arquivo, 'getvalue'):
+            copia = io.BytesIO(arquivo.getvalue())
+            # O nome identifica o formato (CSV ou Excel) na leitura em blocos
+            copia.name = getattr(arquivo, 'name', None)
+            return copia
+        return arquivo
+
+    @property
+    def em_andamento(self):
+        return self.status in ('aguardando', 'executando')
+
+    def iniciar(self):
+        """Inicia a execução em segundo plano"""
+        self.inicio = time.time()
+        self._thread.start()
+        return self
+
+    def cancelar(self):
+        """Solicita o cancelamento; a análise para na próxima verificação"""
+        self.cancelamento.set()
+
+    def aguardar(self, timeout=None):
+        """Aguarda o término da tarefa"""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def progresso(self):
+        """Retorna a etapa atual e a fração concluída da análise (0 a 1)"""
+        with self.trava:
+            if self.status == 'concluida':
+                return self.etapa, 1.0
+            if self.etapa is None:
+                return None, 0.0
+            indice = ETAPAS_ANALISE.index(self.etapa)
+            return self.etapa, (indice + self.fracao_etapa) / len(ETAPAS_ANALISE)
+
+    def resultado_parcial(self):
+        """Une as partes já calculadas (None antes da primeira)"""
+        with self.trava:
+            partes = list(self.partes)
+        return self.analyzer.juntar_partes(partes) if partes else None
+
+    def _atualizar_progresso(self, etapa, fracao):
+        with self.trava:
+            self.etapa = etapa
+            self.fracao_etapa = fracao
+
+    def _analisar_em_partes(self):
+        """Consome a análise progressiva publicando cada parte em self.partes"""
+        try:
+            for parte in self.analyzer.analisar_estoque_progressivo(
+                self.estoque_file,
+                self.saidas_file,
+                self.parametros['config_manual'],
+                self.parametros['tipo_produto'],
+                self.parametros['media_pacientes'],
+                self.parametros['periodo_previsao'],
+                progresso=self._atualizar_progresso,
+                cancelamento=self.cancelamento,
+                conciliar=self.parametros['conciliar'],
+                simular_risco=self.parametros['simular_risco'],
+                lotes_file=self.lotes_file,
+                tabela_fatores=self.fatores_file,
+                validar_previsao=self.parametros['validar_previsao'],
+                classificar_abc=self.parametros['classificar_abc'],
+                memoria_maxima_mb=self.parametros['memoria_maxima_mb']
+            ):
+                with self.trava:
+                    self.partes.append(parte)
+        except AnaliseCancelada:
+            raise
+        except Exception as e:
+            # Como em analisar_estoque: falhas de leitura resultam em análise sem resultado
+            logger.error(f"Erro na análise: {str(e)}")
+            # Não manter partes de uma análise que terminou em erro
+            with self.trava:
+                self.partes = []
+            return []
+        return self.partes
+
+    def _arquivar(self, resultado):
+        """Acrescenta o resultado ao histórico (uma falha não invalida a análise)"""
+        try:
+            self.arquivo.gravar(resultado, self.estabelecimento, chave=self.chave_cache)
+        except Exception as e:
+            logger.warning(f"Não foi possível arquivar o resultado: {str(e)}")
+
+    def _executar(self):
+        with self.trava:
+            self.status = 'executando'
+
+        try:
+            partes = self._analisar_em_partes()
+            resultado = self.analyzer.juntar_partes(partes) if partes else None
+            if resultado is not None and self.cache is not None:
+                self.cache.armazenar(self.chave_cache, resultado)
+                # Saídas mensais para os gráficos de tendência (podem sair do cache antes do resultado)
+                if self.analyzer.saidas_mensais is not None:
+                    self.cache.armazenar(self.chave_cache + ':saidas', self.analyzer.saidas_mensais)
+                # Regras de fatores usadas, para que a simulação de cenários aplique as mesmas
+                tabela_fatores = self.analyzer.analise_avancada.tabela_fatores
+                if tabela_fatores is not None:
+                    self.cache.armazenar(self.chave_cache + ':fatores', tabela_fatores.regras)
+            if resultado is not None and self.arquivo is not None:
+                self._arquivar(resultado)
+            
+            with self.trava:
+                self.resultado = resultado
+                self.status = 'concluida' if resultado is not None else 'erro'
+                if resultado is None:
+                    self.erro = "Erro ao processar os arquivos. Verifique se as colunas estão corretas ou ajuste manualmente."
+
+        except AnaliseCancelada:
+            logger.info("Análise cancelada pelo usuário")
+            with self.trava:
+                self.partes = []
+                self.status = 'cancelada'
+
+        except Exception as e:
+            logger.error(f"Erro na análise em segundo plano: {str(e)}")
+            with self.trava:
+                self.partes = []
+                self.erro = str(e)
+                self.status = 'erro'
+
+        finally:
+            self.fim = time.time()
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Colunas das planilhas geradas (sem cabeçalho): código, descrição, unidade, quantidade
+CONFIG_MANUAL = {
+    'linha_inicio_estoque': 0,
+    'linha_inicio_saidas': 0,
+    'mapeamento_estoque': {'codigo': 0, 'descricao': 1, 'unidade': 2, 'quantidade': 3},
+    'mapeamento_saidas': {'codigo': 0, 'descricao': 1, 'unidade': 2, 'saida': 3}
+}
+
+@pytest.fixture(scope='session')
+def planilhas(tmp_path_factory):
+    """Planilhas de estoque, saídas (8 meses) e lotes de um catálogo pequeno
+
+    Inclui produtos só no estoque, só nas saídas e um código sem dígitos.
+    """
+    pasta = tmp_path_factory.mktemp('planilhas')
+    rng = np.random.default_rng(42)
+    n, meses = 150, 8
+
+    codigos = [str(c) for c in range(1000, 1000 + n)] + ['SEM']
+    descricoes = [f'PRODUTO NUMERO {c}' for c in codigos]
+    estoque = pd.DataFrame({
+        'codigo': codigos + ['9001', '9002'],
+        'descricao': descricoes + ['SO ESTOQUE 1', 'SO ESTOQUE 2'],
+        'unidade': rng.choice(['UN', 'AMP', 'COM'], n + 3),
+        'quantidade': rng.integers(0, 500, n + 3)
+    })
+    saidas = pd.DataFrame({
+        'codigo': np.repeat(codigos + ['9100'], meses),
+        'descricao': np.repeat(descricoes + ['SO SAIDAS'], meses),
+        'unidade': 'UN',
+        'saida': rng.integers(0, 300, (n + 2) * meses)
+    })
+    lotes = pd.DataFrame({
+        'Código': np.repeat(codigos[:40], 2),
+        'Lote': [f'L{i}' for i in range(80)],
+        'Validade': pd.Timestamp.now().normalize() + pd.to_timedelta(rng.integers(10, 400, 80), unit='D'),
+        'Quantidade': rng.integers(1, 200, 80)
+    })
+
+    caminhos = {nome: str(pasta / f'{nome}.xlsx') for nome in ('estoque', 'saidas', 'lotes')}
+    estoque.to_excel(caminhos['estoque'], header=False, index=False)
+    saidas.to_excel(caminhos['saidas'], header=False, index=False)
+    lotes.to_excel(caminhos['lotes'], index=False)
+    return caminhos
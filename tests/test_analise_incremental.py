@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from analise_incremental import AnaliseIncremental
+from conftest import CONFIG_MANUAL
+from estoque_analyzer import EstoqueAnalyzer
+
+def test_hashes_proximos_e_codigos_novos_sao_alterados():
+    incremental = AnaliseIncremental(EstoqueAnalyzer())
+    base = np.uint64(2**63 + 12345)
+    # Hashes que só diferem no último bit são iguais em float64
+    incremental.hashes_estoque = pd.Series(np.array([base, base], dtype=np.uint64), index=['A', 'B'])
+    incremental.hashes_saidas = pd.Series(np.array([base, base], dtype=np.uint64), index=['A', 'B'])
+    estoque = pd.Series(np.array([base + np.uint64(1), base, base], dtype=np.uint64), index=['A', 'B', 'C'])
+    saidas = pd.Series(np.array([base, base, base], dtype=np.uint64), index=['A', 'B', 'C'])
+
+    assert incremental.detectar_alterados(estoque, saidas, {'A', 'B', 'C'}) == ['A', 'C']
+
+def test_so_o_produto_editado_e_recalculado(planilhas, tmp_path):
+    incremental = AnaliseIncremental(EstoqueAnalyzer())
+    resultado, relatorio = incremental.atualizar(planilhas['estoque'], planilhas['saidas'], CONFIG_MANUAL)
+    assert relatorio['completa']
+
+    estoque = pd.read_excel(planilhas['estoque'], header=None)
+    estoque.loc[estoque[0].astype(str) == '1005', 3] += 1000
+    editado = str(tmp_path / 'estoque.xlsx')
+    estoque.to_excel(editado, header=False, index=False)
+
+    novo, relatorio = incremental.atualizar(editado, planilhas['saidas'], CONFIG_MANUAL)
+    assert not relatorio['completa']
+    assert relatorio['alterados'] == ['1005']
+    assert relatorio['removidos'] == []
+
+    # As demais linhas são as da análise anterior; a editada é igual à de uma análise completa
+    completo = EstoqueAnalyzer().analisar_estoque(editado, planilhas['saidas'], CONFIG_MANUAL)
+    pd.testing.assert_frame_equal(novo.reset_index(drop=True), completo.reset_index(drop=True))
+    anterior = resultado.set_index('Código').drop('1005')
+    pd.testing.assert_frame_equal(novo.set_index('Código').drop('1005').loc[anterior.index], anterior)
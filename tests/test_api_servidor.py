@@ -0,0 +1,56 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from api_servidor import ServidorAnalise
+
+@pytest.fixture
+def servidor(request, tmp_path):
+    pasta_permitida = str(tmp_path) if getattr(request, 'param', False) else None
+    servidor = ServidorAnalise(('127.0.0.1', 0), max_trabalhadores=1, pasta_permitida=pasta_permitida,
+                               pasta_cache_modelos=None, max_corpo_mb=1)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+def enviar(servidor, corpo=b'', cabecalhos=None):
+    conexao = http.client.HTTPConnection(*servidor.server_address, timeout=10)
+    conexao.putrequest('POST', '/analisar')
+    for nome, valor in (cabecalhos or {'Content-Length': str(len(corpo))}).items():
+        conexao.putheader(nome, valor)
+    conexao.endheaders()
+    if corpo:
+        conexao.send(corpo)
+    resposta = conexao.getresponse()
+    dados = json.loads(resposta.read())
+    conexao.close()
+    return resposta, dados
+
+def test_corpo_maior_que_o_limite(servidor):
+    # Só os cabeçalhos são enviados: o servidor recusa sem ler o corpo
+    resposta, dados = enviar(servidor, cabecalhos={'Content-Length': str(2 * 1024 * 1024)})
+    assert resposta.status == 413
+    assert resposta.getheader('Connection') == 'close'
+    assert 'limite' in dados['erro']
+
+@pytest.mark.parametrize('tamanho', ['-1', 'abc', '1e3'])
+def test_content_length_invalido(servidor, tamanho):
+    resposta, _ = enviar(servidor, cabecalhos={'Content-Length': tamanho})
+    assert resposta.status == 400
+
+def test_caminho_sem_pasta_permitida(servidor):
+    corpo = json.dumps({'estoque': '/etc/passwd', 'saidas': '/etc/passwd'}).encode('utf-8')
+    resposta, dados = enviar(servidor, corpo)
+    assert resposta.status == 403
+    assert '--pasta-permitida' in dados['erro']
+
+@pytest.mark.parametrize('servidor', [True], indirect=True)
+def test_caminho_fora_da_pasta_permitida(servidor):
+    corpo = json.dumps({'estoque': '/etc/passwd', 'saidas': '/etc/passwd'}).encode('utf-8')
+    resposta, dados = enviar(servidor, corpo)
+    assert resposta.status == 400
+    assert 'fora da pasta permitida' in dados['erro']
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from arquivo_resultados import ArquivoResultados
+
+def montar_resultado(prazos, codigos=('1002', '1000', '1001')):
+    return pd.DataFrame({
+        'Código': list(codigos),
+        'Descrição': [f'PRODUTO {c}' for c in codigos],
+        'Prazo Estoque (dias)': np.asarray(prazos, dtype=float),
+        'Demanda Esperada': np.full(len(codigos), 30.0)
+    })
+
+def test_gravar_acrescenta_execucoes(tmp_path):
+    arquivo = ArquivoResultados(str(tmp_path))
+    arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS A', execucao='2026-01-01')
+    arquivo.gravar(montar_resultado([4, 5, 6]), 'UBS B', execucao='2026-02-01')
+    arquivo.gravar(montar_resultado([7, 8, 9]), 'UBS A', execucao='2026-03-01')
+
+    indice = arquivo.execucoes()
+    assert list(indice['Execução']) == list(pd.to_datetime(['2026-01-01', '2026-02-01', '2026-03-01']))
+    assert list(indice['Estabelecimento']) == ['UBS A', 'UBS B', 'UBS A']
+    assert (indice['Produtos'] == 3).all()
+    assert len(arquivo.execucoes('UBS A', ultimas=1)) == 1
+    assert arquivo.estatisticas()['estabelecimentos'] == 2
+
+def test_mesma_chave_nao_grava_de_novo(tmp_path):
+    arquivo = ArquivoResultados(str(tmp_path))
+    primeira = arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS A', execucao='2026-01-01', chave='abc')
+    repetida = arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS A', execucao='2026-01-02', chave='abc')
+    arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS B', execucao='2026-01-02', chave='abc')
+
+    assert repetida == primeira
+    assert list(arquivo.execucoes()['Estabelecimento']) == ['UBS A', 'UBS B']
+    assert len([n for n in os.listdir(tmp_path) if n.startswith(ArquivoResultados.PREFIXO)]) == 2
+
+def test_indice_refeito_apos_gravacao_externa(tmp_path):
+    arquivo = ArquivoResultados(str(tmp_path))
+    arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS A', execucao='2026-01-01')
+    assert len(arquivo.execucoes()) == 1
+
+    # Outro processo acrescenta uma execução na mesma pasta
+    ArquivoResultados(str(tmp_path)).gravar(montar_resultado([4, 5, 6]), 'UBS B', execucao='2026-02-01')
+    assert list(arquivo.execucoes()['Estabelecimento']) == ['UBS A', 'UBS B']
+
+    # Sem o índice, ele é reconstruído a partir dos metadados dos arquivos
+    os.remove(tmp_path / ArquivoResultados.INDICE)
+    indice = ArquivoResultados(str(tmp_path)).execucoes()
+    assert list(indice['Estabelecimento']) == ['UBS A', 'UBS B']
+    assert list(indice['Produtos']) == [3, 3]
+
+def test_consultar_colunas_e_codigos(tmp_path):
+    arquivo = ArquivoResultados(str(tmp_path))
+    arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS A', execucao='2026-01-01')
+    arquivo.gravar(montar_resultado([4, 5, 6]), 'UBS A', execucao='2026-02-01')
+
+    linhas = arquivo.consultar(['Prazo Estoque (dias)', 'Inexistente'], codigos=['1001', '9999'])
+    assert list(linhas.columns) == ['Execução', 'Estabelecimento', 'Código', 'Prazo Estoque (dias)', 'Inexistente']
+    assert list(linhas['Código']) == ['1001', '1001']
+    assert list(linhas['Prazo Estoque (dias)']) == [3.0, 6.0]
+    assert linhas['Inexistente'].isna().all()
+
+    assert list(arquivo.consultar(codigos='1000', ultimas=1)['Prazo Estoque (dias)']) == [5.0]
+    assert arquivo.consultar(codigos=['9999']).empty
+
+def test_historico_por_estabelecimento(tmp_path):
+    arquivo = ArquivoResultados(str(tmp_path))
+    arquivo.gravar(montar_resultado([1, 2, 3]), 'UBS A', execucao='2026-01-01')
+    arquivo.gravar(montar_resultado([4, 5, 6]), 'UBS B', execucao='2026-01-01')
+    arquivo.gravar(montar_resultado([7, 8, 9]), 'UBS A', execucao='2026-02-01')
+
+    historico = arquivo.historico('1002', ultimas=2)
+    assert list(historico.columns) == ['UBS A', 'UBS B']
+    assert historico.loc[pd.Timestamp('2026-01-01')].tolist() == [1.0, 4.0]
+    assert historico.loc[pd.Timestamp('2026-02-01'), 'UBS A'] == 7.0
+    assert np.isnan(historico.loc[pd.Timestamp('2026-02-01'), 'UBS B'])
+
+def test_retencao_por_estabelecimento(tmp_path):
+    arquivo = ArquivoResultados(str(tmp_path), max_execucoes=2, max_idade_dias=30)
+    hoje = pd.Timestamp.now().normalize()
+    arquivo.gravar(montar_resultado([0, 0, 0]), 'UBS A', execucao=hoje - pd.Timedelta(days=60))
+    for dias in (3, 2, 1):
+        arquivo.gravar(montar_resultado([dias] * 3), 'UBS A', execucao=hoje - pd.Timedelta(days=dias))
+    arquivo.gravar(montar_resultado([9, 9, 9]), 'UBS B', execucao=hoje)
+
+    indice = arquivo.execucoes()
+    assert list(indice['Execução'][indice['Estabelecimento'] == 'UBS A']) == [hoje - pd.Timedelta(days=2), hoje - pd.Timedelta(days=1)]
+    assert (indice['Estabelecimento'] == 'UBS B').sum() == 1
+    # Os arquivos das execuções descartadas também são removidos
+    assert len([n for n in os.listdir(tmp_path) if n.startswith(ArquivoResultados.PREFIXO)]) == 3
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from backtest_previsao import ValidacaoPrevisao
+from conftest import CONFIG_MANUAL
+from estoque_analyzer import EstoqueAnalyzer
+
+class ValidacaoContada(ValidacaoPrevisao):
+    """Conta quantas vezes a matriz de saídas é montada"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.montagens = 0
+
+    def montar_series(self, df_saidas):
+        self.montagens += 1
+        return super().montar_series(df_saidas)
+
+def test_progressiva_monta_as_series_uma_vez(planilhas):
+    validacao = ValidacaoContada(metodos=['media_historica', 'demanda_esperada'], n_processos=1)
+    analyzer = EstoqueAnalyzer()
+    partes = list(analyzer.analisar_estoque_progressivo(
+        planilhas['estoque'], planilhas['saidas'], CONFIG_MANUAL, media_pacientes=1000,
+        validar_previsao=validacao, tamanho_parte=32
+    ))
+
+    assert len(partes) > 1
+    assert validacao.montagens == 1
+    assert set(analyzer.validacao_previsao['por_sku']['Código']) == set(analyzer.juntar_partes(partes)['Código'])
+
+def test_series_montadas_dao_o_mesmo_relatorio():
+    df_saidas = pd.DataFrame({
+        'codigo': ['2', '1', '2', '1', '2', '1', '2', '1', '3'],
+        'saida': [5, 10, 7, 12, 6, 11, 8, 13, 4]
+    })
+    validacao = ValidacaoPrevisao(metodos=['media_historica'], n_processos=1)
+    series = validacao.montar_series(df_saidas)
+    assert list(series[0]) == ['1', '2', '3']
+
+    direto = validacao.executar(df_saidas, codigos=['2'])
+    reaproveitado = validacao.executar(df_saidas, codigos=['2'], series=series)
+    pd.testing.assert_frame_equal(direto['dobras'], reaproveitado['dobras'])
+    assert set(reaproveitado['dobras']['Código']) == {'2'}
@@ -0,0 +1,66 @@
+import os
+import time
+
+import numpy as np
+
+from cache_modelos import CacheModelos
+from estoque_analyzer import EstoqueAnalyzer
+
+CONFIGURACAO = {'modelo': 'holt', 'sazonalidade': 12}
+
+def test_impressao_muda_com_historico_e_configuracao(tmp_path):
+    cache = CacheModelos(str(tmp_path))
+    historico = np.array([10.0, 12.0, 9.0, 11.0])
+    cache.armazenar(cache.gerar_impressao(historico, CONFIGURACAO), {'previsao': 11.5})
+
+    # Mesma série (mesmo com outro tipo) e mesma configuração: acerto
+    assert cache.obter(cache.gerar_impressao(historico.astype(int), dict(CONFIGURACAO))) == {'previsao': 11.5}
+    # Um mês a mais, um valor alterado ou outra configuração: falha
+    assert cache.obter(cache.gerar_impressao(np.append(historico, 8.0), CONFIGURACAO)) is None
+    assert cache.obter(cache.gerar_impressao([10.0, 12.0, 9.0, 11.5], CONFIGURACAO)) is None
+    assert cache.obter(cache.gerar_impressao(historico, {**CONFIGURACAO, 'sazonalidade': 6})) is None
+    assert (cache.acertos, cache.falhas) == (1, 3)
+
+def test_gravacao_atomica(tmp_path):
+    cache = CacheModelos(str(tmp_path))
+    impressao = cache.gerar_impressao([1.0, 2.0], CONFIGURACAO)
+    cache.armazenar(impressao, {'previsao': 1.0})
+
+    # Entrada que não pode ser serializada: só um aviso, sem temporário nem entrada parcial
+    cache.armazenar(impressao, {'previsao': lambda: None})
+    assert sorted(os.listdir(tmp_path)) == [impressao + CacheModelos.EXTENSAO]
+    assert cache.obter(impressao) == {'previsao': 1.0}
+
+    # Arquivo corrompido é descartado e conta como falha
+    with open(os.path.join(tmp_path, impressao + CacheModelos.EXTENSAO), 'wb') as arquivo:
+        arquivo.write(b'incompleto')
+    assert cache.obter(impressao) is None
+    assert os.listdir(tmp_path) == []
+
+def test_remove_entradas_antigas_e_excedentes(tmp_path):
+    cache = CacheModelos(str(tmp_path), max_idade_dias=30)
+    impressoes = [cache.gerar_impressao([float(i)], CONFIGURACAO) for i in range(4)]
+    agora = time.time()
+    for i, impressao in enumerate(impressoes):
+        cache.armazenar(impressao, {'dados': np.zeros(1000)})
+        # Uso mais recente para as últimas entradas; a primeira tem 40 dias
+        usado = agora - 40 * 86400 if i == 0 else agora - (10 - i) * 60
+        os.utime(os.path.join(tmp_path, impressao + CacheModelos.EXTENSAO), (usado, usado))
+    tamanho = os.path.getsize(os.path.join(tmp_path, impressoes[1] + CacheModelos.EXTENSAO))
+
+    # Três entradas recentes passam do limite; a limpeza deixa 90% dele (duas entradas).
+    # A antiga sai por idade e a menos usada por tamanho
+    cache.max_bytes = int(2.5 * tamanho)
+    cache.remover_excedentes()
+    restantes = sorted(os.path.splitext(n)[0] for n in os.listdir(tmp_path))
+    assert restantes == sorted(impressoes[2:])
+    assert cache.bytes_usados == 2 * tamanho
+
+    # Passar do limite numa gravação dispara a limpeza
+    cache.armazenar(cache.gerar_impressao([9.0], CONFIGURACAO), {'dados': np.zeros(1000)})
+    assert cache.bytes_usados <= cache.max_bytes
+
+def test_analyzer_sem_cache_por_padrao(tmp_path):
+    assert EstoqueAnalyzer().analise_avancada.cache_modelos is None
+    analyzer = EstoqueAnalyzer(pasta_cache_modelos=str(tmp_path / 'modelos'))
+    assert analyzer.analise_avancada.cache_modelos.pasta == str(tmp_path / 'modelos')
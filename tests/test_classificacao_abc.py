@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from classificacao_abc import ClassificacaoABCXYZ
+
+def montar_saidas():
+    """Saídas mensais com totais 50, 30, 15, 4, 1 e 0 (soma 100)"""
+    series = {
+        '1': [25, 25],        # CV 0: X
+        '2': [0, 10, 20],     # CV 1: Y (no limite)
+        '3': [0, 0, 15],      # CV 1,73: Z
+        '4': [4],             # um só mês: Z
+        '5': [0.5, 0.5],
+        '6': [0, 0]           # sem saídas: Z
+    }
+    return pd.DataFrame(
+        [(codigo, saida) for codigo, valores in series.items() for saida in valores],
+        columns=['codigo', 'saida']
+    )
+
+def test_limites_abc_e_xyz():
+    classes = ClassificacaoABCXYZ().classificar(montar_saidas(), ['1', '2', '3', '4', '5', '6', '7'])
+
+    # Participação acumulada antes de cada SKU: 0, 50, 80, 95, 99 e 100%
+    assert classes['Classe ABC'].tolist() == ['A', 'A', 'B', 'C', 'C', 'C', 'C']
+    assert classes['Classe XYZ'].tolist() == ['X', 'Y', 'Z', 'Z', 'X', 'Z', 'Z']
+    assert classes.loc['2', 'Classe ABC/XYZ'] == 'AY'
+    assert classes['Participação Acumulada (%)'].tolist() == [50.0, 80.0, 95.0, 99.0, 100.0, 100.0, 100.0]
+
+def test_abc_por_valor_com_precos():
+    classificacao = ClassificacaoABCXYZ(precos={'5': 1000.0, '1': 1.0, '2': 1.0, '3': 1.0, '4': 1.0})
+    classes = classificacao.classificar(montar_saidas(), ['1', '2', '3', '4', '5'])
+    assert classes['Classe ABC'].tolist() == ['B', 'C', 'C', 'C', 'A']
+
+def test_politicas_preservam_regras_por_sku():
+    classificacao = ClassificacaoABCXYZ(politicas={
+        'A': {'prazo_seguranca': 10},
+        'Z': {'prazo_seguranca': 30},
+        'CZ': {'estoque_minimo': 0.4, 'metodo_previsao': 'random_forest'}
+    })
+    classes = classificacao.classificar(montar_saidas(), ['1', '2', '3', '4', '5', '6']).loc[['1', '3', '4', '6']]
+    fatores = pd.DataFrame({
+        'prazo_seguranca': [5.0, 5.0, 5.0, 5.0],
+        'estoque_minimo': [0.2, 0.2, 0.2, 0.2],
+        'Fonte Fator': ['Tipo', 'Tipo', 'Padrão', 'SKU']
+    }, index=classes.index)
+
+    ajustados, metodo = classificacao.aplicar_politicas(fatores, classes)
+
+    # '1' (AX) recebe a de A; '3' (BZ) a de Z; '4' (CZ) a de Z e a combinada; '6' tem regra própria
+    assert ajustados['prazo_seguranca'].tolist() == [10.0, 30.0, 30.0, 5.0]
+    assert ajustados['estoque_minimo'].tolist() == [0.2, 0.2, 0.4, 0.2]
+    assert ajustados['Fonte Fator'].tolist() == ['Classe: A', 'Classe: Z', 'Classe: CZ', 'SKU']
+    assert metodo.tolist() == ['media_historica', 'media_historica', 'random_forest', 'media_historica']
+    assert fatores['Fonte Fator'].tolist() == ['Tipo', 'Tipo', 'Padrão', 'SKU']
+
+def test_metodo_de_previsao_invalido():
+    with pytest.raises(ValueError, match='prophet'):
+        ClassificacaoABCXYZ(politicas={'X': {'metodo_previsao': 'prophet'}})
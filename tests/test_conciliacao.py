@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from conciliacao import ConciliadorProdutos
+
+def produtos(*linhas):
+    return pd.DataFrame(linhas, columns=['codigo', 'descricao', 'unidade'])
+
+def test_normalizar():
+    assert ConciliadorProdutos.normalizar('  Dipirona Sódica, 500mg/ml ') == 'DIPIRONA SODICA 500MG ML'
+
+def test_score_de_dice_sobre_trigramas():
+    # ' ABC ' e ' ABD ' têm 3 trigramas cada e só ' AB' em comum: 2 × 1 / (3 + 3)
+    pares = ConciliadorProdutos(limiar=0.0).conciliar(produtos(('E1', 'ABC', 'UN')), produtos(('S1', 'ABD', 'UN')))
+    assert pares['Score'].tolist() == [pytest.approx(0.3333)]
+
+    # Acentos, caixa e pontuação não contam
+    iguais = ConciliadorProdutos().conciliar(produtos(('E1', 'Dipirona Sódica 500mg', 'UN')), produtos(('S1', 'DIPIRONA SODICA 500MG.', 'UN')))
+    assert iguais[['Código Estoque', 'Código Saídas', 'Score']].values.tolist() == [['E1', 'S1', 1.0]]
+
+def test_atribuicao_um_para_um():
+    estoque = produtos(
+        ('E1', 'PARACETAMOL 500MG COMPRIMIDO', 'COM'),
+        ('E2', 'PARACETAMOL 500MG COMPRIMID', 'COM')
+    )
+    saidas = produtos(
+        ('S1', 'PARACETAMOL 500MG COMPRIMIDO', 'COM'),
+        ('S2', 'PARACETAMOL 500MG COMPRIMIDOS', 'COM')
+    )
+    pares = ConciliadorProdutos(limiar=0.8).conciliar(estoque, saidas)
+
+    # E1 fica com o par exato; E2 recebe o melhor par ainda livre, e não S1 de novo
+    assert pares[['Código Estoque', 'Código Saídas']].values.tolist() == [['E1', 'S1'], ['E2', 'S2']]
+    assert pares['Score'].iloc[0] == 1.0
+    assert pares['Score'].is_monotonic_decreasing
+
+def test_limiar_e_bloqueio_por_unidade():
+    estoque = produtos(('E1', 'SORO FISIOLOGICO 500ML', 'FR'), ('E2', 'LUVA DE PROCEDIMENTO', 'CX'))
+    saidas = produtos(('S1', 'SORO FISIOLOGICO 500ML', 'UN'), ('S2', 'SERINGA 10ML', 'UN'))
+
+    # Unidades diferentes não são comparadas; sem o bloqueio, só o par acima do limiar é aceito
+    assert ConciliadorProdutos().conciliar(estoque, saidas).empty
+    pares = ConciliadorProdutos(bloquear_unidade=False).conciliar(estoque, saidas)
+    assert pares[['Código Estoque', 'Código Saídas', 'Unidade']].values.tolist() == [['E1', 'S1', 'FR']]
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from consolidacao_rede import ConsolidacaoRede
+
+def montar_resultado(estoque, demanda, ideal):
+    """Resultado de uma unidade com um único produto"""
+    return pd.DataFrame({
+        'Código': ['1000'],
+        'Descrição': ['PRODUTO'],
+        'Situação': ['Comprar' if estoque < demanda else 'OK'],
+        'Quantidade em estoque': [float(estoque)],
+        'Demanda Esperada': [float(demanda)],
+        'Quantidade Sugerida Compra': [max(demanda - estoque, 0.0)],
+        'Estoque Restante Estimado': [float(estoque - demanda)],
+        'Estoque Ideal Futuro': [float(ideal)]
+    })
+
+def test_sobra_abaixo_do_minimo_nao_consome_excedente():
+    rede = ConsolidacaoRede()
+    rede.atualizar('A', montar_resultado(0, 10.5, 10.5))   # falta 10,5
+    rede.atualizar('B', montar_resultado(0, 3, 3))         # falta 3
+    rede.atualizar('C', montar_resultado(13, 3, 3))        # excedente 10
+    rede.atualizar('D', montar_resultado(5, 2, 2))         # excedente 3
+
+    transferencias = rede.candidatos_transferencia(quantidade_minima=1.0)
+    pares = {(t.Origem, t.Destino): t.Quantidade for t in transferencias.itertuples()}
+
+    # Os 0,5 restantes de A ficam abaixo do mínimo e não tiram nada de D, que atende B por inteiro
+    assert pares == {('C', 'A'): 10.0, ('D', 'B'): 3.0}
+    assert (transferencias['Descrição'] == 'PRODUTO').all()
+
+def test_totais_e_remocao_de_unidade():
+    rede = ConsolidacaoRede()
+    rede.atualizar('A', montar_resultado(0, 10, 10))
+    rede.atualizar('C', montar_resultado(13, 3, 3))
+    totais = rede.totais_produtos().set_index('Código')
+    assert totais.loc['1000', ['Falta', 'Excedente']].tolist() == [10.0, 10.0]
+    assert totais.loc['1000', 'Estabelecimentos em Falta'] == 1
+
+    rede.remover('C')
+    assert rede.candidatos_transferencia().empty
+    assert rede.estabelecimentos == ['A']
@@ -0,0 +1,133 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from analise_avancada import AnaliseAvancada
+from cenarios import CuboCenarios
+from classificacao_abc import ClassificacaoABCXYZ, POLITICAS_SUGERIDAS
+from conftest import CONFIG_MANUAL, RAIZ
+from estoque_analyzer import EstoqueAnalyzer
+from risco_ruptura import SimuladorRuptura
+from tabela_fatores import TabelaFatores
+
+def analisar(planilhas, **opcoes):
+    analyzer = EstoqueAnalyzer(pasta_cache_modelos=None)
+    resultado = analyzer.analisar_estoque(
+        planilhas['estoque'], planilhas['saidas'], CONFIG_MANUAL, media_pacientes=1000, **opcoes
+    )
+    assert resultado is not None
+    return resultado
+
+def ordenar(resultado):
+    return resultado.sort_values('Código', kind='stable').reset_index(drop=True)
+
+def test_planilhas_de_exemplo():
+    estoque = glob.glob(os.path.join(RAIZ, 'estoque_exemplo_*.xlsx'))
+    saidas = glob.glob(os.path.join(RAIZ, 'saidas_exemplo_*.xlsx'))
+    if not estoque or not saidas:
+        pytest.skip("planilhas de exemplo ausentes")
+
+    resultado = EstoqueAnalyzer(pasta_cache_modelos=None).analisar_estoque(estoque[0], saidas[0])
+
+    assert resultado is not None
+    assert len(resultado) == 8
+
+@pytest.mark.parametrize('opcoes', [
+    {},
+    # Blocos de 20 SKUs, para que a simulação também seja dividida em partes
+    {'simular_risco': SimuladorRuptura(n_caminhos=2000, max_bytes_bloco=20 * 2000 * 12, n_processos=1)},
+    {'usar_lotes': True},
+    {'classificar_abc': True},
+    {'validar_previsao': True},
+], ids=['basica', 'risco', 'lotes', 'abc', 'backtest'])
+def test_progressiva_igual_a_analise_completa(planilhas, opcoes):
+    opcoes = dict(opcoes)
+    if opcoes.pop('usar_lotes', False):
+        opcoes['lotes_file'] = planilhas['lotes']
+    completo = analisar(planilhas, **opcoes)
+
+    analyzer = EstoqueAnalyzer(pasta_cache_modelos=None)
+    partes = list(analyzer.analisar_estoque_progressivo(
+        planilhas['estoque'], planilhas['saidas'], CONFIG_MANUAL, media_pacientes=1000,
+        tamanho_parte=32, **opcoes
+    ))
+
+    assert len(partes) > 1
+    # Os mais urgentes chegam primeiro
+    assert partes[0]['Estoque Restante Estimado'].max() <= partes[-1]['Estoque Restante Estimado'].min()
+    pd.testing.assert_frame_equal(analyzer.juntar_partes(partes), completo)
+
+@pytest.mark.parametrize('usar_lotes', [False, True], ids=['basica', 'lotes'])
+def test_fora_da_memoria_igual_em_memoria(planilhas, usar_lotes):
+    opcoes = {'lotes_file': planilhas['lotes']} if usar_lotes else {}
+    em_memoria = analisar(planilhas, **opcoes)
+    # Limite pequeno para dividir o catálogo em várias partições
+    particionado = analisar(planilhas, memoria_maxima_mb=0.05, **opcoes)
+
+    pd.testing.assert_frame_equal(ordenar(particionado), ordenar(em_memoria), check_dtype=False)
+
+def test_falha_ao_ler_lotes_interrompe_a_analise(planilhas, tmp_path):
+    invalido = tmp_path / 'lotes.xlsx'
+    invalido.write_text('não é uma planilha')
+
+    for memoria in (None, 64):
+        resultado = EstoqueAnalyzer(pasta_cache_modelos=None).analisar_estoque(
+            planilhas['estoque'], planilhas['saidas'], CONFIG_MANUAL, media_pacientes=1000,
+            lotes_file=str(invalido), memoria_maxima_mb=memoria
+        )
+        assert resultado is None
+
+def test_cenario_da_analise_igual_ao_resultado(planilhas):
+    regras = pd.DataFrame({
+        'codigo': ['1003', '1010', None, None],
+        'categoria': [None, 'SORO', 'SORO', None],
+        'tipo_produto': [None, 'insumos', None, 'medicamentos'],
+        'fator_paciente': [1.0, None, 0.7, None],
+        'fator_sazonal': [None, None, None, 1.3],
+        'estoque_minimo': [None, None, 0.25, None],
+        'prazo_seguranca': [5, None, None, None]
+    })
+    classificacao = ClassificacaoABCXYZ(politicas=POLITICAS_SUGERIDAS)
+    resultado = analisar(planilhas, tabela_fatores=TabelaFatores(regras), classificar_abc=classificacao)
+
+    # Como no app: a tabela de fatores é reconstruída a partir das regras guardadas no cache
+    analise = AnaliseAvancada()
+    analise.configurar_tipo_produto(None, tabela_fatores=TabelaFatores(TabelaFatores(regras).regras))
+    cubo = CuboCenarios(
+        resultado, [None, 1000], [30, 90], ['insumos', 'medicamentos'], analise,
+        dtype=float, classificacao=classificacao
+    )
+    cenario = cubo.fatiar_cenario(1000, 90, 'medicamentos')
+
+    colunas = ['Demanda Esperada', 'Estoque Restante Estimado', 'Prazo Estoque (dias)',
+               'Quantidade Sugerida Compra', 'Estoque Ideal Futuro', 'Situação']
+    pd.testing.assert_frame_equal(
+        cenario[colunas].reset_index(drop=True), resultado[colunas].reset_index(drop=True)
+    )
+
+def test_fora_da_memoria_com_quantidades_fracionarias_apos_o_primeiro_bloco(tmp_path):
+    # O primeiro bloco (1000 linhas) só tem inteiros; os seguintes têm frações
+    n = 1500
+    codigos = [str(c) for c in range(10000, 10000 + n)]
+    estoque = pd.DataFrame({
+        'codigo': codigos,
+        'descricao': [f'PRODUTO {c}' for c in codigos],
+        'unidade': 'UN',
+        'quantidade': [float(i % 50) if i < 1000 else i % 50 + 0.5 for i in range(n)]
+    })
+    saidas = pd.DataFrame({
+        'codigo': codigos * 2,
+        'descricao': [f'PRODUTO {c}' for c in codigos] * 2,
+        'unidade': 'UN',
+        'saida': [i % 30 if i < 1000 else i % 30 + 0.25 for i in range(2 * n)]
+    })
+    planilhas = {'estoque': str(tmp_path / 'estoque.xlsx'), 'saidas': str(tmp_path / 'saidas.xlsx')}
+    estoque.to_excel(planilhas['estoque'], header=False, index=False)
+    saidas.to_excel(planilhas['saidas'], header=False, index=False)
+
+    em_memoria = analisar(planilhas)
+    particionado = analisar(planilhas, memoria_maxima_mb=0.05)
+
+    pd.testing.assert_frame_equal(ordenar(particionado), ordenar(em_memoria), check_dtype=False)
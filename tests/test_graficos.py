@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from graficos import amostrar_dispersao, binar_prazo, eixo_log1p, grafico_tendencia, lttb
+
+def test_binar_prazo():
+    prazo = [0, 5, 9.99, 10, 400, np.inf, -3]
+    situacao = ['Comprar', 'Comprar', 'OK', 'OK', 'OK', 'OK', 'Comprar']
+    contagem, sem_demanda = binar_prazo(prazo, situacao, limite=30, n_faixas=3)
+
+    # Faixas [0, 10), [10, 20), [20, 30]: acima do limite vai para a última e negativo para a primeira
+    assert contagem.index.tolist() == [5.0, 15.0, 25.0]
+    assert contagem['Comprar'].tolist() == [3, 0, 0]
+    assert contagem['OK'].tolist() == [1, 1, 1]
+    assert sem_demanda == 1
+
+def test_amostrar_dispersao():
+    rng = np.random.default_rng(0)
+    x, y = rng.lognormal(3, 2, 20000), rng.lognormal(3, 2, 20000)
+    prioridade = rng.random(20000)
+    prioridade[123] = 10.0
+
+    indices, representados = amostrar_dispersao(x, y, prioridade, max_pontos=1000, n_celulas=50)
+    assert len(indices) <= 1000
+    assert len(np.unique(indices)) == len(indices)
+    assert 123 in indices
+    assert representados.sum() <= len(x)
+
+    # Sem limite atingido, todos os pontos ficam, cada um representando a si mesmo
+    indices, representados = amostrar_dispersao(x[:500], y[:500], prioridade[:500])
+    assert indices.tolist() == list(range(500)) and (representados == 1).all()
+
+def test_lttb_preserva_extremos():
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+    y[437] = 25.0
+    y[801] = -25.0
+
+    rx, ry = lttb(x, y, 50)
+    assert len(rx) == 50
+    assert (rx[0], rx[-1]) == (0, 999)
+    assert np.all(np.diff(rx) > 0)
+    assert {437, 801} <= set(rx.astype(int))
+    assert ry.max() == 25.0 and ry.min() == -25.0
+
+    # Séries curtas (ou n_pontos < 3) não são reduzidas
+    assert len(lttb(x[:10], y[:10], 50)[0]) == 10
+
+def test_eixo_log1p():
+    posicoes, rotulos = eixo_log1p(250)
+    assert rotulos == ['0', '1', '10', '100', '1,000']
+    assert np.allclose(np.expm1(posicoes), [0, 1, 10, 100, 1000])
+
+def test_grafico_tendencia_reduz_as_series():
+    meses = pd.period_range('2000-01', periods=600, freq='M').astype(str)
+    saidas = pd.DataFrame(np.arange(3 * 600, dtype=float).reshape(3, 600), index=['1', '2', '3'], columns=meses)
+
+    figura = grafico_tendencia(saidas, codigos=['2', '9'], max_pontos=100)
+    # p90, p10, mediana e o SKU '2' (o '9' não existe)
+    assert [t.name for t in figura.data][-1] == '2'
+    assert len(figura.data) == 4
+    assert all(len(t.x) == 100 for t in figura.data)
+    assert figura.data[-1].x[0] == '2000-01' and figura.data[-1].x[-1] == '2049-12'
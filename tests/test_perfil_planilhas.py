@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import Workbook
+
+from perfil_planilhas import PerfiladorPlanilhas
+
+def gravar_relatorio(caminho, n=30):
+    """Relatório de ERP: título, data, linha vazia, cabeçalho, dados e rodapé"""
+    livro = Workbook()
+    aba = livro.active
+    aba.title = 'Estoque'
+    aba.append(['RELATÓRIO DE POSIÇÃO DE ESTOQUE'])
+    aba.append(['Emitido em 01/03/2024'])
+    aba.append([])
+    aba.append(['Código', 'Descrição do Produto', 'Unid', 'Saldo'])
+    for i in range(n):
+        aba.append([1000 + i, f'PRODUTO DE TESTE NUMERO {i}', ['UN', 'AMP', 'FR'][i % 3], (i * 7) % 50 + 0.5])
+    aba.append(['Total de itens:', n])
+    livro.create_sheet('Resumo')
+    livro.save(caminho)
+
+def test_linha_de_inicio_e_cabecalho():
+    amostra = pd.DataFrame([
+        ['RELATÓRIO', None, None],
+        [None, None, None],
+        ['Código', 'Produto', 'Qtd'],
+        ['10', 'DIPIRONA', '5'],
+        ['11', 'SORO', '7,5'],
+        ['12', 'LUVA', '1'],
+        ['Total', None, '13,5']
+    ], dtype=object)
+    linha, confianca, cabecalho = PerfiladorPlanilhas().detectar_linha_inicio(amostra)
+
+    assert (linha, cabecalho) == (3, 2)
+    # Quatro linhas a partir do início, três com o padrão dos dados
+    assert confianca == 0.75
+
+def test_amostra_sem_dados():
+    assert PerfiladorPlanilhas().detectar_linha_inicio(pd.DataFrame([['TITULO'], [None]], dtype=object)) == (0, 0.0, None)
+
+def test_perfil_de_xlsx(tmp_path):
+    caminho = str(tmp_path / 'estoque.xlsx')
+    gravar_relatorio(caminho)
+    perfil = PerfiladorPlanilhas().perfilar(caminho)
+
+    assert perfil['abas'] == ['Estoque', 'Resumo']
+    assert (perfil['total_linhas'], perfil['total_colunas']) == (35, 4)
+    assert (perfil['linha_inicio'], perfil['linha_cabecalho']) == (4, 3)
+    assert perfil['mapeamento_sugerido'] == {'codigo': 0, 'descricao': 1, 'unidade': 2, 'quantidade': 3}
+    assert perfil['colunas'][0]['exemplo'] == '1000'
+    assert 'Mapeamento sugerido: 0,codigo;1,descricao;2,unidade;3,quantidade' in PerfiladorPlanilhas().formatar(perfil)
+
+def test_datas_iso_ficam_como_texto(tmp_path):
+    caminho = str(tmp_path / 'saidas.xlsx')
+    livro = Workbook()
+    # Datas gravadas como t="d" (texto ISO) em vez de número serial
+    livro.iso_dates = True
+    livro.active.append(['Código', 'Data', 'Quantidade'])
+    livro.active.append([10, datetime(2024, 3, 1), 5])
+    livro.save(caminho)
+
+    amostra = PerfiladorPlanilhas()._amostra_xlsx(caminho)['amostra']
+    assert amostra.iloc[1].tolist() == [10.0, '2024-03-01T00:00:00', 5.0]
+
+def test_papeis_sem_cabecalho():
+    amostra = pd.DataFrame({
+        0: [f'{100 + i} - MEDICAMENTO {i}' for i in range(20)],
+        1: ['COM'] * 20,
+        2: [str(i * 3) for i in range(20)]
+    }, dtype=object)
+    colunas = PerfiladorPlanilhas().inferir_papeis(amostra, 0)
+
+    # Código e descrição juntos ficam com o papel 'codigo'
+    assert [c['papel'] for c in colunas] == ['codigo', 'unidade', 'quantidade']
+    assert all(c['cabecalho'] is None for c in colunas)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from planejamento_compras import PlanejadorCompras
+
+def montar_resultado(n=6):
+    return pd.DataFrame({
+        'Código': [str(1000 + i) for i in range(n)],
+        'Descrição': [f'PRODUTO {i}' for i in range(n)],
+        'Tipo Produto': ['medicamentos', 'insumos'] * (n // 2),
+        'Quantidade em estoque': np.zeros(n),
+        'Demanda Esperada': np.full(n, 30.0),
+        'Período Previsão (dias)': np.full(n, 30)
+    })
+
+@pytest.mark.parametrize('metodo', ['guloso', 'lp'])
+def test_plano_respeita_orcamento_e_ignora_precos_invalidos(metodo):
+    resultado = montar_resultado()
+    precos = {'1000': -10.0, '1001': 0.0, '1002': 3.0, '1003': 7.0, '1004': 2.5}
+    orcamento = 100.0
+
+    plano = PlanejadorCompras().planejar(resultado, precos, orcamento, metodo=metodo)
+    resumo = PlanejadorCompras().resumir(plano, orcamento)
+
+    assert plano['Custo Planejado'].sum() <= orcamento
+    # Preço ausente, zero ou negativo: nada é comprado e o produto conta como sem preço
+    sem_preco = plano[plano['Código'].isin(['1000', '1001', '1005'])]
+    assert (sem_preco['Quantidade Planejada'] == 0).all()
+    assert sem_preco['Preço Unitário'].isna().all()
+    assert resumo['produtos_sem_preco'] == 3
+
+def test_guloso_prioriza_por_peso_e_preco():
+    resultado = montar_resultado(4)
+    precos = {'1000': 1.0, '1001': 1.0, '1002': 1.5, '1003': 2.0}
+
+    # Eficiência (peso / custo de um dia): 1000 = 2, 1002 = 1,33, 1001 = 1, 1003 = 0,5
+    plano = PlanejadorCompras().planejar(resultado, precos, 39.0, pesos_tipo={'medicamentos': 2.0})
+    quantidade = plano.set_index('Código')['Quantidade Planejada']
+
+    assert quantidade['1000'] == 30
+    # O saldo de 9,00 compra 6 unidades do produto do corte
+    assert quantidade['1002'] == 6
+    assert quantidade['1001'] == 0 and quantidade['1003'] == 0
+
+def test_guloso_igual_a_alocacao_sequencial():
+    planejador = PlanejadorCompras()
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        n = int(rng.integers(1, 400))
+        dados = {
+            'necessidade': rng.integers(0, 20, n).astype(float),
+            'preco': rng.uniform(-5, 50, n),
+            'eficiencia': rng.uniform(0, 1, n)
+        }
+        orcamento = float(rng.uniform(0, 4000))
+
+        esperado, saldo = np.zeros(n), orcamento
+        for i in np.argsort(-dados['eficiencia'], kind='stable'):
+            if dados['necessidade'][i] > 0 and dados['preco'][i] > 0:
+                esperado[i] = min(dados['necessidade'][i], np.floor(saldo / dados['preco'][i]))
+                saldo -= esperado[i] * dados['preco'][i]
+
+        quantidade = planejador._alocar_guloso(dados, orcamento)
+        np.testing.assert_array_equal(quantidade, esperado)
+        assert (quantidade * np.maximum(dados['preco'], 0)).sum() <= orcamento
+
+def test_carregar_precos_descarta_nao_positivos(tmp_path):
+    caminho = tmp_path / 'precos.csv'
+    caminho.write_text('codigo;preco\n1000;2,50\n1001;0\n1002;-3\n1003;abc\n', encoding='utf-8')
+
+    precos = PlanejadorCompras().carregar_precos(str(caminho))
+
+    assert precos.to_dict() == {'1000': 2.5}
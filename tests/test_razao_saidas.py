@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from razao_saidas import AgregadorRazao
+
+def test_mapear_colunas_pelo_cabecalho():
+    agregador = AgregadorRazao()
+    cabecalho = ['Unidade de Saúde', 'Cód. Produto', 'Descrição', 'Unid.', 'Qtd Dispensada', 'Data Dispensação']
+    assert agregador.mapear_colunas(cabecalho) == {
+        'codigo': 1, 'descricao': 2, 'unidade': 3, 'data': 5, 'quantidade': 4
+    }
+
+    # Sem coluna de unidade do produto, a do estabelecimento não é usada no lugar
+    mapeamento = agregador.mapear_colunas(['Código', 'Unidade de Saúde', 'Dt Emissão', 'Saída'])
+    assert mapeamento == {'codigo': 0, 'data': 2, 'quantidade': 3}
+
+    with pytest.raises(ValueError, match='data'):
+        agregador.mapear_colunas(['Código', 'Produto', 'Quantidade'])
+
+def test_datas_em_formatos_misturados():
+    bloco = pd.DataFrame({
+        'codigo': ['MED-10', '10', '10', '20', '20', '20'],
+        'data': ['2024-02-03', '15/01/2024', '05/02/2024 10:30', '2024-03-01 08:00', 'ontem', None],
+        'quantidade': ['1', '2,5', '3', '4', '5', '6']
+    })
+    agregador = AgregadorRazao()
+    linhas = agregador.normalizar(bloco)
+
+    meses = [f"{m // 12}-{m % 12 + 1:02d}" for m in linhas['mes']]
+    assert meses == ['2024-02', '2024-01', '2024-02', '2024-03']
+    assert linhas['codigo'].tolist() == ['10', '10', '10', '20']
+    assert linhas['quantidade'].tolist() == [1.0, 2.5, 3.0, 4.0]
+    assert agregador.linhas_descartadas == 2
+
+def test_agregar_csv_em_blocos(tmp_path):
+    caminho = tmp_path / 'razao.csv'
+    pd.DataFrame({
+        'Unidade de Saúde': ['UBS A'] * 5,
+        'Código': ['10', '20', '10', '10', '20'],
+        'Produto': ['DIPIRONA', 'SORO', 'DIPIRONA', 'DIPIRONA', 'SORO'],
+        'Unidade': ['AMP', 'FR', 'AMP', 'AMP', 'FR'],
+        'Data': ['10/01/2024', '11/01/2024', '20/01/2024', '05/03/2024', '06/03/2024'],
+        'Quantidade': ['2', '1', '3', '4', '5']
+    }).to_csv(caminho, sep=';', index=False)
+
+    saidas = AgregadorRazao(tamanho_bloco=2).agregar(str(caminho)).finalizar()
+
+    # Fevereiro entra com saída zero para as duas
+    tabela = saidas.pivot(index='codigo', columns='mes', values='saida')
+    assert list(tabela.columns) == ['2024-01', '2024-02', '2024-03']
+    assert tabela.loc['10'].tolist() == [5.0, 0.0, 4.0]
+    assert tabela.loc['20'].tolist() == [1.0, 0.0, 5.0]
+    assert saidas.drop_duplicates('codigo')['unidade'].tolist() == ['AMP', 'FR']